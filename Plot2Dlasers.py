@@ -8,20 +8,17 @@ from matplotlib.widgets import Button, TextBox
 import pyllt as llt
 import sys
 import signal
+from profile_ring import ProfileRing
+from processing_worker import ProcessingWorker
 
 def profile_callback(data, size, user_data):
-    global profile_buffer, profile_buffer1, received, received1
     if user_data == 1:
-        ct.memmove(profile_buffer, data, size)
-        received = True
+        profile_ring.push(data, size)
     if user_data == 2:
-        ct.memmove(profile_buffer1, data, size)
-        received1 = True
+        profile_ring1.push(data, size)
 
-    if received and received1:
+    if profile_ring.available() and profile_ring1.available():
         event.set()
-        received1 = False
-        received = False
 
 def update_exposure_time_and_frequency(event):
     global exposure_time, idle_time, hLLT, hLLT1
@@ -45,8 +42,9 @@ def update_exposure_time_and_frequency(event):
 
 # Initialize
 run = 0
-received = False
-received1 = False
+ring_slots = 256  # Profiles buffered per sensor before the callback reports an overrun
+processing_queue_size = 64  # Converted frames kept for the plot before the oldest is dropped
+plot_interval = 40  # Display refresh period (ms), independent of the profile rate
 
 # Parametrize partial profile that only the moment 0 column is transmitted
 start_data = 4
@@ -138,13 +136,13 @@ if ret < 1:
     raise ValueError("Error setting resolution : " + str(ret))
 
 # Declare measuring data arrays
-profile_buffer = (ct.c_ubyte * (resolution * data_width))()
+profile_ring = ProfileRing(resolution * data_width, ring_slots)
 x = np.empty(resolution, dtype=float)
 z = np.empty(resolution, dtype=float)
 x_p = x.ctypes.data_as(ct.POINTER(ct.c_double))
 z_p = z.ctypes.data_as(ct.POINTER(ct.c_double))
 
-profile_buffer1 = (ct.c_ubyte * (resolution1 * data_width))()
+profile_ring1 = ProfileRing(resolution1 * data_width, ring_slots)
 x1 = np.empty(resolution1, dtype=float)
 z1 = np.empty(resolution1, dtype=float)
 x_p1 = x1.ctypes.data_as(ct.POINTER(ct.c_double))
@@ -257,6 +255,8 @@ update_button = Button(update_button_ax, 'Update Settings')
 update_button.on_clicked(update_exposure_time_and_frequency)
 
 def update(data):
+    if data is None:
+        return line1, line2
     ux, uz, ux1, uz1 = data
     line1.set_data(ux, uz)
     line2.set_data(ux1, uz1)
@@ -268,22 +268,41 @@ def update(data):
 
 def data_gen():
     while measurement_active:
-        event.wait()
+        if not event.wait(0.1):
+            # Nothing arrived; the worker gets a chance to see a stop request
+            yield None
+            continue
+        event.clear()
 
-        fret = llt.convert_part_profile_2_values(hLLT, profile_buffer, ct.byref(partial_profile_struct), scanner_type, 0, 1,
-                                                 null_ptr_short, null_ptr_short, null_ptr_short, x_p, z_p, null_ptr_int, null_ptr_int)
-        if fret & llt.CONVERT_X == 0 or fret & llt.CONVERT_Z == 0:
-            raise ValueError("Error converting data: " + str(fret))
+        while profile_ring.available() and profile_ring1.available():
+            fret = llt.convert_part_profile_2_values(hLLT, profile_ring.pointer(), ct.byref(partial_profile_struct), scanner_type, 0, 1,
+                                                     null_ptr_short, null_ptr_short, null_ptr_short, x_p, z_p, null_ptr_int, null_ptr_int)
+            profile_ring.release()
+            if fret & llt.CONVERT_X == 0 or fret & llt.CONVERT_Z == 0:
+                raise ValueError("Error converting data: " + str(fret))
 
-        fret = llt.convert_part_profile_2_values(hLLT1, profile_buffer1, ct.byref(partial_profile_struct1), scanner_type1, 0, 1,
-                                                 null_ptr_short, null_ptr_short, null_ptr_short, x_p1, z_p1, null_ptr_int, null_ptr_int)
-        if fret & llt.CONVERT_X == 0 or fret & llt.CONVERT_Z == 0:
-            raise ValueError("Error converting data: " + str(fret))
+            fret = llt.convert_part_profile_2_values(hLLT1, profile_ring1.pointer(), ct.byref(partial_profile_struct1), scanner_type1, 0, 1,
+                                                     null_ptr_short, null_ptr_short, null_ptr_short, x_p1, z_p1, null_ptr_int, null_ptr_int)
+            profile_ring1.release()
+            if fret & llt.CONVERT_X == 0 or fret & llt.CONVERT_Z == 0:
+                raise ValueError("Error converting data: " + str(fret))
 
-        event.clear()
-        yield x, z, x1, z1
+            # x/z are reused for the next profile while the plot may still be drawing this one
+            yield x.copy(), z.copy(), x1.copy(), z1.copy()
+
+def latest_frame():
+    while True:
+        try:
+            yield processing_worker.latest(timeout=plot_interval / 1000)
+        except RuntimeError as e:
+            # Conversion is gone, a frozen plot would hide that
+            print(f"\n{e}")
+            plt.close(fig)
+            return
 
-ani = animation.FuncAnimation(fig, update, frames=data_gen, interval=40, blit=True, cache_frame_data=False)
+processing_worker = ProcessingWorker(data_gen, maxlen=processing_queue_size)
+
+ani = animation.FuncAnimation(fig, update, frames=latest_frame, interval=plot_interval, blit=True, cache_frame_data=False)
 
 print("---Press Enter to start measurement and CTRL-C to stop measurement!---")
 var = input("")
@@ -297,12 +316,19 @@ if var == "":
     print("Measurement of both sensors started!")
     measurement_active = True
     measurement_stopped = False
+    # Conversion runs at sensor rate on its own thread, the plot only samples the newest frame
+    processing_worker.start()
 else:
     print("Please press Enter to start the measurement! Start the program again!")
     sys.exit(0)
 
 plt.show()
 
+measurement_active = False
+processing_worker.stop()
+print(f"Ring overruns: Sensor 1 {profile_ring.overruns}, Sensor 2 {profile_ring1.overruns}")
+print(f"Processing queue: {processing_worker.stats()}")
+
 # Stop the data capture
 ret = llt.transfer_profiles(hLLT, llt.TTransferProfileType.NORMAL_TRANSFER, 0)
 if ret < 1:
@@ -0,0 +1,291 @@
+"""Load test of the dual-sensor acquisition path on the simulated pyllt backend.
+
+Runs two simulated heads at increasing profile frequencies through the same
+stages as corecode.py (callback -> ProfileRing -> ProfilePairer ->
+ProfileDecoder -> FilterChain -> FilterTransformKernel -> PointStore) and
+reports, per frequency, how many
+profiles were processed and how many were lost on the way. The highest
+frequency without any loss is the sustainable rate of this machine.
+With --container N the heads deliver N profiles per callback; callbacks
+per second and CPU time per profile show what that saves. With
+--acquisition polling a thread fetches the profiles with
+get_actual_profile() instead of the callback. The latency from the
+shutter to the processed pair is reported for both. The filter stages are
+off, as in corecode.py; --filters switches them on:
+
+    python benchmarks/bench_acquisition.py --seconds 3 --frequencies 500 1000 2000 4000 8000
+    python benchmarks/bench_acquisition.py --seconds 3 --frequencies 1000 2000 --container 16
+    python benchmarks/bench_acquisition.py --seconds 3 --frequencies 1000 2000 --acquisition polling
+    python benchmarks/bench_acquisition.py --seconds 3 --frequencies 1000 2000 --filters zscore median
+"""
+import argparse
+import ctypes as ct
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "sim"))
+import pyllt as llt
+from profile_ring import ProfileRing
+from profile_pairing import ProfilePairer
+from profile_decoder import ProfileDecoder, TimestampDecoder
+from filter_chain import FilterChain
+from point_store import PointStore
+from profile_processing import FilterTransformKernel, TrigTable
+from motor_position import COUNTS_PER_REVOLUTION
+from telemetry import LatencyHistogram
+
+START_DATA = 4
+DATA_WIDTH = 4
+CIRCLE_RADIUS = 25
+ROTATION_SECONDS = 2.0  # Simulated motor: one turn of the part every two seconds
+
+
+def open_sensor(interface, callback, user_data, container=0, polling=False):
+    device = llt.create_llt_device(llt.TInterfaceType.INTF_TYPE_ETHERNET)
+    llt.set_device_interface(device, interface, 0)
+    ret = llt.connect(device)
+    if ret < 1:
+        raise ConnectionError("Error connect: " + str(ret))
+    resolutions = (ct.c_uint * 4)()
+    llt.get_resolutions(device, resolutions, len(resolutions))
+    llt.set_resolution(device, resolutions[0])
+    scanner_type = ct.c_int(0)
+    llt.get_llt_type(device, ct.byref(scanner_type))
+    llt.set_profile_config(device, llt.TProfileConfig.PARTIAL_PROFILE)
+    partial_profile_struct = llt.TPartialProfile(0, START_DATA, resolutions[0], DATA_WIDTH)
+    llt.set_partial_profile(device, ct.byref(partial_profile_struct))
+    if container:
+        llt.set_feature(device, llt.FEATURE_FUNCTION_PROFILE_REARRANGEMENT, 0)
+        llt.set_profile_container_size(device, resolutions[0] * DATA_WIDTH, container)
+    if polling:
+        llt.set_buffer_count(device, 64)
+        llt.set_hold_buffers_for_polling(device, 1)
+    else:
+        llt.register_callback(device, llt.TCallbackType.C_DECL, callback, user_data)
+    return device, resolutions[0], scanner_type
+
+
+def run_pipeline(frequency, seconds, ring_slots=256, warmup=0.2, container=0, acquisition="callback", poll_interval=0.0005,
+                 filters=()):
+    """Run both simulated sensors for `seconds` at `frequency` and return the loss counters.
+
+    The heads are started one after the other, so whatever is lost during
+    the first `warmup` seconds is not counted.
+    """
+    llt.configure_simulation(frequency=frequency)
+    event = threading.Event()
+    rings = []
+
+    def profile_callback(data, size, user_data):
+        rings[user_data - 1].push(data, size)
+        event.set()
+
+    callback = llt.buffer_cb_func(profile_callback)
+    polling = acquisition == "polling"
+    devices = [open_sensor(interface, callback, sensor + 1, container, polling)
+               for sensor, interface in enumerate(llt.INTERFACES)]
+    for _, resolution, _ in devices:
+        rings.append(ProfileRing(resolution * DATA_WIDTH, max(ring_slots, 4 * container)))
+    decoders = [ProfileDecoder.from_library(llt, device, scanner_type, resolution)
+                for device, resolution, scanner_type in devices]
+    timestamp_decoder = TimestampDecoder.from_library(llt)
+    filter_chain = FilterChain([{"stage": stage} for stage in filters])
+    kernel = FilterTransformKernel(devices[0][1], CIRCLE_RADIUS, TrigTable(COUNTS_PER_REVOLUTION))
+    # Sized for a whole rotation, as corecode.py's stores are after the first one
+    stores = [PointStore(int(frequency * ROTATION_SECONDS) * devices[0][1]) for _ in range(2)]
+    # A partner can be a whole container later
+    pairer = ProfilePairer(max_age=0.05 + container / frequency, max_pending=max(32, 2 * container))
+    transfer_type = llt.TTransferProfileType.NORMAL_CONTAINER_MODE if container else llt.TTransferProfileType.NORMAL_TRANSFER
+
+    processed = [0]
+    polls = [0]  # Rounds in which the polling thread fetched profiles of a sensor, the polling counterpart of callbacks
+    stop = threading.Event()
+    # Shutter of every buffered top profile, for the latency from the shutter to the processed pair
+    top_shutter = np.zeros(rings[0].slots)
+    latency = [LatencyHistogram()]
+
+    def poll():
+        lost = ct.c_uint(0)
+        while not stop.is_set():
+            fetched = 0
+            for (device, _, _), ring in zip(devices, rings):
+                count = 0
+                pointer = ring.reserve()
+                while pointer is not None:
+                    ret = llt.get_actual_profile(device, pointer, ring.slot_size, llt.TProfileConfig.PARTIAL_PROFILE,
+                                                 ct.byref(lost))
+                    if ret < 1:
+                        break
+                    ring.commit(ret)
+                    count += 1
+                    pointer = ring.reserve()
+                if count:
+                    polls[0] += 1
+                    fetched += count
+            if fetched:
+                event.set()
+            else:
+                time.sleep(poll_interval)
+
+    def pair_new_profiles(next_seq):
+        # Like corecode.py: one profile of each sensor in turn until both are drained
+        pairs = []
+        end_seq = [ring.write_seq for ring in rings]
+        timestamps = []
+        for sensor, ring in enumerate(rings):
+            seqs = np.arange(next_seq[sensor], end_seq[sensor])
+            shutter_times, counters = timestamp_decoder.decode(ring.data[seqs % ring.slots, -16:])
+            if sensor == 0:
+                top_shutter[seqs % ring.slots] = shutter_times
+            timestamps.append(list(zip(seqs.tolist(), shutter_times.tolist(), counters.tolist())))
+        for k in range(max(len(t) for t in timestamps)):
+            for sensor in (0, 1):
+                if k < len(timestamps[sensor]):
+                    pair = pairer.add(sensor, *timestamps[sensor][k])
+                    if pair is not None:
+                        pairs.append(pair)
+        next_seq[:] = end_seq
+        return pairs
+
+    def consume():
+        next_seq = [0, 0]
+        last_angle = 0.0
+        while not stop.is_set():
+            if not event.wait(0.1):
+                continue
+            event.clear()
+            pairs = pair_new_profiles(next_seq)
+            if pairs:
+                seqs = np.array(pairs)
+                angles = top_shutter[seqs[:, 0] % rings[0].slots] * (360 / ROTATION_SECONDS) % 360
+                blocks = []
+                for sensor, ring in enumerate(rings):
+                    blocks.extend(decoders[sensor].decode(ring.data[seqs[:, sensor] % ring.slots]))
+                    ring.release(seqs[-1, sensor])
+                if filter_chain:
+                    filter_chain.apply(blocks[0], blocks[1])
+                    filter_chain.apply(blocks[2], blocks[3])
+                x_out, z_out, valid = kernel.process(*blocks, angles)
+                for k, angle in enumerate(angles.tolist()):
+                    if angle < last_angle:
+                        for store in stores:
+                            store.clear()  # A new rotation
+                    last_angle = angle
+                    for sensor, store in enumerate(stores):
+                        store.append(x_out[sensor, k][valid[sensor, k]], z_out[sensor, k][valid[sensor, k]], angle,
+                                     processed[0] + k, sensor)
+                processed[0] += len(pairs)
+                # The simulated shutter times count from pyllt's epoch and wrap like the sensors' clock
+                now = time.perf_counter() - llt._epoch
+                latency[0].record_many((now - top_shutter[seqs[:, 0] % rings[0].slots]) % llt.TIMESTAMP_WRAP)
+            for sensor, ring in enumerate(rings):
+                settled = pairer.settled(sensor)
+                if settled >= ring.read_seq:
+                    ring.release(settled)
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    poller = threading.Thread(target=poll, daemon=True) if polling else None
+    if poller is not None:
+        poller.start()
+    for device, _, _ in devices:
+        llt.transfer_profiles(device, transfer_type, 1)
+    time.sleep(warmup)
+
+    def counters():
+        pairing = pairer.stats()
+        simulation = [llt.simulation_stats(device) for device, _, _ in devices]
+        return {"sent": [stats["sent"] for stats in simulation],
+                "callbacks": [stats["callbacks"] for stats in simulation],
+                "polls": polls[0],
+                "cpu": time.process_time(),
+                "late": [stats["dropped"] for stats in simulation],
+                "overruns": [ring.overruns for ring in rings],
+                "unpaired": [pairing["dropped_top"], pairing["dropped_bottom"]],
+                "processed": processed[0]}
+
+    baseline = counters()
+    latency[0] = LatencyHistogram()
+    time.sleep(seconds)
+    for device, _, _ in devices:
+        llt.transfer_profiles(device, transfer_type, 0)
+    time.sleep(0.2)
+    stop.set()
+    consumer.join()
+    if poller is not None:
+        poller.join()  # Before the devices it polls are closed
+
+    result = counters()
+    for device, _, _ in devices:
+        llt.disconnect(device)
+        llt.del_device(device)
+    pairing = pairer.stats()
+    processed = result["processed"] - baseline["processed"]
+    sent = sum(result["sent"]) - sum(baseline["sent"])
+    quantiles = latency[0].quantiles()
+    return {"frequency": frequency,
+            "container": container,
+            "acquisition": acquisition,
+            "latency_ms": {str(q): 1e3 * value for q, value in quantiles.items()},
+            "callbacks_per_s": (sum(result["callbacks"]) - sum(baseline["callbacks"])) / seconds,
+            "polls_per_s": (result["polls"] - baseline["polls"]) / seconds,
+            # The simulated heads run in this process, so this includes generating the profiles
+            "cpu_us_per_profile": 1e6 * (result["cpu"] - baseline["cpu"]) / max(sent, 1),
+            "sent": [a - b for a, b in zip(result["sent"], baseline["sent"])],
+            "late": [a - b for a, b in zip(result["late"], baseline["late"])],
+            "overruns": [a - b for a, b in zip(result["overruns"], baseline["overruns"])],
+            "unpaired": [a - b for a, b in zip(result["unpaired"], baseline["unpaired"])],
+            "processed": processed,
+            "pairs_per_s": processed / seconds,
+            "mean_pairing_ms": pairing["mean_latency_ms"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--frequencies", type=float, nargs="+", default=[250, 500, 1000, 2000, 4000, 8000])
+    parser.add_argument("--jitter", type=float, default=20e-6)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--container", type=int, default=0, help="Profiles per callback; 0 for one per callback")
+    parser.add_argument("--acquisition", choices=("callback", "polling"), default="callback")
+    parser.add_argument("--filters", nargs="+", default=[], choices=("zscore", "median", "savgol", "gaussian"),
+                        help="Filter stages to switch on, in corecode.py's order")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    llt.configure_simulation(jitter=args.jitter, drop_rate=args.drop_rate)
+    results = []
+    sustainable = None
+    failed = False
+    for frequency in sorted(args.frequencies):
+        result = run_pipeline(frequency, args.seconds, container=args.container, acquisition=args.acquisition,
+                              filters=args.filters)
+        results.append(result)
+        if args.acquisition == "polling":
+            transfers = f"{result['polls_per_s']:.0f} polls/s"
+        else:
+            transfers = f"{result['callbacks_per_s']:.0f} callbacks/s"
+        # Simulated packet loss leaves unpaired profiles by design, only count it without it
+        lost = sum(result["late"]) + sum(result["overruns"]) + (sum(result["unpaired"]) if args.drop_rate == 0 else 0)
+        failed = failed or lost > 0
+        if not failed:
+            sustainable = frequency
+        print(f"{frequency:8.0f} Hz: {result['pairs_per_s']:8.0f} pairs/s, overruns {result['overruns']},"
+              f" unpaired {result['unpaired']}, late {result['late']}, pairing {result['mean_pairing_ms']:.2f} ms,"
+              f" {transfers}, {result['cpu_us_per_profile']:.0f} us CPU per profile,"
+              f" latency p50 {result['latency_ms']['0.5']:.2f} p99 {result['latency_ms']['0.99']:.2f}"
+              f" p99.9 {result['latency_ms']['0.999']:.2f} ms")
+    print(f"Highest frequency without loss: {sustainable} Hz" if sustainable else "Every frequency lost profiles")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
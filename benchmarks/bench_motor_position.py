@@ -0,0 +1,108 @@
+"""Per-profile motor position latency: polling get_value() against the subscription cache.
+
+Runs a local opcua.Server with the motor position node, rotating at a fixed
+speed, so no PLC is needed. Run from the repository root:
+
+    python benchmarks/bench_motor_position.py
+"""
+import os
+import sys
+import threading
+import time
+import numpy as np
+from opcua import Client, Server, ua
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from motor_position import MotorPositionService, COUNTS_PER_REVOLUTION
+
+ENDPOINT = "opc.tcp://127.0.0.1:48400"
+REVOLUTIONS_PER_SECOND = 0.5
+
+
+def start_test_server(endpoint=ENDPOINT, update_period=0.002):
+    """OPC UA stand-in for the PLC that publishes ns=6 ::Handling position counts of a turning motor."""
+    server = Server()
+    server.set_endpoint(endpoint)
+    namespace = 0
+    while namespace < 6:
+        namespace = server.register_namespace(f"urn:scrap-detection:test:{namespace}")
+    node_id = ua.NodeId("::Handling:instJS_MC_ReadActualPosition.Position", 6)
+    position = server.get_objects_node().add_variable(node_id, "Position", 0.0)
+    server.start()
+
+    stop = threading.Event()
+    start = time.perf_counter()
+
+    def rotate():
+        while not stop.is_set():
+            elapsed = time.perf_counter() - start
+            counts = (elapsed * REVOLUTIONS_PER_SECOND * COUNTS_PER_REVOLUTION) % COUNTS_PER_REVOLUTION
+            position.set_value(counts)
+            time.sleep(update_period)
+
+    thread = threading.Thread(target=rotate, daemon=True)
+    thread.start()
+
+    def shutdown():
+        stop.set()
+        thread.join()
+        server.stop()
+
+    return start, shutdown
+
+
+def expected_degrees(start, host_time):
+    return ((host_time - start) * REVOLUTIONS_PER_SECOND * 360) % 360
+
+
+def angle_error(a, b):
+    return np.abs((np.asarray(a) - np.asarray(b) + 180) % 360 - 180)
+
+
+def main(polls=500, lookups=100000):
+    start, shutdown = start_test_server()
+    client = Client(ENDPOINT)
+    client.connect()
+    try:
+        node = client.get_node("ns=6;s=::Handling:instJS_MC_ReadActualPosition.Position")
+
+        # Current behaviour: one synchronous round trip per profile
+        latencies = np.empty(polls)
+        errors = np.empty(polls)
+        for i in range(polls):
+            t0 = time.perf_counter()
+            degrees = node.get_value() / COUNTS_PER_REVOLUTION * 360
+            t1 = time.perf_counter()
+            latencies[i] = t1 - t0
+            errors[i] = angle_error(degrees, expected_degrees(start, t0))
+
+        service = MotorPositionService(client, period_ms=2)
+        service.start()
+        time.sleep(0.5)
+
+        # Profiles are looked up at their shutter time, a few milliseconds before they are processed
+        delays = np.random.default_rng(0).uniform(0.005, 0.05, lookups)
+        lookup_times = np.empty(lookups)
+        angles = np.empty(lookups)
+        elapsed = 0.0
+        for i in range(lookups):
+            lookup_times[i] = time.perf_counter() - delays[i]
+            t0 = time.perf_counter()
+            angles[i] = service.position_at(lookup_times[i])
+            elapsed += time.perf_counter() - t0
+        cached = elapsed / lookups
+        cached_errors = angle_error(angles, expected_degrees(start, lookup_times))
+        service.stop()
+
+        print(f"Polling get_value(): {1e6 * latencies.mean():9.1f} µs/profile (p99 {1e6 * np.percentile(latencies, 99):.1f} µs),"
+              f" angle error {errors.mean():.3f}° mean")
+        print(f"Subscription cache:  {1e6 * cached:9.1f} µs/profile,"
+              f" angle error {cached_errors.mean():.3f}° mean, {cached_errors.max():.3f}° max")
+        print(f"Samples received: {service.samples}")
+    finally:
+        client.disconnect()
+        shutdown()
+
+
+if __name__ == "__main__":
+    main()
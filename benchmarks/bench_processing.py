@@ -0,0 +1,236 @@
+"""Cost of the profile processing functions per point and of the dual-sensor path per profile.
+
+Profiles are synthetic 2048-point sections of a turning part with fixed
+seeds, once nearly complete ("clean") and once with most points lost to
+zero dropouts ("dropouts"). For every function the time per input point
+and the peak memory it allocates per profile are reported; the end-to-end
+figure runs decode -> FilterTransformKernel -> store for both sensors as
+corecode.py does. Save the results and compare them between versions:
+
+    python benchmarks/bench_processing.py --json processing.json
+    python benchmarks/bench_processing.py --compare processing.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+import numpy as np
+import scipy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from profile_decoder import ProfileDecoder, DATA_WIDTH
+from profile_processing import (filter_laser_data, remove_outliers_with_zscore, smooth_data_with_savgol,
+                                smooth_data_with_median, smooth_data_with_gaussian, transform_coordinates_from_center,
+                                FilterTransformKernel)
+from filter_chain import FilterChain, STAGES
+from point_store import PointStore
+from rotation_stats import RadiusStats
+
+POINTS = 2048
+SCENARIOS = {"clean": 0.02, "dropouts": 0.7}  # Fraction of points lost per profile
+X_SCALE = 0.005  # mm per raw count of the synthetic decoder
+Z_OFFSET = 160.0
+CIRCLE_RADIUS = 25
+
+
+def make_profile(rng, dropout, points=POINTS):
+    """x/z of one profile: an arc with noise and a few spikes, zeroed where the laser line is lost."""
+    x = np.linspace(-25.0, 25.0, points) + rng.normal(0.0, 0.01, points)
+    z = Z_OFFSET - 40.0 + np.sqrt(np.clip(30.0 ** 2 - x ** 2, 0.0, None)) + rng.normal(0.0, 0.02, points)
+    spikes = rng.integers(0, points, points // 200)
+    z[spikes] += rng.normal(0.0, 5.0, len(spikes))
+    # Dropouts come in runs, like reflections and shadowed edges
+    lost = np.zeros(points, dtype=bool)
+    while lost.mean() < dropout:
+        start = rng.integers(0, points)
+        lost[start:start + rng.integers(1, 64)] = True
+    x[lost] = 0.0
+    z[lost] = 0.0
+    return x, z
+
+
+def synthetic_decoder():
+    """Linear conversion tables; raw value 0 marks an invalid point."""
+    table = (np.arange(65536) - 32768) * X_SCALE
+    invalid = np.zeros(65536, dtype=bool)
+    invalid[0] = True
+    table[0] = 0.0
+    return ProfileDecoder(table, table + Z_OFFSET, invalid, invalid.copy())
+
+
+def encode_profiles(profiles):
+    """Raw partial profiles (big-endian X and Z words) that the synthetic decoder turns back into `profiles`."""
+    raw = np.zeros((len(profiles), POINTS * DATA_WIDTH), dtype=np.uint8)
+    words = raw.view(">u2").reshape(len(profiles), POINTS, 2)
+    for row, (x, z) in enumerate(profiles):
+        valid = (x != 0.0) & (z != 0.0)
+        words[row, :, 0] = np.where(valid, np.round(x / X_SCALE) + 32768, 0)
+        words[row, :, 1] = np.where(valid, np.round((z - Z_OFFSET) / X_SCALE) + 32768, 0)
+    return raw
+
+
+def time_per_call(call, repeat=5, seconds=0.2):
+    """Best time of one call over `repeat` runs of about `seconds` each."""
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    number = max(1, int(number * seconds / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def peak_allocation(call):
+    """Peak memory allocated by one call, in bytes."""
+    call()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def bench_functions(profiles):
+    x, z = profiles[0]
+    filtered_x, filtered_z = filter_laser_data(x, z)
+    calls = {
+        "filter_laser_data": ((x, z), lambda: filter_laser_data(x, z)),
+        "remove_outliers_with_zscore": ((filtered_x, filtered_z), lambda: remove_outliers_with_zscore(filtered_x, filtered_z)),
+        "smooth_data_with_savgol": ((filtered_x, filtered_z), lambda: smooth_data_with_savgol(filtered_x, filtered_z)),
+        "smooth_data_with_median": ((filtered_x, filtered_z), lambda: smooth_data_with_median(filtered_x, filtered_z)),
+        "smooth_data_with_gaussian": ((filtered_x, filtered_z), lambda: smooth_data_with_gaussian(filtered_x, filtered_z)),
+        "transform_coordinates_from_center": ((filtered_x, filtered_z),
+                                              lambda: transform_coordinates_from_center(filtered_x, filtered_z, 123.4, CIRCLE_RADIUS)),
+    }
+    # Both sensors of a block of pairs in one call, reported per profile like the functions above
+    block = np.array([profile[0] for profile in profiles[:8]]), np.array([profile[1] for profile in profiles[:8]])
+    kernel = FilterTransformKernel(POINTS, CIRCLE_RADIUS)
+    angles = np.linspace(0.0, 360.0, len(block[0]), endpoint=False)
+    kernel_points = 2 * block[0].size
+    results = {}
+    for name, ((input_x, _), call) in calls.items():
+        seconds = time_per_call(call)
+        results[name] = {"points": len(input_x),
+                         "ns_per_point": 1e9 * seconds / max(len(input_x), 1),
+                         "us_per_profile": 1e6 * seconds,
+                         "peak_bytes_per_profile": peak_allocation(call)}
+    seconds = time_per_call(lambda: kernel.process(*block, *block, angles))
+    results["FilterTransformKernel"] = {"points": kernel_points // (2 * len(angles)),
+                                        "ns_per_point": 1e9 * seconds / kernel_points,
+                                        "us_per_profile": 1e6 * seconds / (2 * len(angles)),
+                                        "peak_bytes_per_profile": peak_allocation(lambda: kernel.process(*block, *block, angles)) / (2 * len(angles))}
+
+    # Every filter chain stage on its own over the same block, including moving the dropouts aside and back
+    for stage in STAGES:
+        chain = FilterChain([{"stage": stage}])
+        call = lambda: chain.apply(block[0].copy(), block[1].copy())
+        seconds = time_per_call(call)
+        results["FilterChain " + stage] = {"points": block[0].shape[1],
+                                           "ns_per_point": 1e9 * seconds / block[0].size,
+                                           "us_per_profile": 1e6 * seconds / len(block[0]),
+                                           "peak_bytes_per_profile": peak_allocation(call) / len(block[0])}
+    return results
+
+
+def bench_end_to_end(profiles, block=32):
+    """Pairs per second through decode -> filter/transform kernel -> store for both sensors."""
+    raw = [encode_profiles(profiles), encode_profiles(profiles[::-1])]
+    decoder = synthetic_decoder()
+    kernel = FilterTransformKernel(POINTS, CIRCLE_RADIUS)
+    stores = [PointStore(), PointStore()]
+    stats = [RadiusStats(), RadiusStats()]
+
+    def run(count=len(profiles)):
+        for store, sensor_stats in zip(stores, stats):
+            store.clear()
+            sensor_stats.reset()
+        for start in range(0, count, block):
+            (x_block, z_block), (x_block1, z_block1) = [decoder.decode(sensor_raw[start:min(start + block, count)])
+                                                        for sensor_raw in raw]
+            angles = np.arange(start, start + len(x_block)) * 360.0 / len(profiles)
+            x_out, z_out, valid = kernel.process(x_block, z_block, x_block1, z_block1, angles)
+            for k, angle in enumerate(angles):
+                for sensor in (0, 1):
+                    x_transformed, z_transformed = x_out[sensor, k][valid[sensor, k]], z_out[sensor, k][valid[sensor, k]]
+                    stores[sensor].append(x_transformed, z_transformed, angle, start + k, sensor)
+                    stats[sensor].update(x_transformed, z_transformed, angle)
+
+    seconds = time_per_call(run, repeat=3, seconds=0.5)
+    return {"pairs": len(profiles),
+            "profiles_per_s": len(profiles) / seconds,
+            "us_per_pair": 1e6 * seconds / len(profiles),
+            "peak_bytes_per_pair": peak_allocation(lambda: run(1))}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Print the change of every timing against an earlier result file."""
+    print(f"\nChange against {previous.get('revision')}:")
+    for scenario, functions in current["functions"].items():
+        for name, result in functions.items():
+            before = previous["functions"].get(scenario, {}).get(name)
+            if before:
+                change = 100 * (result["ns_per_point"] / before["ns_per_point"] - 1)
+                print(f"  {scenario:9s} {name:34s} {change:+7.1f} %")
+    for scenario, result in current["end_to_end"].items():
+        before = previous["end_to_end"].get(scenario)
+        if before:
+            change = 100 * (result["profiles_per_s"] / before["profiles_per_s"] - 1)
+            print(f"  {scenario:9s} {'end to end (profiles/s)':34s} {change:+7.1f} %")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=360, help="Profiles per rotation in the end-to-end run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    results = {"revision": git_revision(),
+               "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "scipy": scipy.__version__,
+               "points": POINTS,
+               "seed": args.seed,
+               "functions": {},
+               "end_to_end": {}}
+    for scenario, dropout in SCENARIOS.items():
+        rng = np.random.default_rng(args.seed)
+        profiles = [make_profile(rng, dropout) for _ in range(args.profiles)]
+        results["functions"][scenario] = bench_functions(profiles)
+        results["end_to_end"][scenario] = bench_end_to_end(profiles)
+
+        print(f"\n{scenario} ({100 * dropout:.0f} % dropouts)")
+        for name, result in results["functions"][scenario].items():
+            print(f"  {name:34s} {result['ns_per_point']:8.1f} ns/point {result['us_per_profile']:8.1f} µs/profile"
+                  f" {result['peak_bytes_per_profile'] / 1024:8.1f} KiB/profile")
+        result = results["end_to_end"][scenario]
+        print(f"  {'dual-sensor path':34s} {result['profiles_per_s']:8.0f} profiles/s {result['us_per_pair']:6.1f} µs/pair"
+              f" {result['peak_bytes_per_pair'] / 1024:8.1f} KiB/pair")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Pairs per second of ProcessingPool against the serial decode -> filter -> transform path.
+
+Uses the synthetic profiles and decoder of bench_processing.py, checks that
+the pool returns the serial results in order and reports the throughput for
+each worker count:
+
+    python benchmarks/bench_processing_pool.py --workers 1 2 4 8 --chain
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_processing import POINTS, CIRCLE_RADIUS, make_profile, synthetic_decoder, encode_profiles
+from processing_pool import ProcessingPool
+from filter_chain import FilterChain
+from profile_processing import FilterTransformKernel
+
+CHAIN = [{"stage": "zscore"}, {"stage": "median"}, {"stage": "savgol"}]
+
+
+def serial(raw, angles, decoder, chain_config, block):
+    """The single-threaded path of corecode.data_gen; returns (x, z, valid) per block."""
+    chain = FilterChain(chain_config)
+    kernel = FilterTransformKernel(POINTS, CIRCLE_RADIUS)
+    results = []
+    for start in range(0, len(angles), block):
+        blocks = []
+        for sensor_raw in raw:
+            x, z = decoder.decode(sensor_raw[start:start + block])
+            if chain:
+                chain.apply(x, z)
+            blocks += [x, z]
+        x_out, z_out, valid = kernel.process(*blocks, angles[start:start + block])
+        results.append((x_out.copy(), z_out.copy(), valid.copy()))
+    return results
+
+
+def run_pool(raw, angles, decoder, chain_config, workers, block, check=None):
+    pool = ProcessingPool([decoder, decoder], POINTS, raw[0].shape[1], CIRCLE_RADIUS, chain_config,
+                          workers=workers, block=block)
+    try:
+        # Warm up the workers before timing
+        pool.submit(raw[0][:block], raw[1][:block], angles[:block])
+        pool.release(pool.result()[0])
+        start_time = time.perf_counter()
+        mismatches = [0]
+
+        def take_result():
+            ticket, x, z, valid = pool.result()
+            if check is not None:
+                x_serial, z_serial, valid_serial = check[ticket - 1]
+                same = np.array_equal(valid, valid_serial) and np.array_equal(x[valid], x_serial[valid]) \
+                    and np.array_equal(z[valid], z_serial[valid])
+                mismatches[0] += not same
+            pool.release(ticket)
+
+        for start in range(0, len(angles), block):
+            if not pool.free_slots():
+                take_result()
+            pool.submit(raw[0][start:start + block], raw[1][start:start + block], angles[start:start + block])
+        while pool.pending():
+            take_result()
+        seconds = time.perf_counter() - start_time
+        return len(angles) / seconds, mismatches[0], pool.stats()
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=1024)
+    parser.add_argument("--block", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chain", action="store_true", help="Run the z-score, median and Savitzky-Golay stages too")
+    parser.add_argument("--dropout", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    profiles = [make_profile(rng, args.dropout) for _ in range(args.pairs)]
+    raw = [encode_profiles(profiles), encode_profiles(profiles[::-1])]
+    # Angles on encoder counts, as corecode looks them up
+    angles = np.arange(args.pairs) * 97 % 120000 / 120000 * 360
+    decoder = synthetic_decoder()
+    chain_config = CHAIN if args.chain else []
+
+    start = time.perf_counter()
+    reference = serial(raw, angles, decoder, chain_config, args.block)
+    serial_rate = args.pairs / (time.perf_counter() - start)
+    print(f"{os.cpu_count()} CPUs, {'with' if args.chain else 'without'} filter chain")
+    print(f"  serial     {serial_rate:8.0f} pairs/s")
+    results = {"cpus": os.cpu_count(), "chain": chain_config, "serial_pairs_per_s": serial_rate, "pool": []}
+    for workers in args.workers:
+        rate, mismatches, stats = run_pool(raw, angles, decoder, chain_config, workers, args.block, reference)
+        print(f"  {workers:2d} workers {rate:8.0f} pairs/s ({rate / serial_rate:4.2f}x),"
+              f" utilization {100 * stats['utilization']:3.0f} %, {mismatches} blocks differ from serial")
+        results["pool"].append({"workers": workers, "pairs_per_s": rate, "mismatches": mismatches,
+                                "utilization": stats["utilization"]})
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Cost of comparing a rotation against a golden scan with ReferenceComparison.
+
+A synthetic part (a circle section per sensor) is saved as reference, its
+index is built and then loaded from the cache, and a good and a damaged
+rotation are compared profile by profile as corecode.py does. Reported are
+the index build and load times, the time per profile and the latency of
+the verdict at the end of a rotation:
+
+    python benchmarks/bench_reference_compare.py --profiles 600 --points 2048
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from point_store import PointStore
+from reference_compare import ReferencePart, ReferenceComparison, save_reference
+
+
+def make_rotation(rng, profiles, points, radius, sensor, dent=0.0):
+    """PointStore points of one rotation; `dent` (mm) pushes in a 20 degree section of the surface."""
+    store = PointStore()
+    section = np.linspace(0.0, 2 * np.pi, points, endpoint=False)
+    for k in range(profiles):
+        angle = k * 360.0 / profiles
+        r = radius + rng.normal(0.0, 0.02, points)
+        if dent and angle < 20.0:
+            r -= dent
+        theta = section + np.radians(angle)
+        store.append(r * np.cos(theta), r * np.sin(theta), angle, k, sensor)
+    return store.points().copy()
+
+
+def compare(comparison, rotation):
+    comparison.reset()
+    start = time.perf_counter()
+    for points in np.split(rotation[0], np.flatnonzero(np.diff(rotation[0]["profile"])) + 1):
+        for sensor in (0, 1):
+            comparison.update(sensor, points["x"], points["z"], points["angle"][0])
+    profile_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    verdict = comparison.verdict()
+    return verdict, profile_seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=600)
+    parser.add_argument("--points", type=int, default=2048)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    reference = [make_rotation(rng, args.profiles, args.points, 25.0, sensor) for sensor in (0, 1)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "reference.npz")
+        save_reference(path, reference)
+        start = time.perf_counter()
+        ReferencePart(path)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        part = ReferencePart(path)
+        load = time.perf_counter() - start
+        print(f"index: built in {build:.2f} s, loaded from cache in {1e3 * load:.0f} ms")
+
+        comparison = ReferenceComparison(part)
+        for name, dent in (("good", 0.0), ("dented", 1.0)):
+            # Both sensors see the same section here, which is all the comparison needs
+            rotation = [make_rotation(rng, args.profiles, args.points, 25.0, 0, dent)]
+            verdict, profile_seconds, verdict_seconds = compare(comparison, rotation)
+            print(f"{name:7s} {'PASS' if verdict['passed'] else 'SCRAP':5s}"
+                  f" {1e6 * profile_seconds / (2 * args.profiles):6.1f} us per profile,"
+                  f" verdict after {1e3 * verdict_seconds:.2f} ms,"
+                  f" worst region {verdict['worst_region']['angle'][0]:.0f} deg,"
+                  f" {100 * verdict['fraction_out_of_tolerance']:.2f} % out of tolerance")
+
+
+if __name__ == "__main__":
+    main()
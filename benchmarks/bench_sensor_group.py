@@ -0,0 +1,98 @@
+"""Scaling of the N-sensor acquisition engine (sensor_group.py) on the simulated pyllt backend.
+
+Runs 1, 2, 4, ... simulated heads through SensorGroup at each profile
+frequency and reports matched frames per second, profiles converted per
+second over all heads, losses and CPU time. With the per-head conversion
+threads the converted profiles per second should grow with the number of
+heads until the CPU is saturated:
+
+    python benchmarks/bench_sensor_group.py --seconds 3 --heads 1 2 4 --frequencies 250 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "sim"))
+import pyllt as llt
+from profile_rate import decode_time_code, encode_time_code
+from sensor_group import SensorGroup
+
+EXPOSURE_US = 120
+
+
+def group_config(heads, frequency):
+    # Heads spread evenly around the part, one address per head
+    return {"exposure_us": EXPOSURE_US,
+            "idle_us": decode_time_code(encode_time_code(1e6 / frequency - EXPOSURE_US)),
+            "ring_slots": 512,
+            "sensors": [{"name": f"head{i + 1}", "interface": f"192.168.0.{4 + i}",
+                         "pose": {"angle_deg": 360.0 * i / heads}} for i in range(heads)]}
+
+
+def run(heads, frequency, seconds):
+    group = SensorGroup(group_config(heads, frequency), llt)
+    group.connect()
+    group.start()
+    frames = 0
+    converted = 0
+    start = None
+    try:
+        for block in group.frames():
+            if block is None:
+                continue
+            if start is None:
+                # Measure from the first frame on, once every head delivers
+                start = time.perf_counter()
+                cpu = time.process_time()
+                converted = sum(sensor.convert_count for sensor in group.sensors)
+                continue
+            frames += len(block[0])
+            if time.perf_counter() - start >= seconds:
+                break
+    finally:
+        elapsed = time.perf_counter() - start if start is not None else 0.0
+        cpu = time.process_time() - cpu if start is not None else 0.0
+        group.stop()
+        group.close()
+    stats = group.stats()["sensors"].values()
+    elapsed = max(elapsed, 1e-9)
+    return {"heads": heads,
+            "frequency_hz": frequency,
+            "frames_per_s": frames / elapsed,
+            "profiles_per_s": (sum(sensor.convert_count for sensor in group.sensors) - converted) / elapsed,
+            "lost": sum(s["lost"] for s in stats),
+            "overruns": sum(s["overruns"] for s in stats),
+            "unmatched": sum(s["unmatched"] for s in stats),
+            "cpu_percent": 100 * cpu / elapsed,
+            "convert_us_per_profile": sum(s["convert_us_per_profile"] for s in stats) / heads}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--heads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--frequencies", type=float, nargs="+", default=[250, 500])
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'heads':>5} {'Hz':>6} {'frames/s':>9} {'profiles/s':>11} {'lost':>6} {'overruns':>9} {'unmatched':>10} "
+          f"{'CPU %':>6} {'µs/profile':>11}")
+    for frequency in args.frequencies:
+        for heads in args.heads:
+            result = run(heads, frequency, args.seconds)
+            results.append(result)
+            print(f"{heads:>5} {frequency:>6.0f} {result['frames_per_s']:>9.0f} {result['profiles_per_s']:>11.0f} "
+                  f"{result['lost']:>6} {result['overruns']:>9} {result['unmatched']:>10} "
+                  f"{result['cpu_percent']:>6.0f} {result['convert_us_per_profile']:>11.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,138 +1,255 @@
 import time
+process_start = time.perf_counter()  # Startup times are reported from here, imports included
+import argparse
+import os
+import signal
 import threading
 import ctypes as ct
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from opcua import Client
 import pyllt as llt
 import sys
-from scipy.signal import savgol_filter, medfilt
-from scipy.stats import zscore
-from scipy.ndimage import gaussian_filter1d
+from collections import deque
+from profile_ring import ProfileRing
+from profile_pairing import ProfilePairer
+from processing_worker import ProcessingWorker
+from profile_decoder import convert_block_with_library, decoder_for, ProfileDecoder, TimestampReader
+from point_store import PointStore
+from rotation_stats import RadiusStats
+from height_map import HeightMap
+from live_plot import ProfileWindow
+from motor_position import MotorPositionService, SensorClock, COUNTS_PER_REVOLUTION
+from recording import ProfileRecorder, ReplaySource, open_recording
+from filter_chain import FilterChain
+from processing_pool import ProcessingPool
+from device_setup import DeviceBringUp
+from telemetry import Telemetry
+from profile_rate import ProfileGapDetector, FrequencyTuner, encode_time_code, decode_time_code
+from profile_processing import FilterTransformKernel, TrigTable
+from profile_bus import ProfileBus
 
 start_time = time.time()
 
-# Connect to OPC UA server to get real-time motor position
-opc_client = Client("opc.tcp://192.168.0.2:4840")  # Replace with your OPC UA server details
-opc_client.connect()
-print("Connected to OPC UA Server!")
-
-# NodeId for motor position
-position_node = opc_client.get_node("ns=6;s=::Handling:instJS_MC_ReadActualPosition.Position")
+record_file = None  # Record every raw profile with its timestamp and motor angle to this file, e.g. "session.rec"
+replay_file = None  # Process a recording instead of the live sensors and OPC UA server
+replay_realtime = True  # Replay at the recorded rate, or as fast as the pipeline can take it
 
 profile_count = 0  # Global profile count for terminal display
 
 def get_real_motor_position():
-    """Retrieve real-time motor position in degrees."""
-    try:
-        current_position = position_node.get_value()
-        return (current_position / 120000) * 360  # Convert position to degrees
-    except Exception as e:
-        print(f"Error reading motor position from OPC UA: {e}")
-        return 0  # Return 0 if there's an error
+    """Latest motor position in degrees."""
+    return motor_position.latest()
 
 def update_terminal_display():
-    """Continuously updates the terminal with the motor position and profile count."""
+    """Writes a telemetry snapshot to the terminal once a second."""
     global profile_count
+    last_cpu = time.process_time()
+    last_time = time.perf_counter()
     while True:
         motor_position = get_real_motor_position()
-        sys.stdout.write(f"\rMotor Position: {motor_position:.2f}° | Profiles Processed: {profile_count}")
+        snapshot = telemetry.snapshot()
+        cpu, now = time.process_time(), time.perf_counter()
+        cpu_percent = 100 * (cpu - last_cpu) / (now - last_time)
+        last_cpu, last_time = cpu, now
+        rates = snapshot["rates_per_s"]
+        gauges = snapshot["gauges"]
+        convert = snapshot["stages"].get("convert") or snapshot["stages"].get("pool")
+        convert_p99 = f"{1e3 * convert['quantiles_s']['0.99']:.2f} ms" if convert else "-"
+        sys.stdout.write(f"\rMotor Position: {motor_position:.2f}° | Profiles Processed: {profile_count}"
+                         f" | Rate: {rates.get('profiles_sensor1', 0):.0f}/{rates.get('profiles_sensor2', 0):.0f} /s"
+                         f" in {rates.get(transfer_counters[0], 0):.0f}/{rates.get(transfer_counters[1], 0):.0f} {transfer_name}/s"
+                         f" | CPU: {cpu_percent:.0f} %"
+                         f" | Overruns: {gauges['overruns_sensor1']}/{gauges['overruns_sensor2']}"
+                         f" | Lost: {gauges['lost_sensor1']}/{gauges['lost_sensor2']}"
+                         f" | Unpaired: {gauges['unpaired_sensor1']}/{gauges['unpaired_sensor2']}"
+                         f" | Convert p99: {convert_p99}"
+                         f" | Queue dropped: {gauges['queue_dropped']}")
         sys.stdout.flush()
         time.sleep(1)
 
-# Start the terminal display in a separate thread
-terminal_thread = threading.Thread(target=update_terminal_display, daemon=True)
-terminal_thread.start()
-
-def filter_laser_data(x, z, filter_value=0.0):
-    mask = (x != filter_value) & (z != filter_value)
-    return x[mask], z[mask]
-
-def remove_outliers_with_zscore(x, z, threshold=3):
-    """Remove outliers based on Z-score if data is sufficiently varied."""
-    if len(z) > 1 and np.std(z) > 0:  # Ensure there is some variation
-        z_scores = np.abs(zscore(z))  # Calculate Z-scores
-        mask = z_scores < threshold   # Filter out points where Z-score > threshold
-        return x[mask], z[mask]
-    else:
-        print("Warning: Insufficient variance in data for Z-score. Returning original data.")
-        return x, z  # Return original data if there's no variance
-
-
-def smooth_data_with_savgol(x, z, window_size=5, poly_order=3):
-    """Apply Savitzky-Golay filter for smoothing, if data is sufficient."""
-    if len(z) >= window_size:  # Ensure the data length meets the window size
-        z_smoothed = savgol_filter(z, window_size, poly_order)
-    else:
-        print("Warning: Insufficient data for Savitzky-Golay filter. Returning original data.")
-        z_smoothed = z  # Return the original data if not enough points
-    return x, z_smoothed
-
-
-def smooth_data_with_median(x, z, kernel_size=3):
-    z_smoothed = medfilt(z, kernel_size=kernel_size)
-    return x, z_smoothed
-
-def smooth_data_with_gaussian(x, z, sigma=1.0):
-    z_smoothed = gaussian_filter1d(z, sigma=sigma)
-    return x, z_smoothed
-
 def profile_callback(data, size, user_data):
-    global profile_buffer, profile_buffer1, received, received1
-    if user_data == 1:
-        ct.memmove(profile_buffer, data, size)
-        received = True
-    elif user_data == 2:
-        ct.memmove(profile_buffer1, data, size)
-        received1 = True
-
-    if received and received1:
-        event.set()
-        received1 = False
-        received = False
-
-def transform_coordinates_from_center(x, z, angle_deg, radius):
-    angle_rad = np.deg2rad(angle_deg)
-    x_shifted = x - x[0]
-    z_shifted = z - z[0]
-    x_rot = x_shifted * np.cos(angle_rad) - z_shifted * np.sin(angle_rad)
-    z_rot = x_shifted * np.sin(angle_rad) + z_shifted * np.cos(angle_rad)
-    x_translated = x_rot + radius * np.cos(angle_rad)
-    z_translated = z_rot + radius * np.sin(angle_rad)
-    return x_translated, z_translated
+    start = time.perf_counter()
+    # A container carries several profiles, which the ring splits into one slot each
+    ring = profile_ring if user_data == 1 else profile_ring1
+    ring.push(data, size)
+    event.set()
+    # One histogram and counter per sensor, since each sensor calls back from its own thread
+    callback_stages[user_data - 1].record(time.perf_counter() - start)
+    telemetry.add(callback_counters[user_data - 1])
+    telemetry.add(profile_counters[user_data - 1], max(size // ring.slot_size, 1))
+
+def read_timestamps(ring, start_seq, end_seq):
+    """Shutter times and profile counters of the buffered profiles start_seq to end_seq, decoded as one block."""
+    shutter_times, counters = timestamp_reader.read(ring.data[np.arange(start_seq, end_seq) % ring.slots, -16:])
+    return list(zip(shutter_times.tolist(), counters.tolist()))
+
+def pair_new_profiles(rings, next_seq):
+    """Feed the newly buffered profiles to the pairer, alternating one profile of each sensor until both are drained."""
+    pairs = []
+    end_seq = [ring.write_seq for ring in rings]
+    start_seq = list(next_seq)
+    timestamps = [read_timestamps(ring, start_seq[sensor], end_seq[sensor]) for sensor, ring in enumerate(rings)]
+    while next_seq[0] < end_seq[0] or next_seq[1] < end_seq[1]:
+        for sensor, ring in enumerate(rings):
+            seq = next_seq[sensor]
+            if seq < end_seq[sensor]:
+                shutter_time, counter = timestamps[sensor][seq - start_seq[sensor]]
+                gap_detectors[sensor].update(counter)
+                slot = seq % ring.slots
+                host_time = ring.arrival[slot]
+                if sensor == 0:
+                    # The top sensor's shutter time on the host clock is where the motor position is looked up
+                    host_time = top_shutter_host_time[slot] = sensor_clock.update(shutter_time, ring.arrival[slot])
+                if profile_recorder is not None:
+                    profile_recorder.append(sensor, ring.view(seq), ring.arrival[slot], shutter_time, counter,
+                                            motor_position.position_at(host_time))
+                pair = profile_pairer.add(sensor, seq, shutter_time, counter)
+                if pair is not None:
+                    pairs.append(pair)
+                next_seq[sensor] = seq + 1
+    return pairs
 
 # Initialize
-received = False
-received1 = False
 exposure_time_units = 12
 idle_time_units = 450
+ring_slots = 256  # Profiles buffered per sensor before the callback reports an overrun
+container_profiles = 0  # Profiles the sensors deliver per callback in container mode; 0 transfers every profile on its own
+acquisition_mode = "callback"  # "callback": pyllt calls profile_callback per transfer; "polling": a thread fetches the profiles
+poll_interval = 0.0005  # Seconds the polling thread sleeps when neither sensor has a new profile
+poll_buffers = 64  # Profiles pyllt holds per sensor for the polling thread before the oldest is lost
+pair_time_tolerance = 100e-6  # Max. shutter time difference (s) between a top and a bottom profile of one cycle
+pair_max_age = 0.05  # Seconds an unmatched profile waits for its partner before it is dropped
+processing_queue_size = 256  # Processed frames kept for consumers before the oldest is dropped
+plot_interval = 10  # Display refresh period (ms), independent of the profile rate
+plot_window_profiles = 32  # Profiles shown per sensor; each new one replaces the oldest
+plot_point_budget = 8192  # Points drawn per sensor and frame, profiles are strided down to fit
+circle_radius = 25  # Radius (mm) the profiles are translated by around the rotation centre
+processing_workers = 0  # Processes that decode, filter and transform profile blocks; 0 keeps it all on the processing thread
+height_map_angle_bins = 720  # Motor angle bins per rotation of the cylindrical height map
+height_map_axial_bins = 512  # Bins along the laser line
+height_map_max_bytes = 64 << 20  # Both bin counts are reduced together if a height map would be larger
+reference_file = None  # Golden scan of a good part every rotation is compared against, e.g. "reference.npz"
+reference_save_file = None  # Save the first complete rotation to this file as the golden scan
+reference_tolerance = 0.5  # Max. distance (mm) of a point from the golden scan
+telemetry_port = None  # Serve Prometheus metrics on localhost at this port, e.g. 9108
+telemetry_file = None  # Write the telemetry with full histograms to this JSON file at shutdown
+bus_name = None  # Publish the transformed profiles on a shared memory bus of this name for other processes, e.g. "scrap-profiles"
+bus_slots = 1024  # Frames kept on the bus; a consumer further behind drops frames
+auto_frequency = False  # Shorten the idle time to the highest profile frequency at which no profile is lost
+auto_frequency_window = 2.0  # Seconds without a lost profile before a frequency counts as sustainable
+auto_frequency_min_idle_us = 100  # The tuner never goes below this idle time
+device_setup_timeout = 10.0  # Seconds the sensors and the OPC UA server get to connect and configure
+decoder_check_profiles = 200  # Profiles compared bit for bit with the pyllt conversion before the batched decoder is trusted
+timestamp_check_profiles = 200  # Profile timestamps compared with pyllt before the batched timestamp decoding is trusted
 start_data = 4
 data_width = 4
+# Outlier removal and smoothing of the decoded profile blocks, in this order; switched off stages cost nothing
+filter_chain_config = [
+    {"stage": "zscore", "enabled": False, "threshold": 3.0},
+    {"stage": "median", "enabled": False, "kernel_size": 3},
+    {"stage": "savgol", "enabled": False, "window_size": 5, "poly_order": 3},
+    {"stage": "gaussian", "enabled": False, "sigma": 1.0},
+]
 scanner_type = ct.c_int(0)
 scanner_type1 = ct.c_int(0)
 
-available_resolutions = (ct.c_uint * 4)()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Acquire and process the profiles of both sensors, with a live plot or headless.")
+    parser.add_argument("--headless", action="store_true", help="No plot and no prompt; matplotlib is not imported")
+    parser.add_argument("--start", choices=("prompt", "now", "signal"),
+                        help="Start after Enter (default with the plot), at once (default headless) or on SIGUSR1")
+    parser.add_argument("--duration", type=float, help="Headless: stop after this many seconds of measurement")
+    parser.add_argument("--replay", help="Process this recording instead of the live sensors and OPC UA server")
+    parser.add_argument("--fast", action="store_true", help="Replay as fast as the pipeline can take it")
+    parser.add_argument("--record", help="Record every raw profile to this file")
+    parser.add_argument("--acquisition", choices=("callback", "polling"),
+                        help="Receive profiles in the pyllt callback or fetch them from a polling thread")
+    parser.add_argument("--container", type=int, help="Profiles per callback in container mode; 0 for one per callback")
+    parser.add_argument("--workers", type=int, help="Processes that decode, filter and transform profile blocks")
+    parser.add_argument("--reference", help="Golden scan every rotation is compared against")
+    parser.add_argument("--save-reference", help="Save the first complete rotation to this file as the golden scan")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on localhost at this port")
+    parser.add_argument("--telemetry-json", help="Write the telemetry to this JSON file at shutdown")
+    parser.add_argument("--bus", help="Publish the transformed profiles on a shared memory bus of this name")
+    parser.add_argument("--auto-frequency", action="store_true",
+                        help="Tune the idle time to the highest profile frequency without lost profiles")
+    return parser.parse_args()
+
+# Command line options override the settings above
+args = parse_args()
+headless = args.headless
+start_mode = args.start or ("now" if headless else "prompt")
+if args.replay is not None:
+    replay_file = args.replay
+if args.fast:
+    replay_realtime = False
+if args.record is not None:
+    record_file = args.record
+if args.acquisition is not None:
+    acquisition_mode = args.acquisition
+if args.container is not None:
+    container_profiles = args.container
+if acquisition_mode == "polling" and container_profiles:
+    raise ValueError("Error: container transfers are only received by the callback acquisition")
+if args.workers is not None:
+    processing_workers = args.workers
+if args.reference is not None:
+    reference_file = args.reference
+if args.save_reference is not None:
+    reference_save_file = args.save_reference
+if args.metrics_port is not None:
+    telemetry_port = args.metrics_port
+if args.telemetry_json is not None:
+    telemetry_file = args.telemetry_json
+if args.bus is not None:
+    bus_name = args.bus
+if args.auto_frequency:
+    auto_frequency = True
+
+# Latency per pipeline stage and profile counters; the histograms are fetched once here, recording is a list increment
+telemetry = Telemetry()
+callback_stages = [telemetry.stage("callback_sensor1"), telemetry.stage("callback_sensor2")]
+profile_counters = ["profiles_sensor1", "profiles_sensor2"]
+callback_counters = ["callbacks_sensor1", "callbacks_sensor2"]
+poll_stages = [telemetry.stage("poll_sensor1"), telemetry.stage("poll_sensor2")]
+poll_counters = ["polls_sensor1", "polls_sensor2"]
+poll_lost_counters = ["poll_lost_sensor1", "poll_lost_sensor2"]
+if acquisition_mode == "polling" and replay_file is None:
+    transfer_counters, transfer_name = poll_counters, "polls"
+else:
+    transfer_counters, transfer_name = callback_counters, "callbacks"
+event_to_convert_stage = telemetry.stage("event_to_convert")
+convert_stage = telemetry.stage("convert")
+filter_stage = telemetry.stage("filter")
+transform_stage = telemetry.stage("transform")
+pool_stage = telemetry.stage("pool")
+store_stage = telemetry.stage("store")
+plot_stage = telemetry.stage("plot")
+publish_stage = telemetry.stage("publish")
+
 get_profile_cb = llt.buffer_cb_func(profile_callback)
 event = threading.Event()
-
-null_ptr_short = ct.POINTER(ct.c_ushort)()
-null_ptr_int = ct.POINTER(ct.c_uint)()
-
-hLLT = llt.create_llt_device(llt.TInterfaceType.INTF_TYPE_ETHERNET)
-hLLT1 = llt.create_llt_device(llt.TInterfaceType.INTF_TYPE_ETHERNET)
-
-def setup_device(device, ip_address):
-    ret = llt.set_device_interface(device, ip_address, 0)
-    if ret < 1:
-        raise ValueError("Error setting device interface: " + str(ret))
-    ret = llt.connect(device)
-    if ret < 1:
-        raise ConnectionError("Error connect: " + str(ret))
-    return device
-
-hLLT = setup_device(hLLT, 3232235524)
-hLLT1 = setup_device(hLLT1, 3232235527)
+if container_profiles:
+    # The partner of a profile can arrive a whole container later
+    container_seconds = container_profiles * (decode_time_code(exposure_time_units) + decode_time_code(idle_time_units)) * 1e-6
+    profile_pairer = ProfilePairer(time_tolerance=pair_time_tolerance, max_age=pair_max_age + container_seconds,
+                                   max_pending=max(32, 2 * container_profiles))
+else:
+    # A replay ages unpaired profiles on the recorded shutter times, so it pairs the same way every time
+    profile_pairer = ProfilePairer(time_tolerance=pair_time_tolerance, max_age=pair_max_age,
+                                   shutter_age=replay_file is not None)
+# Profiles lost per sensor, from gaps in the sensor's profile counter
+gap_detectors = [ProfileGapDetector(), ProfileGapDetector()]
+filter_chain = FilterChain(filter_chain_config)
+
+# The timestamps in the last 16 bytes of a block of profiles are decoded at once; checked against pyllt on the first profiles
+timestamp_reader = TimestampReader(llt, timestamp_check_profiles)
+
+if container_profiles:
+    transfer_type = llt.TTransferProfileType.NORMAL_CONTAINER_MODE
+    # A container is copied into the ring at once, so the ring has to hold a few of them
+    ring_slots = max(ring_slots, 4 * container_profiles)
+else:
+    transfer_type = llt.TTransferProfileType.NORMAL_TRANSFER
 
 def set_resolution(device, available_resolutions):
     ret = llt.get_resolutions(device, available_resolutions, len(available_resolutions))
@@ -144,8 +261,14 @@ def set_resolution(device, available_resolutions):
         raise ValueError("Error setting resolution : " + str(ret))
     return resolution
 
-resolution = set_resolution(hLLT, available_resolutions)
-resolution1 = set_resolution(hLLT1, available_resolutions)
+def setup_device(device, ip_address):
+    ret = llt.set_device_interface(device, ip_address, 0)
+    if ret < 1:
+        raise ValueError("Error setting device interface: " + str(ret))
+    ret = llt.connect(device)
+    if ret < 1:
+        raise ConnectionError("Error connect: " + str(ret))
+    return device
 
 def set_laser_params(device):
     ret = llt.set_feature(device, llt.FEATURE_FUNCTION_EXPOSURE_TIME, exposure_time_units)
@@ -155,25 +278,6 @@ def set_laser_params(device):
     if ret < 1:
         raise ValueError("Error setting idle time: " + str(ret))
 
-set_laser_params(hLLT)
-set_laser_params(hLLT1)
-
-profile_buffer = (ct.c_ubyte * (resolution * data_width))()
-profile_buffer1 = (ct.c_ubyte * (resolution1 * data_width))()
-
-x = np.empty(resolution, dtype=float)
-z = np.empty(resolution, dtype=float)
-x_p = x.ctypes.data_as(ct.POINTER(ct.c_double))
-z_p = z.ctypes.data_as(ct.POINTER(ct.c_double))
-
-x1 = np.empty(resolution1, dtype=float)
-z1 = np.empty(resolution1, dtype=float)
-x_p1 = x1.ctypes.data_as(ct.POINTER(ct.c_double))
-z_p1 = z1.ctypes.data_as(ct.POINTER(ct.c_double))
-
-partial_profile_struct = llt.TPartialProfile(0, start_data, resolution, data_width)
-partial_profile_struct1 = llt.TPartialProfile(0, start_data, resolution1, data_width)
-
 def configure_device(device, profile_struct):
     ret = llt.set_profile_config(device, llt.TProfileConfig.PARTIAL_PROFILE)
     if ret < 1:
@@ -184,177 +288,650 @@ def configure_device(device, profile_struct):
     ret = llt.set_partial_profile(device, ct.byref(profile_struct))
     if ret < 1:
         raise ValueError("Error setting partial profile: " + str(ret))
-
-configure_device(hLLT, partial_profile_struct)
-configure_device(hLLT1, partial_profile_struct1)
+    if container_profiles:
+        # Whole partial profiles back to back in one transfer, every one still ending with its timestamp
+        ret = llt.set_feature(device, llt.FEATURE_FUNCTION_PROFILE_REARRANGEMENT, 0)
+        if ret < 1:
+            raise ValueError("Error setting profile rearrangement: " + str(ret))
+        ret = llt.set_profile_container_size(device, profile_struct.nPointCount * profile_struct.nPointDataWidth,
+                                             container_profiles)
+        if ret < 1:
+            raise ValueError("Error setting container size: " + str(ret))
 
 def register_callback(device, user_data):
     ret = llt.register_callback(device, llt.TCallbackType.C_DECL, get_profile_cb, user_data)
     if ret < 1:
         raise ValueError("Error setting callback: " + str(ret))
 
-register_callback(hLLT, 1)
-register_callback(hLLT1, 2)
+def set_polling_buffers(device):
+    # Held buffers are handed out oldest first, so the polling thread sees every profile, not only the newest
+    ret = llt.set_buffer_count(device, poll_buffers)
+    if ret < 1:
+        raise ValueError("Error setting buffer count: " + str(ret))
+    ret = llt.set_hold_buffers_for_polling(device, 1)
+    if ret < 1:
+        raise ValueError("Error setting hold buffers for polling: " + str(ret))
+
+def poll_profiles():
+    """Fetch all profiles pyllt holds for both sensors straight into the rings, then wake the processing once."""
+    lost = ct.c_uint(0)
+    sensors = ((hLLT, profile_ring), (hLLT1, profile_ring1))
+    while not poll_stop.is_set():
+        fetched = 0
+        for sensor, (device, ring) in enumerate(sensors):
+            start = time.perf_counter()
+            count = 0
+            # A full ring leaves the profiles with pyllt, which drops the oldest once its buffers are full
+            pointer = ring.reserve()
+            while pointer is not None:
+                ret = llt.get_actual_profile(device, pointer, ring.slot_size, llt.TProfileConfig.PARTIAL_PROFILE,
+                                             ct.byref(lost))
+                if ret < 1:
+                    if ret != llt.ERROR_PROFTRANS_NO_NEW_PROFILE:
+                        telemetry.add("poll_errors")
+                    break
+                ring.commit(ret)
+                count += 1
+                if lost.value:
+                    # Profiles pyllt dropped from its full buffers before this one
+                    telemetry.add(poll_lost_counters[sensor], lost.value)
+                pointer = ring.reserve()
+            if count:
+                poll_stages[sensor].record(time.perf_counter() - start)
+                telemetry.add(poll_counters[sensor])
+                telemetry.add(profile_counters[sensor], count)
+                fetched += count
+        if fetched:
+            event.set()
+        else:
+            time.sleep(poll_interval)
+
+poll_stop = threading.Event()
+poll_thread = None
 
 def start_transfer():
-    ret = llt.transfer_profiles(hLLT, llt.TTransferProfileType.NORMAL_TRANSFER, 1)
+    global poll_thread
+    ret = llt.transfer_profiles(hLLT, transfer_type, 1)
     if ret < 1:
         raise ValueError("Error starting transfer profiles: " + str(ret))
-    ret = llt.transfer_profiles(hLLT1, llt.TTransferProfileType.NORMAL_TRANSFER, 1)
+    ret = llt.transfer_profiles(hLLT1, transfer_type, 1)
     if ret < 1:
         raise ValueError("Error starting transfer profiles: " + str(ret))
-
-print("---Press Enter to start measurement and CTRL-C to stop measurement!---")
-var = input("")
-
-if var == "":
-    start_transfer()
-    print("Measurement of both sensors started!")
+    if acquisition_mode == "polling":
+        poll_thread = threading.Thread(target=poll_profiles, name="profile-polling", daemon=True)
+        poll_thread.start()
+
+def sensor_steps(ip_address, user_data, sensor_scanner_type):
+    """Bring-up steps of one sensor; every step gets the results of the earlier ones by name."""
+    def configure(done):
+        profile_struct = llt.TPartialProfile(0, start_data, done["resolution"], data_width)
+        configure_device(done["device"], profile_struct)
+        return profile_struct
+
+    return [("device", lambda done: llt.create_llt_device(llt.TInterfaceType.INTF_TYPE_ETHERNET),
+             lambda done: llt.del_device(done["device"])),
+            ("connect", lambda done: setup_device(done["device"], ip_address), lambda done: llt.disconnect(done["device"])),
+            ("resolution", lambda done: set_resolution(done["device"], (ct.c_uint * 4)())),
+            ("laser", lambda done: set_laser_params(done["device"])),
+            ("configure", configure),
+            # Conversion tables are captured from the library once, then whole blocks of profiles are decoded with NumPy
+            ("decoder", lambda done: decoder_for(llt, done["device"], sensor_scanner_type, done["resolution"])),
+            ("callback", lambda done: register_callback(done["device"], user_data)) if acquisition_mode == "callback"
+            else ("polling", lambda done: set_polling_buffers(done["device"]))]
+
+processing_pool = None
+if processing_workers:
+    # Forked here, before the OPC UA and sensor threads exist; the workers get the decoders once the sensors are up
+    processing_pool = ProcessingPool(workers=processing_workers)
+
+if replay_file is None:
+    from opcua import Client
+
+    # Motor position is pushed by an OPC UA subscription, profiles look it up locally at their shutter time
+    opc_client = Client("opc.tcp://192.168.0.2:4840")  # Replace with your OPC UA server details
+    motor_position = MotorPositionService(opc_client)
+
+    # Both sensors and the OPC UA connection are set up side by side; if one fails, all of them are undone
+    device_bring_up = DeviceBringUp(timeout=device_setup_timeout)
+    device_bring_up.add("OPC UA", [("connect", lambda done: opc_client.connect(), lambda done: opc_client.disconnect()),
+                                   ("subscribe", lambda done: motor_position.start(), lambda done: motor_position.stop())])
+    device_bring_up.add("Sensor 1", sensor_steps(3232235524, 1, scanner_type))
+    device_bring_up.add("Sensor 2", sensor_steps(3232235527, 2, scanner_type1))
+    try:
+        devices = device_bring_up.run()
+    finally:
+        print(device_bring_up.report())
+    print("Connected to OPC UA Server!")
+
+    top, bottom = devices["Sensor 1"], devices["Sensor 2"]
+    hLLT, resolution, partial_profile_struct = top["device"], top["resolution"], top["configure"]
+    hLLT1, resolution1, partial_profile_struct1 = bottom["device"], bottom["resolution"], bottom["configure"]
+    profile_decoders = [top["decoder"], bottom["decoder"]]
 else:
-    print("Please press Enter to start the measurement! Start the program again!")
-    sys.exit(0)
-
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 10))
-
-ax1.set_title("Top Laser Profile (Sensor 1)")
-ax1.set_xlabel("X Coordinate (mm)")
-ax1.set_ylabel("Z Coordinate (mm)")
-ax1.set_aspect('equal')
-ax1.grid(True)
-
-ax2.set_title("Bottom Laser Profile (Sensor 2)")
-ax2.set_xlabel("X Coordinate (mm)")
-ax2.set_ylabel("Z Coordinate (mm)")
-ax2.set_aspect('equal')
-ax2.grid(True)
-
-# Add a timer text in the first subplot
-timer_text = ax1.text(0.02, 0.95, '', transform=ax1.transAxes, fontsize=12, color="red")
-
-
-def update(data):
-    (x_transformed, z_transformed), (x_transformed1, z_transformed1) = data
-    ax1.plot(x_transformed, z_transformed, '.', markersize=1)
-    ax2.plot(x_transformed1, z_transformed1, '.', markersize=1)
-    ax1.relim()
-    ax1.autoscale_view()
-    ax2.relim()
-    ax2.autoscale_view()
-
-    # Calculate the elapsed time
-    elapsed_time = time.time() - start_time
-    timer_text.set_text(f"Elapsed Time: {elapsed_time:.2f} s")
-
-# Global variables for storing full rotation data
-full_rotation_top_x = []
-full_rotation_top_z = []
-full_rotation_bottom_x = []
-full_rotation_bottom_z = []
+    motor_position = MotorPositionService(None)
+
+    # Both sensors were recorded with the same profile size; the conversion tables are stored next to the recording
+    resolution = resolution1 = open_recording(replay_file).dtype["raw"].shape[0] // data_width
+    profile_decoders = [ProfileDecoder.load(f"{replay_file}.sensor{sensor + 1}.npz") for sensor in range(2)]
+    decoder_check_profiles = 0  # Nothing to check against without the sensors
+
+profile_ring = ProfileRing(resolution * data_width, ring_slots)
+profile_ring1 = ProfileRing(resolution1 * data_width, ring_slots)
+top_shutter_host_time = np.zeros(ring_slots)
+sensor_clock = SensorClock()
+
+profile_recorder = None
+if record_file is not None:
+    profile_recorder = ProfileRecorder(record_file, resolution * data_width)
+    for sensor, decoder in enumerate(profile_decoders):
+        if decoder is None:
+            print(f"No conversion tables for Sensor {sensor + 1}, the recording cannot be replayed without them")
+            continue
+        decoder.save(f"{record_file}.sensor{sensor + 1}.npz")
+
+if processing_pool is not None:
+    if all(profile_decoders):
+        # Shared memory blocks, results come back in pair order
+        processing_pool.configure(profile_decoders, resolution, resolution * data_width, circle_radius, filter_chain_config,
+                                  steps=COUNTS_PER_REVOLUTION)
+    else:
+        print("Processing pool not used, it needs the batched decoders of both sensors")
+        processing_pool.close()
+        processing_pool = None
+
+profile_bus = None
+if bus_name is not None:
+    # Plotter, analyzer or recorder processes read the frames from here without slowing down acquisition
+    profile_bus = ProfileBus(bus_name, 2, resolution, bus_slots)
+    print(f"Publishing profiles on bus {bus_name}")
+
+# Motor angle of each recorded top profile, used instead of the OPC UA position during a replay
+replay_top_angle = np.zeros(ring_slots)
+
+def replay_profile(record):
+    """Push one recorded profile through the same path as a live sensor callback."""
+    ring = (profile_ring, profile_ring1)[record["sensor"]]
+    if not replay_realtime:
+        # As fast as possible means as fast as the pipeline frees slots, not dropping profiles
+        while ring.available() >= ring.slots:
+            time.sleep(0)
+    if record["sensor"] == 0:
+        if ring.available() < ring.slots:
+            replay_top_angle[ring.write_seq % ring.slots] = record["motor_position"]
+        motor_position.add_sample(record["motor_position"] / 360 * COUNTS_PER_REVOLUTION, time.perf_counter())
+    raw = record["raw"]
+    profile_callback(raw.ctypes.data, len(raw), record["sensor"] + 1)
+
+def wait_for_start():
+    """Block until the measurement may start: after Enter, on SIGUSR1 or at once."""
+    if start_mode == "prompt":
+        print("---Press Enter to start measurement and CTRL-C to stop measurement!---")
+        if input("") != "":
+            print("Please press Enter to start the measurement! Start the program again!")
+            sys.exit(0)
+    elif start_mode == "signal":
+        if not hasattr(signal, "SIGUSR1"):
+            raise ValueError("Error starting on a signal: SIGUSR1 is not available on this platform")
+        started = threading.Event()
+        signal.signal(signal.SIGUSR1, lambda signum, frame: started.set())
+        print(f"---Send SIGUSR1 to process {os.getpid()} to start measurement---")
+        # Wait in short steps, so the main thread gets to run the signal handler
+        while not started.wait(0.2):
+            pass
+
+# Points of the current rotation per sensor, preallocated once and reused for every rotation
+full_rotation_top = PointStore()
+full_rotation_bottom = PointStore()
+
+# Radius statistics per sensor, updated with every profile so the summary is ready when the rotation ends
+rotation_stats_top = RadiusStats()
+rotation_stats_bottom = RadiusStats()
+
+# Radius per motor angle and point position along the laser line, a fixed-size raster reused for every rotation
+height_map_top = HeightMap(height_map_angle_bins, height_map_axial_bins, (0, resolution), height_map_max_bytes)
+height_map_bottom = HeightMap(height_map_angle_bins, height_map_axial_bins, (0, resolution1), height_map_max_bytes)
+
+# Deviation from the golden scan, accumulated with every profile so the verdict is ready when the rotation ends
+reference_comparison = None
+if reference_file is not None or reference_save_file is not None:
+    # Loads scipy, so only when a reference is used
+    from reference_compare import ReferencePart, ReferenceComparison, save_reference
+if reference_file is not None:
+    reference_part = ReferencePart(reference_file)
+    print(f"Reference {reference_file}: index {'loaded from cache' if reference_part.loaded_from_cache else 'built'}")
+    reference_comparison = ReferenceComparison(reference_part, reference_tolerance)
+
+rotation_count = 0  # Rotations analyzed; the first one starts wherever the motor was
+first_profile_time = None
 
 def reset_full_rotation_data():
-    global full_rotation_top_x, full_rotation_top_z, full_rotation_bottom_x, full_rotation_bottom_z
-    full_rotation_top_x = []
-    full_rotation_top_z = []
-    full_rotation_bottom_x = []
-    full_rotation_bottom_z = []
-
-def store_profile_data(x_top, z_top, x_bottom, z_bottom):
-    """Store profile data for each sensor."""
-    global full_rotation_top_x, full_rotation_top_z, full_rotation_bottom_x, full_rotation_bottom_z
-    full_rotation_top_x.append(x_top)
-    full_rotation_top_z.append(z_top)
-    full_rotation_bottom_x.append(x_bottom)
-    full_rotation_bottom_z.append(z_bottom)
+    full_rotation_top.clear()
+    full_rotation_bottom.clear()
+    rotation_stats_top.reset()
+    rotation_stats_bottom.reset()
+    height_map_top.reset()
+    height_map_bottom.reset()
+    if reference_comparison is not None:
+        reference_comparison.reset()
+
+def store_profile_data(x_top, z_top, x_bottom, z_bottom, angle, profile_index, points_top, points_bottom):
+    """Store profile data for each sensor; points_* are the positions of the points on the laser line."""
+    full_rotation_top.append(x_top, z_top, angle, profile_index, 0)
+    full_rotation_bottom.append(x_bottom, z_bottom, angle, profile_index, 1)
+    rotation_stats_top.update(x_top, z_top, angle)
+    rotation_stats_bottom.update(x_bottom, z_bottom, angle)
+    height_map_top.update(angle, points_top, np.sqrt(x_top**2 + z_top**2))
+    height_map_bottom.update(angle, points_bottom, np.sqrt(x_bottom**2 + z_bottom**2))
+    if reference_comparison is not None:
+        reference_comparison.update(0, x_top, z_top, angle)
+        reference_comparison.update(1, x_bottom, z_bottom, angle)
 
 def analyze_full_rotation():
     """Analyze the stored data after a full rotation."""
-    # Convert lists to numpy arrays for analysis
-    x_top = np.concatenate(full_rotation_top_x)
-    z_top = np.concatenate(full_rotation_top_z)
-    x_bottom = np.concatenate(full_rotation_bottom_x)
-    z_bottom = np.concatenate(full_rotation_bottom_z)
-    
-    # Example analyses
-    top_mean_radius = np.mean(np.sqrt(x_top**2 + z_top**2))
-    top_std_radius = np.std(np.sqrt(x_top**2 + z_top**2))
-    
-    bottom_mean_radius = np.mean(np.sqrt(x_bottom**2 + z_bottom**2))
-    bottom_std_radius = np.std(np.sqrt(x_bottom**2 + z_bottom**2))
+    global rotation_count
+    rotation_count += 1
+    if not rotation_stats_top.count or not rotation_stats_bottom.count:
+        reset_full_rotation_data()
+        return
+
+    # Example analyses, accumulated profile by profile in store_profile_data
+    top = rotation_stats_top.finalize()
+    bottom = rotation_stats_bottom.finalize()
+    top_mean_radius = top["mean"]
+    top_std_radius = top["std"]
+
+    bottom_mean_radius = bottom["mean"]
+    bottom_std_radius = bottom["std"]
     
     print("\nTop Sensor Analysis:")
     print(f"Mean Radius: {top_mean_radius:.2f} mm, Std Dev: {top_std_radius:.2f} mm")
     
     print("\nBottom Sensor Analysis:")
     print(f"Mean Radius: {bottom_mean_radius:.2f} mm, Std Dev: {bottom_std_radius:.2f} mm")
+
+    print(f"\nHeight map coverage: top {100 * height_map_top.coverage():.1f} %, bottom {100 * height_map_bottom.coverage():.1f} %")
+
+    if rotation_count == 2 and reference_save_file is not None:
+        save_reference(reference_save_file, [full_rotation_top.points(), full_rotation_bottom.points()])
+        print(f"Saved rotation as reference to {reference_save_file}")
+
+    if reference_comparison is not None and rotation_count > 1:
+        verdict = reference_comparison.verdict()
+        worst = verdict["worst_region"]
+        print(f"\nReference: {'PASS' if verdict['passed'] else 'SCRAP'}, mean deviation {verdict['mean']:.3f} mm,"
+              f" max {verdict['max']:.3f} mm, {100 * verdict['fraction_out_of_tolerance']:.2f} % out of tolerance")
+        print(f"Worst region {worst['angle'][0]:.0f}-{worst['angle'][1]:.0f} deg: mean {worst['mean']:.3f} mm,"
+              f" {100 * worst['fraction_out_of_tolerance']:.2f} % out of tolerance")
+        if verdict["missing_regions"]:
+            print(f"Regions with missing surface: {verdict['missing_regions']}")
     
-    # Additional analyses can be added here, such as symmetry, deviations, or feature detection.
+    # Additional analyses can be added here, such as symmetry or feature detection.
     
     reset_full_rotation_data()  # Clear data for the next rotation
 
+def convert_profiles(sensor, raw):
+    """Convert a block of raw profiles of one sensor into (profiles, resolution) x and z arrays."""
+    decoder = profile_decoders[sensor]
+    if decoder is not None:
+        return decoder.decode(raw)
+
+    # Per-profile library conversion, used if the batched decoder did not match the library
+    device, profile_struct, sensor_scanner_type = ((hLLT, partial_profile_struct, scanner_type),
+                                                   (hLLT1, partial_profile_struct1, scanner_type1))[sensor]
+    x_block, z_block, failed = convert_block_with_library(llt, device, profile_struct, sensor_scanner_type, raw)
+    if failed:
+        print(f"Error converting {failed} profiles of Sensor {sensor + 1}")
+    return x_block, z_block
+
+def verify_decoders(raw_blocks):
+    """Check the batched decoders bit for bit against the library, falling back to the library on a mismatch."""
+    devices = ((hLLT, scanner_type), (hLLT1, scanner_type1))
+    for sensor, raw in enumerate(raw_blocks):
+        decoder = profile_decoders[sensor]
+        if decoder is None:
+            continue
+        mismatches = decoder.verify(llt, devices[sensor][0], devices[sensor][1], raw)
+        if mismatches:
+            print(f"\nBatched decoder differs from pyllt on {mismatches} profiles of Sensor {sensor + 1}, using pyllt conversion")
+            profile_decoders[sensor] = None
+
 # Update `data_gen()` to check for a full rotation and analyze
 def data_gen():
     global profile_count
-    circle_radius = 25
     last_motor_position = 0
 
-    while True:
-        event.wait()
-        motor_position_degrees = get_real_motor_position()
-
-        # Store motor position to detect full rotation
-        if motor_position_degrees < last_motor_position:
-            analyze_full_rotation()
-        
-        last_motor_position = motor_position_degrees
-
-        # Convert top laser data
-        fret = llt.convert_part_profile_2_values(hLLT, profile_buffer, ct.byref(partial_profile_struct), scanner_type, 0, 1,
-                                                 null_ptr_short, null_ptr_short, null_ptr_short, x_p, z_p, null_ptr_int, null_ptr_int)
-        if fret & llt.CONVERT_X == 0 or fret & llt.CONVERT_Z == 0:
-            print("Error converting data for Sensor 1")
-            continue
+    # Filters and transforms both sensors' blocks in place, with cos/sin looked up per encoder count
+    filter_transform_kernel = FilterTransformKernel(resolution, circle_radius, TrigTable(COUNTS_PER_REVOLUTION))
+
+    rings = (profile_ring, profile_ring1)
+    next_seq = [0, 0]
+
+    checked_profiles = 0
+    in_flight = deque()  # Motor angles and submit time of the blocks on the processing pool, in ticket order
+
+    def emit(x_out, z_out, valid, profile_angles):
+        """Store and yield the transformed pairs of one block in sequence."""
+        global profile_count, first_profile_time
+        if first_profile_time is None:
+            first_profile_time = time.perf_counter()
+            print(f"\nFirst profile {first_profile_time - process_start:.2f} s after launch,"
+                  f" {1e3 * (first_profile_time - measurement_start):.0f} ms after the start")
+        nonlocal last_motor_position
+        if profile_bus is not None:
+            publish_start = time.perf_counter()
+            profile_bus.publish(x_out, z_out, valid, profile_angles)
+            publish_stage.record(time.perf_counter() - publish_start)
+        for k in range(len(profile_angles)):
+            motor_position_degrees = profile_angles[k]
+
+            # Store motor position to detect full rotation
+            if motor_position_degrees < last_motor_position:
+                analyze_full_rotation()
+
+            last_motor_position = motor_position_degrees
+
+            x_transformed, z_transformed = x_out[0, k][valid[0, k]], z_out[0, k][valid[0, k]]
+            x_transformed1, z_transformed1 = x_out[1, k][valid[1, k]], z_out[1, k][valid[1, k]]
+
+            store_start = time.perf_counter()
+            store_profile_data(x_transformed, z_transformed, x_transformed1, z_transformed1, motor_position_degrees, profile_count,
+                               np.flatnonzero(valid[0, k]), np.flatnonzero(valid[1, k]))
+            store_stage.record(time.perf_counter() - store_start)
+
+            profile_count += 1
+            telemetry.add("pairs")
+
+            # Yield the transformed profiles for top and bottom laser
+            yield (x_transformed, z_transformed), (x_transformed1, z_transformed1)
+
+    def emit_pool_result():
+        ticket, x_out, z_out, valid = processing_pool.result()
+        profile_angles, submitted = in_flight.popleft()
+        pool_stage.record(time.perf_counter() - submitted)
+        yield from emit(x_out, z_out, valid, profile_angles)
+        processing_pool.release(ticket)
 
-        filtered_x, filtered_z = filter_laser_data(x, z)
-        x_transformed, z_transformed = transform_coordinates_from_center(filtered_x, filtered_z, motor_position_degrees, circle_radius)
-
-        # Convert bottom laser data
-        fret1 = llt.convert_part_profile_2_values(hLLT1, profile_buffer1, ct.byref(partial_profile_struct1), scanner_type1, 0, 1,
-                                                  null_ptr_short, null_ptr_short, null_ptr_short, x_p1, z_p1, null_ptr_int, null_ptr_int)
-        if fret1 & llt.CONVERT_X == 0 or fret1 & llt.CONVERT_Z == 0:
-            print("Error converting data for Sensor 2")
+    while True:
+        # While blocks are on the pool, look for finished ones between sensor events
+        if not event.wait(0.001 if in_flight else 0.1) and not in_flight:
+            # Nothing arrived; the worker gets a chance to see a stop request
+            yield None
             continue
-
-        filtered_x1, filtered_z1 = filter_laser_data(x1, z1)
-        x_transformed1, z_transformed1 = transform_coordinates_from_center(filtered_x1, filtered_z1, motor_position_degrees, circle_radius)
-
-        # Ensure both top and bottom profiles are ready before storing
-        if x_transformed is not None and z_transformed is not None and x_transformed1 is not None and z_transformed1 is not None:
-            store_profile_data(x_transformed, z_transformed, x_transformed1, z_transformed1)
-
-        profile_count += 1
         event.clear()
 
-        # Yield the transformed profiles for top and bottom laser
-        yield (x_transformed, z_transformed), (x_transformed1, z_transformed1)
+        pairs = pair_new_profiles(rings, next_seq)
+        if pairs:
+            seqs = np.array(pairs)
+            # From the top profile's arrival in the callback to its conversion starting here
+            event_to_convert_stage.record_many(time.perf_counter() - profile_ring.arrival[seqs[:, 0] % profile_ring.slots])
+            raw = profile_ring.data[seqs[:, 0] % profile_ring.slots]
+            raw1 = profile_ring1.data[seqs[:, 1] % profile_ring1.slots]
+            # Per-slot data is rewritten as soon as a slot is released, so the angles are looked up first
+            if replay_file is None:
+                profile_angles = np.array([motor_position.position_at(t) for t in top_shutter_host_time[seqs[:, 0] % profile_ring.slots]])
+            else:
+                profile_angles = replay_top_angle[seqs[:, 0] % profile_ring.slots]
+            # The raw blocks and angles are copies, so these slots and any unpaired profiles before them can go back to the callback
+            profile_ring.release(seqs[-1, 0])
+            profile_ring1.release(seqs[-1, 1])
+
+            if checked_profiles < decoder_check_profiles:
+                verify_decoders((raw, raw1))
+                checked_profiles += len(pairs)
+
+            if processing_pool is not None and all(profile_decoders):
+                for start in range(0, len(pairs), processing_pool.block):
+                    if not processing_pool.free_slots():
+                        yield from emit_pool_result()
+                    end = start + processing_pool.block
+                    processing_pool.submit(raw[start:end], raw1[start:end], profile_angles[start:end])
+                    in_flight.append((profile_angles[start:end], time.perf_counter()))
+            else:
+                # Blocks still on the pool come first so the pairs stay in sequence
+                while in_flight:
+                    yield from emit_pool_result()
+
+                # Convert top and bottom laser data
+                stage_start = time.perf_counter()
+                x_block, z_block = convert_profiles(0, raw)
+                x_block1, z_block1 = convert_profiles(1, raw1)
+                stage_start = convert_stage.record_since(stage_start)
+                if filter_chain:
+                    filter_chain.apply(x_block, z_block)
+                    filter_chain.apply(x_block1, z_block1)
+                    stage_start = filter_stage.record_since(stage_start)
+                x_out, z_out, valid = filter_transform_kernel.process(x_block, z_block, x_block1, z_block1, profile_angles)
+                transform_stage.record_since(stage_start)
+                yield from emit(x_out, z_out, valid, profile_angles)
+
+        while in_flight and processing_pool.ready():
+            yield from emit_pool_result()
+
+        # Hand back profiles that were dropped without a partner
+        for sensor, ring in enumerate(rings):
+            settled = profile_pairer.settled(sensor)
+            if settled >= ring.read_seq:
+                ring.release(settled)
+
+# Everything is set up, so the time to the first profile is the pipeline's own
+wait_for_start()
+measurement_start = time.perf_counter()
+measurement_cpu_start = time.process_time()
+
+if replay_file is not None:
+    replay_source = ReplaySource(replay_file, replay_profile, realtime=replay_realtime)
+    replay_source.start()
+    print(f"Replay of {replay_file} started!")
+else:
+    start_transfer()
+    print("Measurement of both sensors started!")
+print(f"Started {measurement_start - process_start:.2f} s after launch")
+
+# Acquisition and processing run at sensor rate on their own thread, the plot only samples the newest frame
+processing_worker = ProcessingWorker(data_gen, maxlen=processing_queue_size)
+processing_worker.start()
+
+telemetry.gauge("overruns_sensor1", lambda: profile_ring.overruns)
+telemetry.gauge("overruns_sensor2", lambda: profile_ring1.overruns)
+telemetry.gauge("invalid_transfers_sensor1", lambda: profile_ring.invalid_transfers)
+telemetry.gauge("invalid_transfers_sensor2", lambda: profile_ring1.invalid_transfers)
+telemetry.gauge("unpaired_sensor1", lambda: profile_pairer.dropped[0])
+telemetry.gauge("unpaired_sensor2", lambda: profile_pairer.dropped[1])
+telemetry.gauge("queue_dropped", lambda: processing_worker.dropped)
+telemetry.gauge("lost_sensor1", lambda: gap_detectors[0].lost)
+telemetry.gauge("lost_sensor2", lambda: gap_detectors[1].lost)
+if profile_bus is not None:
+    telemetry.gauge("bus_max_lag", lambda: max((consumer["lag"] for consumer in profile_bus.consumers()), default=0))
+    telemetry.gauge("bus_dropped", lambda: sum(consumer["dropped"] for consumer in profile_bus.consumers()))
+if telemetry_port is not None:
+    host, port = telemetry.serve(telemetry_port)
+    print(f"Metrics at http://{host}:{port}/metrics")
 
-ani = animation.FuncAnimation(fig, update, frames=data_gen, interval=10, blit=False, cache_frame_data=False)
+# Start the terminal display in a separate thread
+terminal_thread = threading.Thread(target=update_terminal_display, daemon=True)
+terminal_thread.start()
 
-plt.show()
+def set_idle_time(idle_us):
+    """Set the idle time of both sensors, in µs."""
+    for device in (hLLT, hLLT1):
+        ret = llt.set_feature(device, llt.FEATURE_FUNCTION_IDLE_TIME, encode_time_code(idle_us))
+        if ret < 1:
+            raise ValueError("Error setting idle time: " + str(ret))
+    # The sensors switch over a few profiles apart, which shifts the offset between their counters
+    profile_pairer.resync()
+
+def run_frequency_tuner():
+    """Feed the lost and unpaired profiles to the frequency tuner until cleanup."""
+    while not tuner_stop.wait(0.25):
+        lost = sum(detector.lost for detector in gap_detectors) + sum(profile_pairer.dropped)
+        try:
+            frequency_tuner.update(lost)
+        except ValueError as e:
+            print(f"\nFrequency tuner stopped: {e}")
+            return
+
+tuner_stop = threading.Event()
+if auto_frequency and replay_file is None:
+    frequency_tuner = FrequencyTuner(set_idle_time, decode_time_code(exposure_time_units), decode_time_code(idle_time_units),
+                                     min_idle_us=auto_frequency_min_idle_us, window=auto_frequency_window,
+                                     log=lambda message: print("\n" + message))
+    telemetry.gauge("profile_frequency_hz", frequency_tuner.frequency)
+    tuner_thread = threading.Thread(target=run_frequency_tuner, name="frequency-tuner", daemon=True)
+    tuner_thread.start()
+
+def run_plot():
+    """Show the live plot until its window is closed."""
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 10))
+
+    ax1.set_title("Top Laser Profile (Sensor 1)")
+    ax1.set_xlabel("X Coordinate (mm)")
+    ax1.set_ylabel("Z Coordinate (mm)")
+    ax1.set_aspect('equal')
+    ax1.grid(True)
+
+    ax2.set_title("Bottom Laser Profile (Sensor 2)")
+    ax2.set_xlabel("X Coordinate (mm)")
+    ax2.set_ylabel("Z Coordinate (mm)")
+    ax2.set_aspect('equal')
+    ax2.grid(True)
+
+    # Add a timer text in the first subplot
+    timer_text = ax1.text(0.02, 0.95, '', transform=ax1.transAxes, fontsize=12, color="red", animated=True)
+
+    # A fixed ring of artists per sensor, so drawing a frame costs the same after hours as after seconds
+    profile_window_top = ProfileWindow(ax1, plot_window_profiles, plot_point_budget)
+    profile_window_bottom = ProfileWindow(ax2, plot_window_profiles, plot_point_budget)
+    plot_artists = profile_window_top.lines + profile_window_bottom.lines + [timer_text]
+
+    def update(data):
+        start = time.perf_counter()
+        if data is not None:
+            (x_transformed, z_transformed), (x_transformed1, z_transformed1) = data
+            rescaled = profile_window_top.push(x_transformed, z_transformed)
+            rescaled = profile_window_bottom.push(x_transformed1, z_transformed1) or rescaled
+            if rescaled:
+                # Ticks and grid are part of the blitted background, so new limits need one full redraw
+                fig.canvas.draw()
+
+        # Calculate the elapsed time
+        elapsed_time = time.time() - start_time
+        timer_text.set_text(f"Elapsed Time: {elapsed_time:.2f} s")
+        # Blitting the returned artists happens after this, so the stage covers the data update and rescaling
+        plot_stage.record(time.perf_counter() - start)
+        return plot_artists
+
+    def latest_frame():
+        while True:
+            try:
+                yield processing_worker.latest(timeout=plot_interval / 1000)
+            except RuntimeError as e:
+                # Processing is gone, a frozen plot would hide that
+                print(f"\n{e}")
+                plt.close(fig)
+                return
+
+    ani = animation.FuncAnimation(fig, update, frames=latest_frame, interval=plot_interval, blit=True, cache_frame_data=False)
+
+    plt.show()
+
+stop_requested = threading.Event()
+
+def run_headless():
+    """Process without a plot until SIGINT/SIGTERM, the --duration has passed or a replay is done."""
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: stop_requested.set())
+    deadline = None if args.duration is None else measurement_start + args.duration
+    last_count = -1
+    while not stop_requested.wait(0.5):
+        if processing_worker.error is not None or (deadline is not None and time.perf_counter() >= deadline):
+            break
+        if replay_file is not None and not replay_source.is_alive():
+            # Done once no more replayed profiles come out of processing
+            if profile_count == last_count:
+                break
+            last_count = profile_count
+
+if headless:
+    run_headless()
+else:
+    run_plot()
 
 def cleanup():
-    ret = llt.transfer_profiles(hLLT, llt.TTransferProfileType.NORMAL_TRANSFER, 0)
-    if ret < 1:
-        print("Error stopping transfer profiles for Sensor 1")
-    ret = llt.transfer_profiles(hLLT1, llt.TTransferProfileType.NORMAL_TRANSFER, 0)
-    if ret < 1:
-        print("Error stopping transfer profiles for Sensor 2")
-    llt.disconnect(hLLT)
-    llt.disconnect(hLLT1)
-    llt.del_device(hLLT)
-    llt.del_device(hLLT1)
-
-    # Disconnect from OPC UA server
-    opc_client.disconnect()
-    print("Cleanup completed, sensors disconnected and OPC UA server disconnected.")
+    tuner_stop.set()
+    poll_stop.set()
+    if poll_thread is not None:
+        # The thread may be inside get_actual_profile on the handles that are closed below
+        poll_thread.join()
+    processing_worker.stop()
+    if replay_file is not None:
+        replay_source.stop()
+        print(f"\nReplay: {replay_source.stats()}")
+    else:
+        ret = llt.transfer_profiles(hLLT, transfer_type, 0)
+        if ret < 1:
+            print("Error stopping transfer profiles for Sensor 1")
+        ret = llt.transfer_profiles(hLLT1, transfer_type, 0)
+        if ret < 1:
+            print("Error stopping transfer profiles for Sensor 2")
+        llt.disconnect(hLLT)
+        llt.disconnect(hLLT1)
+        llt.del_device(hLLT)
+        llt.del_device(hLLT1)
+
+    if profile_recorder is not None:
+        profile_recorder.close()
+        print(f"Recorded {profile_recorder.records} profiles to {record_file}")
+
+    print(f"\nRing overruns: Sensor 1 {profile_ring.overruns}, Sensor 2 {profile_ring1.overruns}")
+    if profile_ring.invalid_transfers or profile_ring1.invalid_transfers:
+        print(f"Rejected containers that are not a whole number of profiles: Sensor 1 {profile_ring.invalid_transfers},"
+              f" Sensor 2 {profile_ring1.invalid_transfers}; check the container size")
+    print(f"Lost profiles: Sensor 1 {gap_detectors[0].stats()}, Sensor 2 {gap_detectors[1].stats()}")
+    if acquisition_mode == "polling" and replay_file is None:
+        print(f"Dropped by pyllt before polling: Sensor 1 {telemetry.counters.get(poll_lost_counters[0], 0)},"
+              f" Sensor 2 {telemetry.counters.get(poll_lost_counters[1], 0)}")
+    profiles = sum(telemetry.counters.get(name, 0) for name in profile_counters)
+    cpu = time.process_time() - measurement_cpu_start
+    if acquisition_mode == "polling" and replay_file is None:
+        polls = sum(telemetry.counters.get(name, 0) for name in poll_counters)
+        transfers = f"polling, {polls} polls with new profiles"
+    else:
+        mode = f"containers of {container_profiles}" if container_profiles and replay_file is None else "one profile per callback"
+        callbacks = sum(telemetry.counters.get(name, 0) for name in callback_counters)
+        transfers = f"{mode}, {callbacks} callbacks"
+    print(f"Transfer: {transfers} for {profiles} profiles,"
+          f" {cpu:.1f} s CPU ({1e6 * cpu / max(profiles, 1):.0f} µs per profile)")
+    if auto_frequency and replay_file is None:
+        print(f"Profile frequency: {frequency_tuner.frequency():.0f} Hz after {len(frequency_tuner.decisions)} tuner decisions")
+    print(f"Profile pairing: {profile_pairer.stats()}")
+    print(f"Processing queue: {processing_worker.stats()}")
+    if filter_chain:
+        print(f"Filter chain: {filter_chain.stats()}")
+    if processing_pool is not None:
+        print(f"Processing pool: {processing_pool.stats()}")
+        processing_pool.close()
+    if profile_bus is not None:
+        print(f"Profile bus: {profile_bus.stats()}")
+
+    telemetry.close()
+    for name, stage in telemetry.snapshot()["stages"].items():
+        if stage["count"]:
+            quantiles = ", ".join(f"p{100 * float(q):g} {1e3 * value:.3f}" for q, value in stage["quantiles_s"].items())
+            print(f"Stage {name}: {stage['count']} x, {quantiles} ms")
+    if telemetry_file is not None:
+        telemetry.dump(telemetry_file)
+        print(f"Telemetry written to {telemetry_file}")
+    if profile_bus is not None:
+        # After the last snapshot, which reads the bus gauges
+        profile_bus.close()
+
+    if replay_file is None:
+        # Disconnect from OPC UA server
+        motor_position.stop()
+        opc_client.disconnect()
+        print("Cleanup completed, sensors disconnected and OPC UA server disconnected.")
 
 cleanup()
@@ -0,0 +1,119 @@
+import threading
+import time
+
+
+class DeviceBringUp:
+    """Run the setup steps of several devices at once, one thread per device.
+
+    Every device gets a list of steps (name, function) or (name, function,
+    undo). The steps of one device run in order on its own thread, each
+    function is called with the results of the device's earlier steps by
+    step name, so the network round trips of different devices overlap
+    instead of adding up. Every step is timed.
+
+    If a step of any device raises, or not all devices are done within
+    `timeout` seconds, the remaining steps of all devices are skipped and
+    every device undoes the steps it completed, newest first. run() then
+    raises, so no device is left half configured. A device whose step is
+    still blocked at the timeout undoes its steps as soon as that step
+    returns.
+    """
+
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+        self.devices = {}
+        self.results = {}
+        self.timing = {}
+        self.errors = {}
+        self.undo_errors = {}
+        self.elapsed = 0.0
+        self._failed = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, device, steps):
+        self.devices[device] = [step if len(step) == 3 else (step[0], step[1], None) for step in steps]
+        self.results[device] = {}
+        self.timing[device] = {}
+
+    def run(self):
+        """Set up all devices; returns {device: {step: result}} or raises RuntimeError after undoing everything."""
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._run_device, args=(device,), name=f"bring-up {device}", daemon=True)
+                   for device in self.devices]
+        for thread in threads:
+            thread.start()
+        deadline = start + self.timeout
+        for thread in threads:
+            thread.join(max(deadline - time.perf_counter(), 0.0))
+        self.elapsed = time.perf_counter() - start
+
+        # Threads that finished their steps wait for the others, so only a step still running counts as hung
+        hung = [device for device, thread in zip(self.devices, threads)
+                if thread.is_alive() and self._current_step(device) is not None]
+        if hung:
+            with self._lock:
+                for device in hung:
+                    self.errors[device] = TimeoutError(f"{self._current_step(device)} did not finish within {self.timeout:.1f} s")
+            self._failed.set()
+            # Devices that are not blocked undo their steps right away
+            for device, thread in zip(self.devices, threads):
+                if device not in hung:
+                    thread.join()
+        if self.errors:
+            raise RuntimeError("Error bringing up " + ", ".join(f"{device} ({error!r})" for device, error in self.errors.items())) \
+                from next(iter(self.errors.values()))
+        return self.results
+
+    def _current_step(self, device):
+        """Name of the step the device is at, None once it finished or gave up."""
+        if device in self.errors:
+            return None
+        done = self.timing[device]
+        for name, _, _ in self.devices[device]:
+            if name not in done:
+                return name
+        return None
+
+    def _run_device(self, device):
+        results = self.results[device]
+        completed = []
+        for name, function, undo in self.devices[device]:
+            if self._failed.is_set():
+                break
+            start = time.perf_counter()
+            try:
+                results[name] = function(results)
+            except Exception as e:
+                with self._lock:
+                    self.errors[device] = e
+                self._failed.set()
+                break
+            finally:
+                self.timing[device][name] = time.perf_counter() - start
+            completed.append((name, undo))
+
+        # Wait for the other devices, then undo everything if any of them failed
+        while not self._failed.is_set() and not self._all_done():
+            self._failed.wait(0.01)
+        if self._failed.is_set():
+            for name, undo in reversed(completed):
+                if undo is None:
+                    continue
+                try:
+                    undo(results)
+                except Exception as e:
+                    self.undo_errors.setdefault(device, []).append((name, e))
+
+    def _all_done(self):
+        return all(len(self.timing[device]) == len(steps) for device, steps in self.devices.items())
+
+    def report(self):
+        """One line per device with the time of every step."""
+        lines = [f"Bring-up: {1e3 * self.elapsed:.0f} ms"]
+        for device, timing in self.timing.items():
+            steps = ", ".join(f"{name} {1e3 * seconds:.0f} ms" for name, seconds in timing.items())
+            status = f" FAILED: {self.errors[device]!r}" if device in self.errors else ""
+            if device in self.undo_errors:
+                status += " (undo failed: " + ", ".join(f"{name}: {e!r}" for name, e in self.undo_errors[device]) + ")"
+            lines.append(f"  {device}: {steps}{status}")
+        return "\n".join(lines)
@@ -0,0 +1,129 @@
+import time
+import numpy as np
+
+# The stages import scipy when they first run, so a chain without enabled stages does not load it
+
+# Stage defaults; a config entry only needs "stage" and whatever it changes
+STAGE_DEFAULTS = {
+    "zscore": {"threshold": 3.0},
+    "median": {"kernel_size": 3},
+    "savgol": {"window_size": 5, "poly_order": 3},
+    "gaussian": {"sigma": 1.0},
+}
+
+
+def _zscore(z, count, threshold):
+    """Mask of the points to keep: |z - mean| / std < threshold, per profile over its valid points."""
+    inside = np.arange(z.shape[1]) < count[:, np.newaxis]
+    n = np.maximum(count, 1)[:, np.newaxis]
+    mean = np.where(inside, z, 0.0).sum(axis=1, keepdims=True) / n
+    deviation = np.where(inside, z - mean, 0.0)
+    std = np.sqrt((deviation ** 2).sum(axis=1, keepdims=True) / n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        keep = np.abs(deviation) / std < threshold
+    # Like remove_outliers_with_zscore, profiles without variation are kept as they are
+    keep |= (std == 0.0) | (count[:, np.newaxis] < 2)
+    return keep & inside
+
+
+def _median(z, count, kernel_size):
+    from scipy.ndimage import median_filter
+    return median_filter(z, size=(1, kernel_size), mode="nearest")
+
+
+def _savgol(z, count, window_size, poly_order):
+    from scipy.signal import savgol_filter
+    smoothed = savgol_filter(z, window_size, poly_order, axis=1, mode="nearest")
+    # Profiles shorter than the window stay unsmoothed, like smooth_data_with_savgol
+    short = count < window_size
+    smoothed[short] = z[short]
+    return smoothed
+
+
+def _gaussian(z, count, sigma):
+    from scipy.ndimage import gaussian_filter1d
+    return gaussian_filter1d(z, sigma, axis=1, mode="nearest")
+
+
+STAGES = {"zscore": _zscore, "median": _median, "savgol": _savgol, "gaussian": _gaussian}
+
+
+class FilterChain:
+    """Outlier removal and smoothing of z over a (profiles, points) block.
+
+    The chain is a list of stage configs applied in order, e.g.
+
+        [{"stage": "zscore", "threshold": 3}, {"stage": "median", "kernel_size": 3, "enabled": False}]
+
+    Disabled stages are dropped when the chain is built, so a chain without
+    enabled stages returns immediately. Dropouts (x or z == 0) are moved
+    behind the valid points of each profile and the gap is padded with the
+    last valid value, so every stage runs along axis=1 on the whole block
+    and sees the valid points as consecutive samples, like the 1D
+    functions on a filtered profile. Removed outliers get z = 0, the
+    dropout value that filter_laser_data and the kernel drop.
+    """
+
+    def __init__(self, stages=()):
+        self.stages = []
+        for config in stages:
+            config = dict(config)
+            name = config.pop("stage")
+            if name not in STAGES:
+                raise ValueError("Unknown filter stage: " + str(name))
+            if not config.pop("enabled", True):
+                continue
+            params = dict(STAGE_DEFAULTS[name])
+            params.update(config)
+            self.stages.append((name, STAGES[name], params))
+        # "total" includes moving the dropouts out of the way and back
+        self.timing = {name: {"calls": 0, "profiles": 0, "seconds": 0.0} for name, _, _ in self.stages + [("total", None, None)]}
+
+    def __bool__(self):
+        return bool(self.stages)
+
+    def apply(self, x, z, filter_value=0.0):
+        """Filter z of the (K, points) blocks in place; z of dropouts and removed points is set to `filter_value`."""
+        if not self.stages or not len(z):
+            return x, z
+        chain_start = time.perf_counter()
+        valid = (x != filter_value) & (z != filter_value)
+        order, count, zc = self._compact(z, valid)
+        for name, stage, params in self.stages:
+            start = time.perf_counter()
+            if name == "zscore":
+                keep = stage(zc, count, **params)
+                # Drop the outliers and close the gaps they leave for the following stages
+                inner, count, zc = self._compact(zc, keep)
+                order = np.take_along_axis(order, inner, axis=1)
+            else:
+                zc = stage(zc, count, **params)
+            self._count_time(name, len(z), start)
+
+        # The padding goes back to the dropouts and removed points, as filter_value
+        np.copyto(zc, filter_value, where=np.arange(z.shape[1]) >= count[:, np.newaxis])
+        np.put_along_axis(z, order, zc, axis=1)
+        self._count_time("total", len(z), chain_start)
+        return x, z
+
+    def _count_time(self, name, profiles, start):
+        timing = self.timing[name]
+        timing["calls"] += 1
+        timing["profiles"] += profiles
+        timing["seconds"] += time.perf_counter() - start
+
+    def _compact(self, z, valid):
+        """Valid points of each row first, in order, padded with the last valid value."""
+        order = np.argsort(~valid, axis=1, kind="stable")
+        count = np.count_nonzero(valid, axis=1)
+        zc = np.take_along_axis(z, order, axis=1)
+        last = zc[np.arange(len(zc)), np.maximum(count - 1, 0)]
+        padding = np.arange(z.shape[1]) >= count[:, np.newaxis]
+        np.copyto(zc, last[:, np.newaxis], where=padding)
+        return order, count, zc
+
+    def stats(self):
+        """Per stage: calls, profiles and the mean time per profile in µs."""
+        return {name: {"calls": timing["calls"], "profiles": timing["profiles"],
+                       "us_per_profile": 1e6 * timing["seconds"] / timing["profiles"] if timing["profiles"] else 0.0}
+                for name, timing in self.timing.items()}
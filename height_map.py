@@ -0,0 +1,96 @@
+import numpy as np
+
+# count (int32) + sum, min and max (float64) per cell
+CELL_BYTES = 4 + 3 * 8
+
+
+class HeightMap:
+    """Cylindrical raster of one rotation: motor angle bin x axial bin.
+
+    Each cell keeps the count, sum, min and max of the values (e.g. radius)
+    of the points that fell into it. All points of a profile share the
+    profile's motor angle, so `update()` touches a single angle row and
+    costs O(points + axial_bins) with bincount and ufunc.at scatters.
+
+    `reset()` is O(1): every row carries the number of the rotation it was
+    last written in, and rows of older rotations are cleared lazily the
+    next time they are written and read as empty until then. With
+    `max_bytes` both bin counts are scaled down together until the raster
+    fits.
+    """
+
+    def __init__(self, angle_bins=720, axial_bins=512, axial_range=(0.0, 1.0), max_bytes=None):
+        if max_bytes is not None and angle_bins * axial_bins * CELL_BYTES > max_bytes:
+            scale = np.sqrt(max_bytes / (angle_bins * axial_bins * CELL_BYTES))
+            angle_bins = max(int(angle_bins * scale), 1)
+            axial_bins = max(int(axial_bins * scale), 1)
+        self.angle_bins = angle_bins
+        self.axial_bins = axial_bins
+        self.axial_range = axial_range
+        self._count = np.zeros((angle_bins, axial_bins), dtype=np.int32)
+        self._sum = np.zeros((angle_bins, axial_bins))
+        self._min = np.full((angle_bins, axial_bins), np.inf)
+        self._max = np.full((angle_bins, axial_bins), -np.inf)
+        self._row_rotation = np.zeros(angle_bins, dtype=np.int64)
+        self.rotation = 1
+        self.profiles = 0
+
+    @property
+    def nbytes(self):
+        return self._count.nbytes + self._sum.nbytes + self._min.nbytes + self._max.nbytes + self._row_rotation.nbytes
+
+    def reset(self):
+        self.rotation += 1
+        self.profiles = 0
+
+    def angle_bin(self, angle_deg):
+        return int(angle_deg % 360.0 * self.angle_bins / 360.0) % self.angle_bins
+
+    def update(self, angle_deg, axial, values):
+        """Add the points of one profile recorded at `angle_deg`; `axial` and `values` are per point."""
+        row = self.angle_bin(angle_deg)
+        if self._row_rotation[row] != self.rotation:
+            self._count[row] = 0
+            self._sum[row] = 0.0
+            self._min[row] = np.inf
+            self._max[row] = -np.inf
+            self._row_rotation[row] = self.rotation
+        self.profiles += 1
+        if not len(values):
+            return
+        low, high = self.axial_range
+        columns = ((np.asarray(axial) - low) * (self.axial_bins / (high - low))).astype(np.intp)
+        inside = (columns >= 0) & (columns < self.axial_bins)
+        if not inside.all():
+            columns = columns[inside]
+            values = np.asarray(values)[inside]
+        self._count[row] += np.bincount(columns, minlength=self.axial_bins).astype(np.int32)
+        self._sum[row] += np.bincount(columns, weights=values, minlength=self.axial_bins)
+        np.minimum.at(self._min[row], columns, values)
+        np.maximum.at(self._max[row], columns, values)
+
+    def _current(self):
+        return (self._row_rotation == self.rotation)[:, np.newaxis]
+
+    def count(self):
+        return np.where(self._current(), self._count, 0)
+
+    def filled(self):
+        """Cells with at least one point in this rotation."""
+        return self.count() > 0
+
+    def mean(self):
+        """Mean value per cell, NaN where the cell is empty."""
+        count = self.count()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, self._sum / count, np.nan)
+
+    def min(self):
+        return np.where(self.filled(), self._min, np.nan)
+
+    def max(self):
+        return np.where(self.filled(), self._max, np.nan)
+
+    def coverage(self):
+        """Fraction of cells with data."""
+        return self.filled().mean()
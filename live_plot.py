@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class ProfileWindow:
+    """The last `profiles` profiles on one axis, drawn with a fixed set of animated Line2D artists.
+
+    Each new profile replaces the oldest one in a ring of artists, so the
+    number of artists and points on the axis stays the same however long
+    the measurement runs, and the artists can be blitted. Profiles are
+    strided down to `point_budget / profiles` points. The axis limits are
+    only changed when the window's data leaves them or fills less than
+    half of them; `push()` then reports that the background has to be
+    redrawn.
+    """
+
+    def __init__(self, ax, profiles=32, point_budget=8192, margin=0.05, style=".", **kwargs):
+        self.ax = ax
+        self.max_points = max(point_budget // profiles, 1)
+        self.margin = margin
+        kwargs.setdefault("markersize", 1)
+        self.lines = [ax.plot([], [], style, animated=True, **kwargs)[0] for _ in range(profiles)]
+        # x min, x max, z min, z max per artist; empty artists do not count
+        self.bounds = np.full((profiles, 4), np.nan)
+        self.next = 0
+        self.limits = None
+
+    def push(self, x, z):
+        """Show a profile in place of the oldest one; returns True if the axis limits changed."""
+        step = -(-len(x) // self.max_points) if len(x) > self.max_points else 1
+        x = x[::step]
+        z = z[::step]
+        self.lines[self.next].set_data(x, z)
+        if len(x):
+            self.bounds[self.next] = (x.min(), x.max(), z.min(), z.max())
+        else:
+            self.bounds[self.next] = np.nan
+        self.next = (self.next + 1) % len(self.lines)
+        return self._rescale()
+
+    def _rescale(self):
+        if np.isnan(self.bounds[:, 0]).all():
+            return False
+        x_min, z_min = np.nanmin(self.bounds[:, [0, 2]], axis=0)
+        x_max, z_max = np.nanmax(self.bounds[:, [1, 3]], axis=0)
+        if self.limits is not None:
+            lx_min, lx_max, lz_min, lz_max = self.limits
+            inside = lx_min <= x_min and x_max <= lx_max and lz_min <= z_min and z_max <= lz_max
+            # Shrink only when the data got much smaller, so the limits do not follow every profile
+            filled = (x_max - x_min) >= 0.5 * (lx_max - lx_min) or (z_max - z_min) >= 0.5 * (lz_max - lz_min)
+            if inside and filled:
+                return False
+        x_pad = max(x_max - x_min, 1.0) * self.margin
+        z_pad = max(z_max - z_min, 1.0) * self.margin
+        self.limits = (x_min - x_pad, x_max + x_pad, z_min - z_pad, z_max + z_pad)
+        self.ax.set_xlim(self.limits[0], self.limits[1])
+        self.ax.set_ylim(self.limits[2], self.limits[3])
+        return True
@@ -0,0 +1,84 @@
+import numpy as np
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+
+def strides_for_budget(profiles, points, budget):
+    """Profile step k and point step s so that about `budget` points of a (profiles, points) capture are kept."""
+    factor = profiles * points / max(budget, 1)
+    if factor <= 1:
+        return 1, 1
+    # Thin both directions alike, so neither profile spacing nor point spacing dominates the view
+    k = int(np.ceil(np.sqrt(factor)))
+    s = int(np.ceil(factor / k))
+    return k, min(s, points)
+
+
+def decimate_strides(x, z, budget):
+    """Every k-th profile and every s-th point; returns the (rows, cols) x, z and the profile number of each row."""
+    k, s = strides_for_budget(x.shape[0], x.shape[1], budget)
+    return x[::k, ::s], z[::k, ::s], np.arange(0, x.shape[0], k)
+
+
+def voxel_thin(x, y, z, budget, iterations=8):
+    """Indices of one point per occupied voxel, with the voxel size tuned until about `budget` points remain."""
+    points = np.column_stack((x, y, z))
+    if len(points) <= budget:
+        return np.arange(len(points))
+    # Voxels are cubes in the bounding box scaled to a unit cube, since y counts profiles and x/z are mm
+    low = points.min(axis=0)
+    points = (points - low) / np.maximum(points.max(axis=0) - low, 1e-9)
+    # Start from a grid with `budget` cells, then rescale by the occupancy found
+    size = budget ** (-1.0 / 3.0)
+    keep = np.arange(len(points))
+    for _ in range(iterations):
+        cells = np.floor(points / size).astype(np.int64)
+        dims = cells.max(axis=0) + 1
+        keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+        _, keep = np.unique(keys, return_index=True)
+        if 0.8 * budget <= len(keep) <= budget:
+            break
+        # Occupied cells scale with the surface, i.e. with size**-2
+        size *= np.sqrt(len(keep) / budget)
+    return np.sort(keep)
+
+
+def plot_profiles_3d(ax, x, z, budget=200000, method="stride", cmap="viridis", invalid=0.0):
+    """Draw a capture of (N, resolution) x/z profiles on a 3D axis with profile number as y.
+
+    "stride" keeps every k-th profile and every s-th point and draws the
+    profiles as one Line3DCollection; "voxel" strides down to 8x the budget,
+    keeps one point per voxel and draws one scatter. Either way at most about `budget` points reach
+    matplotlib, however long the capture was. Points with x and z equal to
+    `invalid` are left out. Returns the artist.
+    """
+    x = np.asarray(x, dtype=float)
+    z = np.asarray(z, dtype=float)
+    if x.ndim != 2 or not len(x):
+        return None
+    if method == "stride":
+        xs, zs, rows = decimate_strides(x, z, budget)
+        xs = np.where((xs == invalid) & (zs == invalid), np.nan, xs)
+        segments = np.stack((xs, np.broadcast_to(rows[:, np.newaxis], xs.shape), zs), axis=-1)
+        artist = Line3DCollection(segments, cmap=cmap, linewidths=0.5)
+        artist.set_array(rows.astype(float))
+        artist.set_clim(0, len(x))
+        ax.add_collection3d(artist)
+    elif method == "voxel":
+        # A stride pass first bounds the cost of sorting voxel keys on very long captures
+        xs, zs, rows = decimate_strides(x, z, 8 * budget)
+        valid = ~((xs == invalid) & (zs == invalid))
+        row, _ = np.nonzero(valid)
+        profile = rows[row]
+        xs, zs = xs[valid], zs[valid]
+        keep = voxel_thin(xs, profile.astype(float), zs, budget)
+        artist = ax.scatter(xs[keep], profile[keep], zs[keep], c=profile[keep], cmap=cmap, vmin=0, vmax=len(x),
+                            s=0.5, depthshade=False)
+    else:
+        raise ValueError("Unknown decimation method: " + str(method))
+
+    valid = ~((x == invalid) & (z == invalid))
+    if valid.any():
+        ax.set_xlim(x[valid].min(), x[valid].max())
+        ax.set_zlim(z[valid].min(), z[valid].max())
+    ax.set_ylim(0, len(x))
+    return artist
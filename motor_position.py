@@ -0,0 +1,165 @@
+import threading
+import time
+import numpy as np
+
+POSITION_NODE = "ns=6;s=::Handling:instJS_MC_ReadActualPosition.Position"
+COUNTS_PER_REVOLUTION = 120000
+
+
+class MotorPositionService:
+    """Motor position from an OPC UA data change subscription.
+
+    Every notification is stored with the time the server sampled it (its
+    source timestamp) in a window of the last `history` samples. The
+    notifications arrive in bursts, several milliseconds late, so their
+    receive time is no time base for interpolation; instead the server clock
+    is mapped onto the host clock (time.perf_counter) with a SensorClock,
+    from the samples that arrived fastest. Positions are unwrapped across
+    the turn boundary so `position_at()` can interpolate between any two
+    samples and never has to go to the server on the profile hot path.
+    """
+
+    def __init__(self, client, node_id=POSITION_NODE, period_ms=5, history=1024,
+                 counts_per_revolution=COUNTS_PER_REVOLUTION, max_extrapolation=0.02, velocity_window=0.05):
+        self.client = client
+        self.node_id = node_id
+        self.period_ms = period_ms
+        self.history = history
+        self.counts_per_revolution = counts_per_revolution
+        self.max_extrapolation = max_extrapolation
+        self.velocity_window = velocity_window
+        # Twice the history so the window stays contiguous; it is moved to the front when the end is reached
+        self.times = np.zeros(2 * history)
+        self.positions = np.zeros(2 * history)
+        self.start_index = 0
+        self.end_index = 0
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.clock = SensorClock(window=4 * history, wrap=0)
+        self._last_raw = None
+        self._turns = 0
+        self._stamp_epoch = None
+        self._subscription = None
+
+    def start(self):
+        """Seed the history with one synchronous read, then subscribe to position changes."""
+        node = self.client.get_node(self.node_id)
+        value = node.get_data_value()
+        self.add_sample(value.Value.Value, self._sample_time(value, time.perf_counter()))
+        self._subscription = self.client.create_subscription(self.period_ms, self)
+        self._subscription.subscribe_data_change(node)
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.delete()
+            self._subscription = None
+
+    def datachange_notification(self, node, val, data):
+        self.add_sample(val, self._sample_time(data.monitored_item.Value, time.perf_counter()))
+
+    def _sample_time(self, value, arrival_time):
+        """Server time of a sample in seconds, from its source or else server timestamp; the receive time without either."""
+        stamp = value.SourceTimestamp or value.ServerTimestamp
+        if stamp is None:
+            return arrival_time
+        if self._stamp_epoch is None:
+            self._stamp_epoch = stamp
+        sample_time = (stamp - self._stamp_epoch).total_seconds()
+        self.clock.update(sample_time, arrival_time)
+        return sample_time
+
+    def add_sample(self, raw_position, sample_time):
+        """Store one position sampled at sample_time on the server clock, or on the host clock if there is no offset."""
+        # Unwrap the position so consecutive samples never jump by a whole turn
+        if self._last_raw is not None:
+            step = raw_position - self._last_raw
+            if step < -self.counts_per_revolution / 2:
+                self._turns += 1
+            elif step > self.counts_per_revolution / 2:
+                self._turns -= 1
+        self._last_raw = raw_position
+        with self.lock:
+            if self.end_index == len(self.times):
+                keep = self.end_index - self.start_index
+                self.times[:keep] = self.times[self.start_index:self.end_index]
+                self.positions[:keep] = self.positions[self.start_index:self.end_index]
+                self.start_index = 0
+                self.end_index = keep
+            self.times[self.end_index] = sample_time
+            self.positions[self.end_index] = raw_position + self._turns * self.counts_per_revolution
+            self.end_index += 1
+            self.start_index = max(self.start_index, self.end_index - self.history)
+            self.samples += 1
+
+    def position_at(self, host_time):
+        """Motor angle in degrees at host_time, interpolated between the neighbouring samples."""
+        # The samples are on the server clock
+        sample_time = host_time if self.clock.offset is None else host_time - self.clock.offset
+        with self.lock:
+            times = self.times[self.start_index:self.end_index]
+            positions = self.positions[self.start_index:self.end_index]
+            if not len(times):
+                return 0.0
+            i = int(np.searchsorted(times, sample_time, side="right"))
+            if i == 0:
+                position = positions[0]
+            elif i < len(times):
+                t0, t1 = times[i - 1], times[i]
+                fraction = (sample_time - t0) / (t1 - t0) if t1 > t0 else 1.0
+                position = positions[i - 1] + fraction * (positions[i] - positions[i - 1])
+            else:
+                # Notifications lag the motor a little, extrapolate over a short gap with the recent velocity.
+                # Notifications arrive in bursts, so the velocity is taken over a window rather than the last two samples.
+                j = int(np.searchsorted(times, times[-1] - self.velocity_window))
+                dt = times[-1] - times[j]
+                velocity = (positions[-1] - positions[j]) / dt if dt > 0 else 0.0
+                position = positions[-1] + velocity * min(sample_time - times[-1], self.max_extrapolation)
+        return (position % self.counts_per_revolution) / self.counts_per_revolution * 360
+
+    def latest(self):
+        """Most recent motor angle in degrees."""
+        with self.lock:
+            if not self.samples:
+                return 0.0
+            position = self.positions[self.end_index - 1]
+        return (position % self.counts_per_revolution) / self.counts_per_revolution * 360
+
+
+class SensorClock:
+    """Map a sensor's shutter time onto host time.
+
+    The offset host arrival time - shutter time is smallest for the profiles
+    that were delivered fastest, so the running minimum over a window is
+    used as the clock offset. The sensor clock wraps every `wrap` seconds;
+    0 for a clock that does not wrap.
+    """
+
+    def __init__(self, window=2000, wrap=128.0):
+        self.window = window
+        self.wrap = wrap
+        self.offset = None
+        self._candidate = np.inf
+        self._count = 0
+        self._epoch = 0.0
+        self._last = None
+
+    def unwrap(self, shutter_time):
+        if self.wrap and self._last is not None and shutter_time < self._last - self.wrap / 2:
+            self._epoch += self.wrap
+        self._last = shutter_time
+        return shutter_time + self._epoch
+
+    def update(self, shutter_time, arrival_time):
+        """Record one profile; return its shutter time on the host clock."""
+        sensor_time = self.unwrap(shutter_time)
+        offset = arrival_time - sensor_time
+        self._candidate = min(self._candidate, offset)
+        self._count += 1
+        if self.offset is None or offset < self.offset:
+            self.offset = offset
+        if self._count >= self.window:
+            # Restart the minimum regularly so the estimate follows clock drift
+            self.offset = self._candidate
+            self._candidate = np.inf
+            self._count = 0
+        return sensor_time + self.offset
@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib.animation as animation
 import pyllt as llt
+from point_store import ProfileStack
+from lod_render import plot_profiles_3d
 
 def profile_callback(data, size, user_data):
     global profile_buffer
@@ -122,8 +124,12 @@ if ret < 1:
 # Warm-up time
 time.sleep(0.1)
 
-# List to store all captured data
-all_data = []
+# All captured profiles, contiguous (N, resolution) x and z
+all_data = ProfileStack(resolution)
+
+# The 3D view shows at most this many points, thinned by profile/point stride or by voxel
+render_point_budget = 200000
+render_method = "stride"  # "stride" draws profile lines, "voxel" draws evenly thinned points
 
 def data_gen():
     while True:
@@ -140,7 +146,7 @@ def data_gen():
         event.clear()
 
         # Store the data
-        all_data.append((x.copy(), z.copy()))
+        all_data.append(x, z)
 
         yield x, z
 
@@ -183,15 +189,8 @@ if ret < 1:
 fig = plt.figure()
 ax = fig.add_subplot(111, projection='3d')
 
-# Convert all_data to a numpy array for easier manipulation
-all_data = np.array(all_data)
-num_profiles = len(all_data)
-
-# Plot each profile with a different color
-for i in range(num_profiles):
-    xs, zs = all_data[i]
-    ys = np.full_like(xs, i)  # Assign y based on the profile number
-    ax.plot(xs, ys, zs, color=plt.cm.viridis(i / num_profiles))
+# One collection of decimated profiles, colored by profile number
+plot_profiles_3d(ax, all_data.x, all_data.z, budget=render_point_budget, method=render_method)
 
 # Set plot labels
 ax.set_xlabel('X')
@@ -0,0 +1,91 @@
+import numpy as np
+
+POINT_DTYPE = np.dtype([("x", "f8"), ("z", "f8"), ("angle", "f8"), ("profile", "u4"), ("sensor", "u1")])
+
+
+class PointStore:
+    """Growable, preallocated array of transformed points for one rotation.
+
+    Appending a profile copies it into the next free rows; the capacity
+    doubles when it runs out, so appends are amortized O(1). `clear()` keeps
+    the allocation for the next rotation and `points()` returns a view of
+    the filled rows, whose fields ("x", "z", ...) are views as well.
+    """
+
+    def __init__(self, capacity=1 << 18):
+        self._data = np.empty(capacity, dtype=POINT_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def append(self, x, z, angle, profile, sensor):
+        """Append the points of one profile, recorded at motor angle `angle` (degrees)."""
+        count = len(x)
+        end = self.size + count
+        if end > len(self._data):
+            self._grow(end)
+        rows = self._data[self.size:end]
+        rows["x"] = x
+        rows["z"] = z
+        rows["angle"] = angle
+        rows["profile"] = profile
+        rows["sensor"] = sensor
+        self.size = end
+
+    def points(self):
+        return self._data[:self.size]
+
+    def clear(self):
+        self.size = 0
+
+    def _grow(self, needed):
+        capacity = len(self._data)
+        while capacity < needed:
+            capacity *= 2
+        data = np.empty(capacity, dtype=POINT_DTYPE)
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+
+
+class ProfileStack:
+    """Whole profiles of a capture in two contiguous (N, resolution) arrays.
+
+    Rows are preallocated and the capacity doubles when it runs out, so a
+    long capture costs one copy per profile and no per-profile objects;
+    `x` and `z` are views of the filled rows.
+    """
+
+    def __init__(self, resolution, capacity=4096):
+        self._x = np.empty((capacity, resolution))
+        self._z = np.empty((capacity, resolution))
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, x, z):
+        if self.size == len(self._x):
+            self._grow()
+        self._x[self.size] = x
+        self._z[self.size] = z
+        self.size += 1
+
+    @property
+    def x(self):
+        return self._x[:self.size]
+
+    @property
+    def z(self):
+        return self._z[:self.size]
+
+    def _grow(self):
+        capacity = 2 * len(self._x)
+        for name in ("_x", "_z"):
+            data = np.empty((capacity, self._x.shape[1]))
+            data[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, data)
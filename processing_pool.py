@@ -0,0 +1,213 @@
+import multiprocessing as mp
+import queue
+import time
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from filter_chain import FilterChain
+from profile_processing import FilterTransformKernel, TrigTable
+
+
+def _attach(names, layout):
+    """Map the pool's shared memory segments as NumPy arrays."""
+    segments = {name: shared_memory.SharedMemory(name=names[name]) for name in layout}
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=segments[name].buf) for name, (shape, dtype) in layout.items()}
+    return segments, arrays
+
+
+def _worker(tasks, done, setup):
+    # The decoders and the shared memory come once the sensors are up; None closes a pool that never got them
+    config = setup.get()
+    if config is None:
+        return
+    names, layout, decoders, chain_config, radius, steps = config
+    segments, arrays = _attach(names, layout)
+    raw, angles = arrays["raw"], arrays["angles"]
+    x_out, z_out, valid = arrays["x"], arrays["z"], arrays["valid"]
+    block, points = raw.shape[2], x_out.shape[3]
+    filter_chain = FilterChain(chain_config)
+    kernel = FilterTransformKernel(points, radius, TrigTable(steps))
+    x_block = np.empty((2, block, points))
+    z_block = np.empty((2, block, points))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, count = task
+            start = time.perf_counter()
+            for sensor in (0, 1):
+                decoders[sensor].decode(raw[slot, sensor, :count], x_block[sensor, :count], z_block[sensor, :count])
+                if filter_chain:
+                    filter_chain.apply(x_block[sensor, :count], z_block[sensor, :count])
+            kernel.process(x_block[0, :count], z_block[0, :count], x_block[1, :count], z_block[1, :count],
+                           angles[slot, :count], out=(x_out[slot, :, :count], z_out[slot, :, :count], valid[slot, :, :count]))
+            done.put((slot, time.perf_counter() - start))
+    finally:
+        del raw, angles, x_out, z_out, valid, arrays
+        for segment in segments.values():
+            segment.close()
+
+
+class ProcessingPool:
+    """Decode, filter and transform profile blocks on several processes.
+
+    Raw blocks of both sensors are copied into a slot of a shared memory
+    ring, the workers decode them, run the filter chain and the
+    FilterTransformKernel and write x, z and the validity mask into the
+    same slot of shared output arrays; only (slot, count) tuples go
+    through the queues. `submit()` returns a ticket and `result()` hands
+    the blocks back strictly in ticket order, so downstream processing
+    sees the pairs in sequence whatever worker finished first. The views
+    returned by `result()` stay valid until `release()`.
+
+    Workers are started with fork where the platform has it, so the
+    calling script is not imported again; spawn (Windows) imports the
+    main module in every worker. Forking a process whose other threads
+    hold locks can deadlock the children, so the workers can be forked
+    first, before any thread is started, and get the decoders and
+    buffers later with configure(), once the sensors are up.
+    """
+
+    def __init__(self, decoders=None, points=None, raw_size=None, radius=None, chain_config=(), workers=None, block=32,
+                 slots=None, steps=120000, start_method=None):
+        self.workers = workers or mp.cpu_count()
+        self.block = block
+        self.slots = slots or 2 * self.workers
+        self.points = points
+        self._segments = {}
+        self._arrays = {}
+
+        if start_method is None:
+            start_method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        context = mp.get_context(start_method)
+        # Forked workers share the tracker only if it runs before the fork; one of their own would unlink the
+        # segments when they exit
+        resource_tracker.ensure_running()
+        self._tasks = context.Queue()
+        self._done = context.Queue()
+        # Pipes without a feeder thread, one per worker, so every worker gets the configuration exactly once
+        self._setup = [context.SimpleQueue() for _ in range(self.workers)]
+        self._processes = [context.Process(target=_worker, name=f"processing-{i}", daemon=True,
+                                           args=(self._tasks, self._done, self._setup[i]))
+                           for i in range(self.workers)]
+        for process in self._processes:
+            process.start()
+        if decoders is not None:
+            self.configure(decoders, points, raw_size, radius, chain_config, steps)
+
+        self._free = deque(range(self.slots))
+        self._slot_of = {}
+        self._count = {}
+        self._finished = set()
+        self.next_ticket = 0
+        self.next_result = 0
+        self.submitted = 0
+        self.completed = 0
+        self.busy = 0.0
+        self.started = time.perf_counter()
+
+    def configure(self, decoders, points, raw_size, radius, chain_config=(), steps=120000):
+        """Allocate the shared buffers for profiles of `points` points and hand them and the decoders to the workers."""
+        if self._segments:
+            raise RuntimeError("Processing pool is already configured")
+        self.points = points
+        block = self.block
+        layout = {"raw": ((self.slots, 2, block, raw_size), np.uint8),
+                  "angles": ((self.slots, block), np.float64),
+                  "x": ((self.slots, 2, block, points), np.float64),
+                  "z": ((self.slots, 2, block, points), np.float64),
+                  "valid": ((self.slots, 2, block, points), np.bool_)}
+        self._segments = {name: shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+                          for name, (shape, dtype) in layout.items()}
+        self._arrays = {name: np.ndarray(shape, dtype=dtype, buffer=self._segments[name].buf)
+                        for name, (shape, dtype) in layout.items()}
+        names = {name: segment.name for name, segment in self._segments.items()}
+        for setup in self._setup:
+            setup.put((names, layout, list(decoders), list(chain_config), radius, steps))
+
+    def free_slots(self):
+        return len(self._free)
+
+    def submit(self, raw_top, raw_bottom, angles):
+        """Queue a block of at most `block` profile pairs; return its ticket."""
+        count = len(raw_top)
+        if count > self.block:
+            raise ValueError("Block of " + str(count) + " pairs exceeds the pool block size " + str(self.block))
+        if not self._free:
+            raise RuntimeError("No free slot, take results first")
+        slot = self._free.popleft()
+        self._arrays["raw"][slot, 0, :count] = raw_top
+        self._arrays["raw"][slot, 1, :count] = raw_bottom
+        self._arrays["angles"][slot, :count] = angles
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self._slot_of[ticket] = slot
+        self._count[ticket] = count
+        self._tasks.put((slot, count))
+        self.submitted += 1
+        return ticket
+
+    def pending(self):
+        """Tickets submitted but not yet returned by result()."""
+        return self.next_ticket - self.next_result
+
+    def ready(self, timeout=0.0):
+        """True once the next ticket in order is finished, waiting at most `timeout` seconds (None: no limit)."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.next_result < self.next_ticket and self._slot_of[self.next_result] not in self._finished:
+            try:
+                if deadline is None:
+                    slot, seconds = self._done.get(timeout=1.0)
+                else:
+                    slot, seconds = self._done.get(timeout=max(deadline - time.perf_counter(), 0.0))
+            except queue.Empty:
+                if not all(process.is_alive() for process in self._processes):
+                    raise RuntimeError("A processing worker exited, blocks in flight are lost")
+                if deadline is not None:
+                    return False
+                continue
+            self._finished.add(slot)
+            self.busy += seconds
+        return self.next_result < self.next_ticket
+
+    def result(self, timeout=None):
+        """(ticket, x, z, valid) of the next block in ticket order, each (2, K, points), or None on timeout."""
+        if not self.ready(timeout):
+            return None
+        ticket = self.next_result
+        self.next_result += 1
+        slot = self._slot_of[ticket]
+        count = self._count[ticket]
+        self.completed += 1
+        return (ticket, self._arrays["x"][slot, :, :count], self._arrays["z"][slot, :, :count],
+                self._arrays["valid"][slot, :, :count])
+
+    def release(self, ticket):
+        """Hand the slot of a finished ticket back for new blocks."""
+        slot = self._slot_of.pop(ticket)
+        del self._count[ticket]
+        self._finished.discard(slot)
+        self._free.append(slot)
+
+    def close(self):
+        if not self._segments:
+            for setup in self._setup:
+                setup.put(None)
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self._arrays = {}
+        for segment in self._segments.values():
+            segment.close()
+            segment.unlink()
+        self._segments = {}
+
+    def stats(self):
+        """Blocks in flight and done, and how busy the workers were on average."""
+        elapsed = time.perf_counter() - self.started
+        return {"workers": self.workers, "submitted": self.submitted, "completed": self.completed,
+                "in_flight": self.pending(), "utilization": self.busy / (elapsed * self.workers) if elapsed else 0.0}
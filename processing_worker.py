@@ -0,0 +1,95 @@
+import threading
+from collections import deque
+
+
+class ProcessingWorker(threading.Thread):
+    """Run the acquisition/processing generator on its own thread.
+
+    Every frame produced by `frames()` is put into a bounded queue. When the
+    queue is full the oldest frame is dropped and counted, so a slow consumer
+    never slows down processing. The plot samples the newest frame with
+    `latest()`; other consumers can take frames in order with `get()`.
+    Frames are only counted as dropped once a consumer has read from the
+    queue; without one (headless) the queue just keeps the newest frames.
+
+    `frames()` may yield None when nothing new arrived for a while, so the
+    worker can check for stop() without waiting for the next frame. If
+    `frames()` raises, the error is kept in `error` and raised to the
+    consumer by get()/latest() once the queued frames are taken.
+    """
+
+    def __init__(self, frames, maxlen=32, name="processing"):
+        super().__init__(name=name, daemon=True)
+        self.frames = frames
+        self.maxlen = maxlen
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.produced = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.max_depth = 0
+        self.error = None
+        self._consumed = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            for frame in self.frames():
+                if self._stop_event.is_set():
+                    break
+                if frame is not None:
+                    self.put(frame)
+        except Exception as e:
+            self.error = e
+            print(f"\nProcessing worker stopped: {e}")
+        finally:
+            with self.condition:
+                self.condition.notify_all()
+
+    def stop(self, timeout=1.0):
+        """Stop after the current frame; waits at most timeout seconds for the thread to end."""
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def put(self, frame):
+        with self.condition:
+            if len(self.queue) >= self.maxlen:
+                self.queue.popleft()
+                if self._consumed:
+                    self.dropped += 1
+            self.queue.append(frame)
+            self.produced += 1
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify()
+
+    def _wait(self, timeout):
+        # Called with the condition held; False if there is no frame to take
+        self._consumed = True
+        if not self.queue:
+            self.condition.wait_for(lambda: self.queue or self.error is not None, timeout)
+        if not self.queue and self.error is not None:
+            raise RuntimeError(f"Error in processing worker: {self.error}") from self.error
+        return bool(self.queue)
+
+    def get(self, timeout=None):
+        """Oldest queued frame, or None if nothing arrives within timeout; raises RuntimeError if the worker failed."""
+        with self.condition:
+            if not self._wait(timeout):
+                return None
+            return self.queue.popleft()
+
+    def latest(self, timeout=None):
+        """Newest queued frame, discarding the older ones, or None if nothing arrives within timeout; raises RuntimeError if the worker failed."""
+        with self.condition:
+            if not self._wait(timeout):
+                return None
+            frame = self.queue.pop()
+            self.skipped += len(self.queue)
+            self.queue.clear()
+            return frame
+
+    def stats(self):
+        with self.condition:
+            return {"depth": len(self.queue), "max_depth": self.max_depth, "produced": self.produced,
+                    "dropped": self.dropped, "skipped": self.skipped}
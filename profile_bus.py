@@ -0,0 +1,321 @@
+import argparse
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MAGIC = 0x5052464C42555331  # "PRFLBUS1"
+FREE = -1
+# Header words
+H_MAGIC, H_SLOTS, H_SENSORS, H_POINTS, H_CONSUMERS, H_WRITE_SEQ, H_CLOSED, H_PRODUCER = range(8)
+HEADER_WORDS = 16
+
+
+def _layout(slots, sensors, points, consumers):
+    """Offset, shape and dtype of every array in the segment; 8 byte aligned."""
+    layout = {}
+    offset = 0
+    for name, shape, dtype in (("header", (HEADER_WORDS,), np.int64),
+                               ("cursor", (consumers,), np.int64),
+                               ("dropped", (consumers,), np.int64),
+                               ("pid", (consumers,), np.int64),
+                               ("seq", (slots,), np.int64),
+                               ("angle", (slots,), np.float64),
+                               ("time", (slots,), np.float64),
+                               ("x", (slots, sensors, points), np.float64),
+                               ("z", (slots, sensors, points), np.float64),
+                               ("valid", (slots, sensors, points), np.bool_)):
+        layout[name] = (offset, shape, dtype)
+        offset += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+    return layout, offset
+
+
+def _map(buffer, layout):
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset) for name, (offset, shape, dtype) in layout.items()}
+
+
+def _alive(pid):
+    """Whether process pid is still running."""
+    if pid <= 0:
+        return False
+    if os.name == "nt":
+        return True  # Signal 0 is CTRL_C_EVENT there; slots are only freed by close()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running, as another user
+    return True
+
+
+class ProfileBus:
+    """Single producer, multi consumer ring of transformed profiles in shared memory.
+
+    The producer publishes blocks of frames (x, z and the validity mask of
+    every sensor, plus the motor angle) into a fixed ring in one named
+    shared memory segment; consumers in other processes attach by name
+    and read the frames in place, as NumPy views, without a copy or
+    pickling. The producer never waits for a consumer: every consumer has
+    its own cursor in the segment, and one that falls more than a ring
+    behind skips ahead to the oldest frame still there and counts the
+    skipped frames in `dropped`. So a slow plot or recorder only loses
+    frames itself and never stalls acquisition or the other consumers.
+
+    Every slot carries the sequence number of its frame, set to FREE
+    while the producer rewrites it, so a consumer can tell with lapped()
+    whether frames it read were overwritten meanwhile (a seqlock).
+    """
+
+    def __init__(self, name, sensors, points, slots=1024, consumers=8):
+        self.name = name
+        self._layout, size = _layout(slots, sensors, points, consumers)
+        try:
+            self._segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._remove_stale(name)
+            self._segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._arrays = _map(self._segment.buf, self._layout)
+        self.header = self._arrays["header"]
+        self.seq = self._arrays["seq"]
+        self.header[:] = 0
+        self.header[H_PRODUCER] = os.getpid()
+        self.header[[H_SLOTS, H_SENSORS, H_POINTS, H_CONSUMERS]] = slots, sensors, points, consumers
+        self._arrays["cursor"][:] = FREE
+        self._arrays["dropped"][:] = 0
+        self._arrays["pid"][:] = 0
+        self.seq[:] = FREE
+        self.header[H_MAGIC] = MAGIC  # Consumers attach once the layout is complete
+        self.slots = slots
+        self.write_seq = 0
+
+    @staticmethod
+    def _remove_stale(name):
+        """Unlink a segment left behind by a producer that did not get to close(); refuse if its producer still runs."""
+        stale = shared_memory.SharedMemory(name=name)
+        header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=stale.buf)
+        producer = int(header[H_PRODUCER])
+        running = not header[H_CLOSED] and _alive(producer)
+        del header
+        stale.close()
+        if running:
+            # Before Python 3.13 attaching registers the segment to be unlinked when this process exits
+            resource_tracker.unregister(stale._name, "shared_memory")
+            raise FileExistsError(f"Error creating profile bus {name}: it is published by running process {producer}")
+        stale.unlink()
+
+    def publish(self, x, z, valid, angles):
+        """Publish a block of frames; x, z and valid have shape (sensors, K, points), angles (K,)."""
+        count = len(angles)
+        if count > self.slots:
+            # Only the newest ring's worth can be read anyway
+            x, z, valid, angles = x[:, -self.slots:], z[:, -self.slots:], valid[:, -self.slots:], angles[-self.slots:]
+            self.write_seq += count - self.slots
+            count = self.slots
+        seqs = self.write_seq + np.arange(count)
+        slots = seqs % self.slots
+        arrays = self._arrays
+        self.seq[slots] = FREE
+        arrays["x"][slots] = np.swapaxes(x, 0, 1)
+        arrays["z"][slots] = np.swapaxes(z, 0, 1)
+        arrays["valid"][slots] = np.swapaxes(valid, 0, 1)
+        arrays["angle"][slots] = angles
+        arrays["time"][slots] = time.time()
+        self.seq[slots] = seqs
+        self.write_seq += count
+        self.header[H_WRITE_SEQ] = self.write_seq  # Publish only after the frames are complete
+
+    def consumers(self):
+        """Per attached consumer: its pid, how many frames it is behind and how many it dropped."""
+        arrays = self._arrays
+        if not arrays:
+            return []  # Closed
+        return [{"consumer": int(i), "pid": int(arrays["pid"][i]), "lag": self.write_seq - int(arrays["cursor"][i]),
+                 "dropped": int(arrays["dropped"][i])}
+                for i in np.flatnonzero(arrays["pid"])]
+
+    def stats(self):
+        return {"published": self.write_seq, "slots": self.slots, "consumers": self.consumers()}
+
+    def close(self):
+        """Tell the consumers the bus is done and remove the segment; attached consumers keep their mapping until they close."""
+        self.header[H_CLOSED] = 1
+        self.header = self.seq = None
+        self._arrays = {}
+        self._segment.close()
+        self._segment.unlink()
+
+
+class BusReader:
+    """One consumer of a ProfileBus, in any process.
+
+        reader = BusReader("scrap-profiles")
+        while True:
+            block = reader.read(timeout=0.1)
+            if block is None:
+                if reader.closed():
+                    break
+                continue
+            seqs, angles, x, z, valid = block  # x, z, valid: (K, sensors, points) views into the ring
+            ...
+            reader.lapped(seqs)  # Frames of this block the producer overwrote while they were used
+
+    A consumer slot in the segment is claimed by the reader's pid and
+    freed by close(); `consumer` picks a fixed slot instead. Slots of
+    readers that died without close() are taken over.
+    """
+
+    def __init__(self, name, consumer=None, timeout=5.0):
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                self._segment = shared_memory.SharedMemory(name=name)
+                # Before Python 3.13 attaching registers the segment to be unlinked when this process exits
+                resource_tracker.unregister(self._segment._name, "shared_memory")
+                header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self._segment.buf)
+                if header[H_MAGIC] == MAGIC:
+                    break
+                del header
+                self._segment.close()
+            except FileNotFoundError:
+                pass
+            if time.perf_counter() >= deadline:
+                raise TimeoutError(f"Error attaching to profile bus {name}: not published within {timeout:.1f} s")
+            time.sleep(0.05)
+        slots, sensors, points, consumers = (int(header[i]) for i in (H_SLOTS, H_SENSORS, H_POINTS, H_CONSUMERS))
+        self._layout, _ = _layout(slots, sensors, points, consumers)
+        self._arrays = _map(self._segment.buf, self._layout)
+        del header
+        self.header = self._arrays["header"]
+        self.seq = self._arrays["seq"]
+        self.slots = slots
+        self.sensors = sensors
+        self.points = points
+        self.consumer = self._claim(consumer)
+        # New consumers start at the newest frame, not at the oldest one still in the ring
+        self.cursor = int(self.header[H_WRITE_SEQ])
+        self._arrays["cursor"][self.consumer] = self.cursor
+        self.frames = 0
+        self.dropped = 0
+
+    def _claim(self, consumer):
+        pids = self._arrays["pid"]
+        pid = os.getpid()
+        candidates = range(len(pids)) if consumer is None else (consumer,)
+        # Readers attaching at the same time take turns, so two of them never pick the same free slot
+        if fcntl is not None:
+            fcntl.flock(self._segment._fd, fcntl.LOCK_EX)
+        try:
+            for i in candidates:
+                owner = int(pids[i])
+                if owner == 0 or owner == pid or not _alive(owner):
+                    pids[i] = pid
+                    self._arrays["cursor"][i] = FREE
+                    self._arrays["dropped"][i] = 0
+                    return i
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._segment._fd, fcntl.LOCK_UN)
+        if consumer is not None:
+            raise ValueError(f"Error attaching to profile bus: consumer slot {consumer} is taken by process {int(pids[consumer])}")
+        raise ValueError(f"Error attaching to profile bus: all {len(pids)} consumer slots are taken")
+
+    def closed(self):
+        return bool(self.header[H_CLOSED])
+
+    def read(self, max_frames=None, timeout=0.0):
+        """(seqs, angles, x, z, valid) of the next unread frames, as views into the ring; None if there is nothing new within timeout.
+
+        A block never wraps around the end of the ring, so it may hold fewer
+        frames than are waiting; the next read() returns the rest.
+        """
+        write_seq = int(self.header[H_WRITE_SEQ])
+        if write_seq <= self.cursor and timeout:
+            deadline = time.perf_counter() + timeout
+            while write_seq <= self.cursor and not self.closed() and time.perf_counter() < deadline:
+                time.sleep(0.0005)
+                write_seq = int(self.header[H_WRITE_SEQ])
+        if write_seq <= self.cursor:
+            return None
+        if write_seq - self.cursor > self.slots:
+            # Fell behind by more than the ring, the frames in between are gone
+            self._skip(write_seq - self.slots - self.cursor)
+        start = self.cursor % self.slots
+        end = start + min(write_seq - self.cursor, self.slots - start)
+        if max_frames is not None:
+            end = min(end, start + max_frames)
+        seqs = self.cursor + np.arange(end - start)
+        stale = np.flatnonzero(self.seq[start:end] != seqs)
+        if len(stale):
+            if stale[0] == 0:
+                # The producer is already rewriting the oldest of these slots for newer frames
+                self._skip(int(np.argmin(self.seq[start:end] != seqs)) if len(stale) < end - start else end - start)
+                return self.read(max_frames)
+            end = start + int(stale[0])
+            seqs = seqs[:end - start]
+        self.cursor += end - start
+        self._arrays["cursor"][self.consumer] = self.cursor
+        self.frames += end - start
+        arrays = self._arrays
+        return seqs, arrays["angle"][start:end], arrays["x"][start:end], arrays["z"][start:end], arrays["valid"][start:end]
+
+    def _skip(self, count):
+        self.cursor += count
+        self.dropped += count
+        self._arrays["dropped"][self.consumer] = self.dropped
+
+    def lapped(self, seqs):
+        """Number of the frames seqs (from read()) that the producer has overwritten since."""
+        return int(np.count_nonzero(self.seq[seqs % self.slots] != seqs))
+
+    def lag(self):
+        """Frames published but not read yet."""
+        return int(self.header[H_WRITE_SEQ]) - self.cursor
+
+    def stats(self):
+        return {"consumer": self.consumer, "frames": self.frames, "dropped": self.dropped, "lag": self.lag()}
+
+    def close(self):
+        self._arrays["cursor"][self.consumer] = FREE
+        self._arrays["pid"][self.consumer] = 0
+        self.header = self.seq = None
+        self._arrays = {}
+        self._segment.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read a profile bus and report frame rate, lag and drops once a second.")
+    parser.add_argument("name", help="Name of the bus, as given to corecode.py --bus")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to spend per block, to see a slow consumer drop frames")
+    args = parser.parse_args()
+
+    reader = BusReader(args.name)
+    print(f"Attached to {args.name} as consumer {reader.consumer}: {reader.sensors} sensors x {reader.points} points,"
+          f" {reader.slots} slots")
+    last_time, last_frames, lapped = time.perf_counter(), 0, 0
+    try:
+        while not reader.closed():
+            block = reader.read(timeout=0.1)
+            if block is not None:
+                if args.delay:
+                    time.sleep(args.delay)
+                lapped += reader.lapped(block[0])
+            now = time.perf_counter()
+            if now - last_time >= 1.0:
+                print(f"{(reader.frames - last_frames) / (now - last_time):.0f} frames/s, lag {reader.lag()},"
+                      f" dropped {reader.dropped}, lapped {lapped}")
+                last_time, last_frames = now, reader.frames
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Profile bus: {reader.stats()}")
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import ctypes as ct
+import threading
+import numpy as np
+
+# Partial profile layout this decoder understands: X and Z word of every point
+START_DATA = 4
+DATA_WIDTH = 4
+
+null_ptr_short = ct.POINTER(ct.c_ushort)()
+null_ptr_int = ct.POINTER(ct.c_uint)()
+
+_decoder_cache = {}
+# Heads are brought up in parallel; the lock makes the first of them capture the tables and the others wait for them
+_decoder_lock = threading.Lock()
+
+
+def convert_with_library(llt, device, profile_struct, scanner_type, raw, x, z):
+    """Convert one raw profile with pyllt into the float64 arrays x and z; return the library flags."""
+    return llt.convert_part_profile_2_values(device, raw.ctypes.data_as(ct.POINTER(ct.c_ubyte)), ct.byref(profile_struct),
+                                             scanner_type, 0, 1, null_ptr_short, null_ptr_short, null_ptr_short,
+                                             x.ctypes.data_as(ct.POINTER(ct.c_double)),
+                                             z.ctypes.data_as(ct.POINTER(ct.c_double)), null_ptr_int, null_ptr_int)
+
+
+def convert_block_with_library(llt, device, profile_struct, scanner_type, raw):
+    """Convert raw profiles of shape (K, resolution * 4) with pyllt one by one; return x, z and the number that failed.
+
+    Profiles the library fails to convert come back as all 0, like invalid points.
+    """
+    x_block = np.empty((len(raw), raw.shape[1] // DATA_WIDTH), dtype=float)
+    z_block = np.empty_like(x_block)
+    failed = 0
+    for row in range(len(raw)):
+        fret = convert_with_library(llt, device, profile_struct, scanner_type, raw[row], x_block[row], z_block[row])
+        if fret & llt.CONVERT_X == 0 or fret & llt.CONVERT_Z == 0:
+            x_block[row] = 0.0
+            z_block[row] = 0.0
+            failed += 1
+    return x_block, z_block, failed
+
+
+def timestamps_with_library(llt, stamps):
+    """Shutter opened times (s) and profile counters of timestamps of shape (K, 16), decoded by pyllt one by one."""
+    stamps = np.ascontiguousarray(np.atleast_2d(stamps), dtype=np.uint8)
+    opened = ct.c_double(0.0)
+    closed = ct.c_double(0.0)
+    counter = ct.c_uint(0)
+    shutter_times = np.zeros(len(stamps))
+    counters = np.zeros(len(stamps), dtype=np.int64)
+    for k, stamp in enumerate(stamps):
+        llt.timestamp_2_time_and_count(stamp.ctypes.data_as(ct.POINTER(ct.c_ubyte)), ct.byref(opened),
+                                       ct.byref(closed), ct.byref(counter))
+        shutter_times[k] = opened.value
+        counters[k] = counter.value
+    return shutter_times, counters
+
+
+class ProfileDecoder:
+    """Vectorized conversion of raw X/Z partial profiles into millimetres.
+
+    Each point carries a big-endian 16-bit X and Z word. Instead of a
+    conversion call per profile the decoder looks every word up in tables
+    holding the library's own result for all 65536 raw values, so a block of
+    K profiles is converted in one NumPy pass and matches the library bit for
+    bit. Raw values the library treats as invalid set both coordinates to 0.
+    """
+
+    def __init__(self, x_table, z_table, x_invalid, z_invalid):
+        self.x_table = x_table
+        self.z_table = z_table
+        self.x_invalid = x_invalid
+        self.z_invalid = z_invalid
+        self._all_valid = not (x_invalid.any() or z_invalid.any())
+
+    @classmethod
+    def from_library(cls, llt, device, scanner_type, resolution):
+        """Capture the conversion tables once by converting sweeps over all raw X and Z values."""
+        profile_struct = llt.TPartialProfile(0, START_DATA, resolution, DATA_WIDTH)
+        raw = np.zeros(resolution * DATA_WIDTH, dtype=np.uint8)
+        words = raw.view(">u2").reshape(resolution, 2)
+        x = np.empty(resolution, dtype=float)
+        z = np.empty(resolution, dtype=float)
+        # Keep clear of the last 16 bytes, which carry the timestamp
+        chunk = resolution - 4
+        # Held in the other word during a sweep; must not convert to 0, which marks invalid points
+        probe = 0x9000
+
+        tables = []
+        for column in (0, 1):
+            table = np.empty(65536, dtype=float)
+            invalid = np.zeros(65536, dtype=bool)
+            other = 1 - column
+            words[:, other] = probe
+            words[:, column] = probe
+            fret = convert_with_library(llt, device, profile_struct, scanner_type, raw, x, z)
+            if fret & llt.CONVERT_X == 0 or fret & llt.CONVERT_Z == 0:
+                raise ValueError("Error converting calibration profile: " + str(fret))
+            reference = (x if other == 0 else z)[0]
+            if reference == 0.0:
+                raise ValueError("Calibration probe converts to 0, cannot detect invalid points")
+
+            for start in range(0, 65536, chunk):
+                values = np.arange(start, min(start + chunk, 65536))
+                words[:len(values), column] = values
+                convert_with_library(llt, device, profile_struct, scanner_type, raw, x, z)
+                table[values] = (x if column == 0 else z)[:len(values)]
+                invalid[values] = (x if other == 0 else z)[:len(values)] != reference
+            table[invalid] = 0.0
+            tables.append((table, invalid))
+
+        (x_table, x_invalid), (z_table, z_invalid) = tables
+        return cls(x_table, z_table, x_invalid, z_invalid)
+
+    @classmethod
+    def load(cls, path):
+        tables = np.load(path)
+        return cls(tables["x_table"], tables["z_table"], tables["x_invalid"], tables["z_invalid"])
+
+    def save(self, path):
+        np.savez(path, x_table=self.x_table, z_table=self.z_table, x_invalid=self.x_invalid, z_invalid=self.z_invalid)
+
+    def decode(self, raw, x_out=None, z_out=None):
+        """Convert raw profiles of shape (K, resolution * 4) into (K, resolution) x and z arrays."""
+        raw = np.ascontiguousarray(raw, dtype=np.uint8)
+        words = raw.view(">u2").reshape(raw.shape[:-1] + (-1, 2))
+        raw_x = words[..., 0]
+        raw_z = words[..., 1]
+        x = np.take(self.x_table, raw_x, out=x_out)
+        z = np.take(self.z_table, raw_z, out=z_out)
+        if not self._all_valid:
+            invalid = self.x_invalid[raw_x] | self.z_invalid[raw_z]
+            x[invalid] = 0.0
+            z[invalid] = 0.0
+        return x, z
+
+    def verify(self, llt, device, scanner_type, raw_profiles):
+        """Compare decode() against the library on recorded raw profiles; return the number of profiles that differ."""
+        raw_profiles = np.atleast_2d(raw_profiles)
+        resolution = raw_profiles.shape[1] // DATA_WIDTH
+        profile_struct = llt.TPartialProfile(0, START_DATA, resolution, DATA_WIDTH)
+        x_block, z_block = self.decode(raw_profiles)
+        x = np.empty(resolution, dtype=float)
+        z = np.empty(resolution, dtype=float)
+        mismatches = 0
+        for raw, x_decoded, z_decoded in zip(raw_profiles, x_block, z_block):
+            convert_with_library(llt, device, profile_struct, scanner_type, np.ascontiguousarray(raw), x, z)
+            if not (np.array_equal(x.view(np.uint64), x_decoded.view(np.uint64))
+                    and np.array_equal(z.view(np.uint64), z_decoded.view(np.uint64))):
+                mismatches += 1
+        return mismatches
+
+
+def decoder_for(llt, device, scanner_type, resolution):
+    """Conversion tables are captured once per scanner type and shared by all heads of that type.
+
+    Returns None if the tables cannot be captured; the profiles are then
+    converted with the library one by one.
+    """
+    key = ct.c_int(scanner_type).value if isinstance(scanner_type, int) else scanner_type.value
+    with _decoder_lock:
+        if key not in _decoder_cache:
+            try:
+                _decoder_cache[key] = ProfileDecoder.from_library(llt, device, scanner_type, resolution)
+            except ValueError as e:
+                print(f"Batched decoder not available ({e}), using the library conversion")
+                return None
+        return _decoder_cache[key]
+
+
+class TimestampDecoder:
+    """Vectorized decoding of the 16-byte profile timestamps into shutter times and profile counters.
+
+    The timestamp packs the counter and the shutter times as fixed-point
+    bit fields, so every value is a weighted sum of its bits. The weights
+    are captured from the library once by decoding a timestamp with a single
+    bit set, one per bit; decode() then turns the timestamps of a whole
+    block into bits and multiplies them by the weights. verify() compares
+    the result with the library on recorded profiles, so a timestamp format
+    that is not a plain sum of bit fields is caught before it is trusted.
+    """
+
+    def __init__(self, opened_weights, counter_weights):
+        self.weights = np.column_stack((opened_weights, counter_weights))
+
+    @classmethod
+    def from_library(cls, llt):
+        stamp = (ct.c_ubyte * 16)()
+        opened = ct.c_double(0.0)
+        closed = ct.c_double(0.0)
+        counter = ct.c_uint(0)
+        weights = np.zeros((128, 2))
+        for bit in range(128):
+            ct.memset(stamp, 0, 16)
+            # Bit order of np.unpackbits: most significant bit of every byte first
+            stamp[bit // 8] = 0x80 >> (bit % 8)
+            llt.timestamp_2_time_and_count(stamp, ct.byref(opened), ct.byref(closed), ct.byref(counter))
+            weights[bit] = opened.value, counter.value
+        return cls(weights[:, 0], weights[:, 1])
+
+    def decode(self, stamps):
+        """Shutter opened times (s) and profile counters of timestamps of shape (K, 16)."""
+        values = np.unpackbits(np.ascontiguousarray(stamps, dtype=np.uint8), axis=-1) @ self.weights
+        return values[:, 0], values[:, 1].astype(np.int64)
+
+    def verify(self, llt, stamps, tolerance=1e-9):
+        """Compare decode() against the library; return the number of timestamps that differ."""
+        stamps = np.ascontiguousarray(np.atleast_2d(stamps), dtype=np.uint8)
+        opened_decoded, counter_decoded = self.decode(stamps)
+        opened = ct.c_double(0.0)
+        closed = ct.c_double(0.0)
+        counter = ct.c_uint(0)
+        mismatches = 0
+        for stamp, opened_value, counter_value in zip(stamps, opened_decoded, counter_decoded):
+            llt.timestamp_2_time_and_count(stamp.ctypes.data_as(ct.POINTER(ct.c_ubyte)), ct.byref(opened),
+                                           ct.byref(closed), ct.byref(counter))
+            if abs(opened.value - opened_value) > tolerance or counter.value != counter_value:
+                mismatches += 1
+        return mismatches
+
+
+class TimestampReader:
+    """Timestamps of blocks of profiles, decoded with a TimestampDecoder once it matched pyllt on the first profiles.
+
+    The first `check_profiles` timestamps are compared with the library; if
+    any differs, this and every later block is decoded by pyllt one by one.
+    """
+
+    def __init__(self, llt, check_profiles=200, name=None):
+        self.llt = llt
+        self.check_profiles = check_profiles
+        self.name = name
+        self.decoder = TimestampDecoder.from_library(llt)
+        self.checked = 0
+
+    def read(self, stamps):
+        """Shutter opened times (s) and profile counters of timestamps of shape (K, 16)."""
+        if self.decoder is not None and self.checked < self.check_profiles and len(stamps):
+            self.checked += len(stamps)
+            mismatches = self.decoder.verify(self.llt, stamps)
+            if mismatches:
+                source = f" of {self.name}" if self.name else ""
+                print(f"\nBatched timestamp decoding differs from pyllt in {mismatches} profiles{source}, using pyllt")
+                self.decoder = None
+        if self.decoder is None:
+            return timestamps_with_library(self.llt, stamps)
+        return self.decoder.decode(stamps)
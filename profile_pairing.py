@@ -0,0 +1,140 @@
+import time
+from collections import deque
+
+
+def wrapped_difference(a, b, period):
+    """Difference a - b of two counters or clocks that wrap around after `period`."""
+    if not period:
+        return a - b
+    return (a - b + period / 2) % period - period / 2
+
+
+class ProfilePairer:
+    """Match top and bottom profiles of the same shutter cycle, or the profiles of any number of heads.
+
+    Profiles are added with their ring sequence number, shutter time and
+    profile counter, each sensor's in ring order; corecode.py alternates
+    one profile of each sensor. Two profiles pair when their
+    shutter times agree within `time_tolerance` (after `time_offset`) and their
+    counters agree with the offset learned on the first pair. With more
+    than two `sensors` a profile completes a frame when it pairs this way
+    with a pending profile of every other head, and `time_offset` is a
+    list of each head's shutter time minus head 0's. Profiles that
+    find no partner within `max_age` seconds, or that are overtaken by a later
+    match, are dropped and counted. The age is host time since add() by
+    default; with `shutter_age` it is measured on the sensors' shutter
+    clock against the newest profile added, so a replay pairs the same way
+    however fast it runs.
+    """
+
+    def __init__(self, time_tolerance=100e-6, time_offset=0.0, counter_tolerance=0,
+                 max_age=0.05, max_pending=32, time_wrap=128.0, counter_wrap=2 ** 32, shutter_age=False, sensors=2):
+        self.sensors = sensors
+        self.time_tolerance = time_tolerance
+        self.time_offset = time_offset
+        self.counter_tolerance = counter_tolerance
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.time_wrap = time_wrap
+        self.counter_wrap = counter_wrap
+        self.shutter_age = shutter_age
+        # Shutter time of every head relative to head 0; the top/bottom offset is top minus bottom
+        if sensors == 2 and not isinstance(time_offset, (list, tuple)):
+            self.time_offsets = [0.0, -time_offset]
+        else:
+            self.time_offsets = list(time_offset) if isinstance(time_offset, (list, tuple)) else [0.0] * sensors
+        self.counter_offsets = None
+        self.pending = tuple(deque() for _ in range(sensors))
+        self.last_seq = [-1] * sensors
+        self.pairs = 0
+        self.dropped = [0] * sensors
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def add(self, sensor, seq, shutter_time, counter):
+        """Add one profile of sensor 0 (top) or 1 (bottom); return the (top_seq, bottom_seq) pair it completes, if any.
+
+        With more heads the completed frame has one sequence number per head.
+        """
+        now = time.perf_counter()
+        self.last_seq[sensor] = seq
+        matches = []
+        for other in range(self.sensors):
+            if other == sensor:
+                continue
+            match = self._find(sensor, shutter_time, counter, other)
+            if match is None:
+                self.pending[sensor].append((seq, shutter_time, counter, now))
+                self._expire(now, sensor, shutter_time)
+                return None
+            matches.append((other, match))
+
+        # Everything queued before the partners, of any sensor, can no longer pair
+        self._drop(sensor, len(self.pending[sensor]))
+        seqs = [seq] * self.sensors
+        counters = [counter] * self.sensors
+        oldest = now
+        for other, match in matches:
+            self._drop(other, match)
+            seqs[other], _, counters[other], arrival = self.pending[other].popleft()
+            oldest = min(oldest, arrival)
+        if self.counter_offsets is None:
+            self.counter_offsets = [wrapped_difference(counters[0], other_counter, self.counter_wrap)
+                                    for other_counter in counters]
+
+        latency = now - oldest
+        self.pairs += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        return tuple(seqs)
+
+    def resync(self):
+        """Learn the counter offset again from the next pair, after the sensors' timing was changed."""
+        self.counter_offsets = None
+
+    def settled(self, sensor):
+        """Highest sequence number of sensor up to which every profile is paired or dropped."""
+        pending = self.pending[sensor]
+        return pending[0][0] - 1 if pending else self.last_seq[sensor]
+
+    def stats(self):
+        if self.sensors == 2:
+            dropped = {"dropped_top": self.dropped[0], "dropped_bottom": self.dropped[1]}
+        else:
+            dropped = {"dropped": list(self.dropped)}
+        return {"pairs": self.pairs,
+                **dropped,
+                "pending": sum(len(pending) for pending in self.pending),
+                "mean_latency_ms": 1e3 * self.latency_total / self.pairs if self.pairs else 0.0,
+                "max_latency_ms": 1e3 * self.latency_max}
+
+    def _find(self, sensor, shutter_time, counter, other):
+        """Index of the first pending profile of `other` from the same shutter cycle, or None."""
+        time_offset = self.time_offsets[sensor] - self.time_offsets[other]
+        for i, (_, other_time, other_counter, _) in enumerate(self.pending[other]):
+            if abs(wrapped_difference(shutter_time, other_time, self.time_wrap) - time_offset) > self.time_tolerance:
+                continue
+            if self.counter_offsets is not None:
+                dc = wrapped_difference(counter, other_counter, self.counter_wrap)
+                expected = self.counter_offsets[other] - self.counter_offsets[sensor]
+                if abs(wrapped_difference(dc, expected, self.counter_wrap)) > self.counter_tolerance:
+                    continue
+            return i
+        return None
+
+    def _drop(self, sensor, count):
+        for _ in range(count):
+            self.pending[sensor].popleft()
+        self.dropped[sensor] += count
+
+    def _expire(self, now, newest_sensor, shutter_time):
+        for sensor, pending in enumerate(self.pending):
+            while pending and (len(pending) > self.max_pending
+                               or self._age(sensor, pending[0], now, newest_sensor, shutter_time) > self.max_age):
+                self._drop(sensor, 1)
+
+    def _age(self, sensor, entry, now, newest_sensor, shutter_time):
+        if self.shutter_age:
+            time_offset = self.time_offsets[newest_sensor] - self.time_offsets[sensor]
+            return wrapped_difference(shutter_time, entry[1], self.time_wrap) - time_offset
+        return now - entry[3]
@@ -0,0 +1,191 @@
+import numpy as np
+
+# scipy is imported by the filter functions that use it, so the transform kernel can be imported without it
+
+
+def filter_laser_data(x, z, filter_value=0.0):
+    mask = (x != filter_value) & (z != filter_value)
+    return x[mask], z[mask]
+
+
+def remove_outliers_with_zscore(x, z, threshold=3):
+    """Remove outliers based on Z-score if data is sufficiently varied."""
+    if len(z) > 1 and np.std(z) > 0:  # Ensure there is some variation
+        from scipy.stats import zscore
+        z_scores = np.abs(zscore(z))  # Calculate Z-scores
+        mask = z_scores < threshold   # Filter out points where Z-score > threshold
+        return x[mask], z[mask]
+    else:
+        print("Warning: Insufficient variance in data for Z-score. Returning original data.")
+        return x, z  # Return original data if there's no variance
+
+
+def smooth_data_with_savgol(x, z, window_size=5, poly_order=3):
+    """Apply Savitzky-Golay filter for smoothing, if data is sufficient."""
+    if len(z) >= window_size:  # Ensure the data length meets the window size
+        from scipy.signal import savgol_filter
+        z_smoothed = savgol_filter(z, window_size, poly_order)
+    else:
+        print("Warning: Insufficient data for Savitzky-Golay filter. Returning original data.")
+        z_smoothed = z  # Return the original data if not enough points
+    return x, z_smoothed
+
+
+def smooth_data_with_median(x, z, kernel_size=3):
+    from scipy.signal import medfilt
+    z_smoothed = medfilt(z, kernel_size=kernel_size)
+    return x, z_smoothed
+
+
+def smooth_data_with_gaussian(x, z, sigma=1.0):
+    from scipy.ndimage import gaussian_filter1d
+    z_smoothed = gaussian_filter1d(z, sigma=sigma)
+    return x, z_smoothed
+
+
+def transform_coordinates_from_center(x, z, angle_deg, radius):
+    angle_rad = np.deg2rad(angle_deg)
+    x_shifted = x - x[0]
+    z_shifted = z - z[0]
+    x_rot = x_shifted * np.cos(angle_rad) - z_shifted * np.sin(angle_rad)
+    z_rot = x_shifted * np.sin(angle_rad) + z_shifted * np.cos(angle_rad)
+    x_translated = x_rot + radius * np.cos(angle_rad)
+    z_translated = z_rot + radius * np.sin(angle_rad)
+    return x_translated, z_translated
+
+
+class TrigTable:
+    """cos/sin of the motor angle, precomputed for `steps` angles per turn.
+
+    Angles are rounded to the nearest step. The default is one step per
+    encoder count, so every angle derived from a motor position is exact
+    and the rounding of interpolated angles (0.003 degrees) stays far
+    below the sensor resolution.
+    """
+
+    def __init__(self, steps=120000):
+        self.steps = steps
+        # Same expression as the motor position in degrees, so angles on a step match bit for bit
+        angles = np.deg2rad(np.arange(steps) / steps * 360)
+        self.cos = np.cos(angles)
+        self.sin = np.sin(angles)
+        self._scaled = {}
+
+    def lookup(self, angle_deg):
+        """cos and sin of one angle or an array of angles in degrees."""
+        index = np.rint(np.asarray(angle_deg) * (self.steps / 360.0)).astype(np.intp) % self.steps
+        return self.cos[index], self.sin[index]
+
+    def index(self, angle_deg, out, scratch):
+        """Table index of every angle in degrees, like lookup(); written into the intp array out, using the float array scratch."""
+        np.multiply(angle_deg, self.steps / 360.0, out=scratch)
+        np.rint(scratch, out=scratch)
+        np.copyto(out, scratch, casting="unsafe")
+        return np.remainder(out, self.steps, out=out)
+
+    def scaled(self, radius):
+        """radius * cos and radius * sin for every step, computed once per radius."""
+        tables = self._scaled.get(radius)
+        if tables is None:
+            tables = self._scaled.setdefault(radius, (radius * self.cos, radius * self.sin))
+        return tables
+
+
+class FilterTransformKernel:
+    """filter_laser_data + transform_coordinates_from_center for a block of profile pairs.
+
+    Both sensors' (K, points) blocks are filtered, shifted to their first
+    valid point and rotated/translated by each pair's motor angle with
+    in-place NumPy operations on buffers that are allocated once, instead
+    of about a dozen temporaries per profile: cos, sin and the radius
+    offsets come from the TrigTable with np.take into those buffers, as do
+    the first valid points. The work is done `chunk` pairs at a time so
+    the intermediates stay in cache. Only a block larger than any before
+    grows the buffers.
+
+    Results are written into the caller's (2, K, points) `out` arrays, or
+    into buffers owned by the kernel that the next call overwrites. They
+    are left at the original point positions next to the validity mask,
+    so `x[s, k][valid[s, k]]` equals what the two functions return
+    for sensor s of pair k. The arithmetic runs in the same order, so for
+    the same cos/sin the results are identical; a profile without valid
+    points has an empty mask instead of raising an IndexError.
+    """
+
+    def __init__(self, points, radius, trig_table=None, filter_value=0.0, chunk=8):
+        self.points = points
+        self.radius = radius
+        self.filter_value = filter_value
+        self.trig_table = trig_table if trig_table is not None else TrigTable()
+        self.chunk = chunk
+        shape = (2, chunk, points)
+        self._x = np.empty(shape)
+        self._z = np.empty(shape)
+        self._product = np.empty(shape)
+        self._other = np.empty(shape, dtype=bool)
+        self._first = np.empty((2, chunk), dtype=np.intp)
+        self._first_x = np.empty((2, chunk))
+        self._first_z = np.empty((2, chunk))
+        self._row_offsets = np.arange(chunk) * points
+        self._radius_cos, self._radius_sin = self.trig_table.scaled(radius)
+        self._allocate_output(chunk)
+
+    def _allocate_output(self, capacity):
+        shape = (2, capacity, self.points)
+        self._x_out = np.empty(shape)
+        self._z_out = np.empty(shape)
+        self._valid = np.empty(shape, dtype=bool)
+        self._index = np.empty(capacity, dtype=np.intp)
+        self._scratch = np.empty(capacity)
+        # cos, sin, radius * cos and radius * sin of every pair's angle
+        self._trig = np.empty((4, capacity, 1))
+
+    def process(self, x_top, z_top, x_bottom, z_bottom, angles_deg, out=None):
+        """Transform K profile pairs recorded at `angles_deg`; return x, z and valid, each (2, K, points)."""
+        count = len(x_top)
+        if count > self._x_out.shape[1]:
+            self._allocate_output(count)
+        if out is None:
+            out = (self._x_out[:, :count], self._z_out[:, :count], self._valid[:, :count])
+        x_out_all, z_out_all, valid_all = out
+        index = self.trig_table.index(angles_deg, self._index[:count], self._scratch[:count])
+        trig = self._trig[:, :count]
+        for table, column in zip((self.trig_table.cos, self.trig_table.sin, self._radius_cos, self._radius_sin), trig):
+            np.take(table, index, out=column[:, 0])
+        cos, sin, radius_cos, radius_sin = trig
+        inputs = ((x_top, z_top), (x_bottom, z_bottom))
+
+        for start in range(0, count, self.chunk):
+            end = min(start + self.chunk, count)
+            rows = end - start
+            valid = valid_all[:, start:end]
+            other = self._other[:, :rows]
+            first = self._first[:, :rows]
+            first_x = self._first_x[:, :rows]
+            first_z = self._first_z[:, :rows]
+            x = self._x[:, :rows]
+            z = self._z[:, :rows]
+            for sensor, (x_in, z_in) in enumerate(inputs):
+                x_in = x_in[start:end]
+                z_in = z_in[start:end]
+                np.not_equal(x_in, self.filter_value, out=valid[sensor])
+                np.logical_and(valid[sensor], np.not_equal(z_in, self.filter_value, out=other[sensor]), out=valid[sensor])
+                np.argmax(valid[sensor], axis=1, out=first[sensor])
+                # Flat index of every row's first valid point
+                np.add(first[sensor], self._row_offsets[:rows], out=first[sensor])
+                np.take(x_in, first[sensor], out=first_x[sensor])
+                np.take(z_in, first[sensor], out=first_z[sensor])
+                np.subtract(x_in, first_x[sensor, :, np.newaxis], out=x[sensor])
+                np.subtract(z_in, first_z[sensor, :, np.newaxis], out=z[sensor])
+
+            c = cos[start:end]
+            s = sin[start:end]
+            product = self._product[:, :rows]
+            x_out = np.multiply(x, c, out=x_out_all[:, start:end])
+            np.subtract(x_out, np.multiply(z, s, out=product), out=x_out)
+            np.add(x_out, radius_cos[start:end], out=x_out)
+
+            z_out = np.multiply(x, s, out=z_out_all[:, start:end])
+            np.add(z_out, np.multiply(z, c, out=product), out=z_out)
+            np.add(z_out, radius_sin[start:end], out=z_out)
+        return out
@@ -0,0 +1,168 @@
+import time
+from profile_pairing import wrapped_difference
+
+
+def encode_time_code(microseconds):
+    """Exposure/idle time in µs as the sensors expect it: the µs digit in bits 12-15, tens of µs below."""
+    microseconds = int(microseconds)
+    return (((microseconds % 10) << 12) & 0xF000) + ((microseconds // 10) & 0xFFF)
+
+
+def decode_time_code(code):
+    """Inverse of encode_time_code(): time in µs."""
+    return (code & 0xFFF) * 10 + ((code >> 12) & 0xF)
+
+
+class ProfileGapDetector:
+    """Lost profiles of one sensor, from gaps in its profile counter.
+
+    The sensor numbers every profile, so a counter that skips ahead by more
+    than one means profiles were lost on the way: in the sensor, on the
+    network or because the ring was full. A counter that goes back (the
+    sensor restarted its count) is counted in `resets` and not as loss.
+    """
+
+    def __init__(self, counter_wrap=2 ** 32):
+        self.counter_wrap = counter_wrap
+        self.last = None
+        self.received = 0
+        self.lost = 0
+        self.gaps = 0
+        self.largest_gap = 0
+        self.resets = 0
+
+    def update(self, counter):
+        """Add the counter of the next received profile; returns the number of profiles lost just before it."""
+        self.received += 1
+        last, self.last = self.last, counter
+        if last is None:
+            return 0
+        missing = int(wrapped_difference(counter, last, self.counter_wrap)) - 1
+        if missing < 0:
+            self.resets += 1
+            return 0
+        if missing:
+            self.lost += missing
+            self.gaps += 1
+            self.largest_gap = max(self.largest_gap, missing)
+        return missing
+
+    def stats(self):
+        return {"received": self.received, "lost": self.lost, "gaps": self.gaps,
+                "largest_gap": self.largest_gap, "resets": self.resets}
+
+
+class FrequencyTuner:
+    """Find the highest profile frequency the host keeps up with, by moving the sensors' idle time.
+
+    update() is called regularly with the total number of lost profiles so
+    far. After every change the tuner waits `settle` seconds, then watches
+    the next `window` seconds: any loss makes the setting bad at once, a
+    window without loss makes it good. The profile period is shortened by
+    `step` while nothing is lost, then bisected between the shortest good
+    and the longest bad period down to `resolution_us`, and the tuner locks
+    at the shortest good period plus `margin`. A loss while locked starts
+    the search again from there. Every decision is passed to `log` and kept
+    in `decisions`.
+    """
+
+    def __init__(self, apply, exposure_us, idle_us, min_idle_us=100, max_idle_us=40950, window=2.0, settle=0.5,
+                 step=0.8, resolution_us=10, margin=0.05, log=print):
+        self.apply = apply
+        self.exposure_us = exposure_us
+        self.idle_us = idle_us
+        self.min_idle_us = min_idle_us
+        self.max_idle_us = max_idle_us
+        self.window = window
+        self.settle = settle
+        self.step = step
+        self.resolution_us = resolution_us
+        self.margin = margin
+        self.log = log
+        self.good_period = None  # Shortest period without loss
+        self.bad_period = None  # Longest period with loss
+        self.locked = False
+        self.decisions = []
+        self._window_start = None
+        self._base = 0
+
+    def frequency(self, idle_us=None):
+        """Profile frequency (Hz) at idle time idle_us (default: the current one)."""
+        return 1e6 / (self.exposure_us + (self.idle_us if idle_us is None else idle_us))
+
+    def update(self, lost, now=None):
+        """Feed the total number of lost profiles; changes the idle time when a window is decided."""
+        if now is None:
+            now = time.perf_counter()
+        if self._window_start is None:
+            self._window_start = now + self.settle
+        if now < self._window_start:
+            # Loss while the sensors switch over does not count
+            self._base = lost
+            return self.idle_us
+        new = lost - self._base
+        if new > 0:
+            self._failed(new, now)
+        elif now - self._window_start >= self.window:
+            self._passed(now)
+        return self.idle_us
+
+    def _passed(self, now):
+        period = self.exposure_us + self.idle_us
+        self.good_period = period if self.good_period is None else min(self.good_period, period)
+        if self.locked:
+            self._window_start = now
+            return
+        if self.bad_period is None:
+            idle = max(round(period * self.step) - self.exposure_us, self.min_idle_us)
+            if idle == self.idle_us:
+                self._lock(now, "no loss at the minimum idle time")
+                return
+            self._change(idle, now, "no loss, shorter period")
+        else:
+            self._bisect(now, "no loss")
+
+    def _failed(self, lost, now):
+        period = self.exposure_us + self.idle_us
+        self.bad_period = period if self.bad_period is None else max(self.bad_period, period)
+        if self.good_period is not None and self.good_period <= period:
+            # The host got slower, what was good before is not any more
+            self.good_period = None
+        self.locked = False
+        reason = f"{lost} lost"
+        if self.good_period is None:
+            idle = min(round(period / self.step) - self.exposure_us, self.max_idle_us)
+            if idle == self.idle_us:
+                reason = "loss even at the maximum idle time, kept"
+                # Logged once, not every window the host stays too slow
+                if not self.decisions or self.decisions[-1]["reason"] != reason:
+                    self._record(now, lost, reason)
+                self._window_start = now + self.settle
+                return
+            self._change(idle, now, reason + ", longer period")
+        else:
+            self._bisect(now, reason, lost)
+
+    def _bisect(self, now, reason, lost=0):
+        if self.good_period - self.bad_period <= self.resolution_us:
+            self._lock(now, reason, lost)
+            return
+        idle = (self.good_period + self.bad_period) // 2 - self.exposure_us
+        self._change(idle, now, reason + ", bisecting", lost)
+
+    def _lock(self, now, reason, lost=0):
+        idle = min(round(self.good_period * (1 + self.margin)) - self.exposure_us, self.max_idle_us)
+        self.locked = True
+        self._change(idle, now, reason + f", locked with {100 * self.margin:.0f} % margin", lost)
+
+    def _change(self, idle, now, reason, lost=0):
+        self.idle_us = int(idle)
+        self.apply(self.idle_us)
+        self._window_start = now + self.settle
+        self._record(now, lost, reason)
+
+    def _record(self, now, lost, reason):
+        decision = {"time": now, "idle_us": self.idle_us, "frequency_hz": self.frequency(), "lost": lost,
+                    "good_period_us": self.good_period, "bad_period_us": self.bad_period, "reason": reason}
+        self.decisions.append(decision)
+        self.log(f"Frequency tuner: {reason}; idle {self.idle_us} µs, {decision['frequency_hz']:.0f} Hz")
@@ -0,0 +1,121 @@
+import ctypes as ct
+import time
+import numpy as np
+
+
+class ProfileRing:
+    """Preallocated N-slot ring of raw profile buffers for one sensor.
+
+    The sensor callback is the only writer and the processing loop the only
+    reader, so the two sequence counters need no lock. When every slot is
+    still unread a new profile is rejected and counted in `overruns` instead
+    of overwriting data the reader has not converted yet. A container of
+    several profiles back to back is copied into consecutive slots at once,
+    where every profile is a row of `data` again. A container whose size
+    is not a whole number of profiles means the container and the slot
+    size do not match; it is rejected and counted in `invalid_transfers`.
+    """
+
+    def __init__(self, slot_size, slots=256):
+        self.slot_size = slot_size
+        self.slots = slots
+        self.data = np.zeros((slots, slot_size), dtype=np.uint8)
+        self.sizes = np.zeros(slots, dtype=np.int64)
+        self.arrival = np.zeros(slots)  # Host time (time.perf_counter) at which each slot was filled
+        base = self.data.ctypes.data
+        self._addresses = [base + i * slot_size for i in range(slots)]
+        self._pointers = [ct.cast(address, ct.POINTER(ct.c_ubyte)) for address in self._addresses]
+        self._timestamp_pointers = [ct.cast(address + slot_size - 16, ct.POINTER(ct.c_ubyte)) for address in self._addresses]
+        self.write_seq = 0
+        self.read_seq = 0
+        self.overruns = 0
+        self.invalid_transfers = 0
+
+    def push(self, data, size):
+        """Copy one profile, or a container of whole profiles, from the library callback into the next free slots."""
+        if size > self.slot_size:
+            return self._push_container(data, size)
+        if self.write_seq - self.read_seq >= self.slots:
+            self.overruns += 1
+            return False
+        slot = self.write_seq % self.slots
+        size = min(size, self.slot_size)
+        ct.memmove(self._addresses[slot], data, size)
+        self.sizes[slot] = size
+        self.arrival[slot] = time.perf_counter()
+        self.write_seq += 1  # Publish only after the copy is complete
+        return True
+
+    def _push_container(self, data, size):
+        count, remainder = divmod(size, self.slot_size)
+        if remainder:
+            self.invalid_transfers += 1
+            return False
+        if self.write_seq + count - self.read_seq > self.slots:
+            self.overruns += count
+            return False
+        slot = self.write_seq % self.slots
+        # At most two copies, the second one when the container wraps around the end of the ring
+        first = min(count, self.slots - slot)
+        address = data if isinstance(data, int) else ct.cast(data, ct.c_void_p).value
+        ct.memmove(self._addresses[slot], address, first * self.slot_size)
+        if count > first:
+            ct.memmove(self._addresses[0], address + first * self.slot_size, (count - first) * self.slot_size)
+        slots = (slot + np.arange(count)) % self.slots
+        self.sizes[slots] = self.slot_size
+        self.arrival[slots] = time.perf_counter()
+        self.write_seq += count
+        return True
+
+    def reserve(self):
+        """Pointer to the next free slot for a library call to write a profile into; None while the ring is full."""
+        if self.write_seq - self.read_seq >= self.slots:
+            return None
+        return self._pointers[self.write_seq % self.slots]
+
+    def commit(self, size):
+        """Publish the profile written into the slot from reserve()."""
+        slot = self.write_seq % self.slots
+        self.sizes[slot] = min(size, self.slot_size)
+        self.arrival[slot] = time.perf_counter()
+        self.write_seq += 1
+
+    def available(self):
+        """Number of filled slots not yet released by the reader."""
+        return self.write_seq - self.read_seq
+
+    def view(self, seq=None):
+        """Zero-copy NumPy view of the slot holding sequence number seq (default: oldest unread)."""
+        if seq is None:
+            seq = self.read_seq
+        self._check(seq)
+        return self.data[seq % self.slots]
+
+    def pointer(self, seq=None):
+        """ctypes pointer to the slot holding seq, for the pyllt conversion calls."""
+        if seq is None:
+            seq = self.read_seq
+        self._check(seq)
+        return self._pointers[seq % self.slots]
+
+    def timestamp_pointer(self, seq=None):
+        """ctypes pointer to the 16-byte timestamp at the end of the slot holding seq."""
+        if seq is None:
+            seq = self.read_seq
+        self._check(seq)
+        return self._timestamp_pointers[seq % self.slots]
+
+    def release(self, seq=None):
+        """Hand every slot up to and including seq (default: oldest unread) back to the writer."""
+        if seq is None:
+            seq = self.read_seq
+        self._check(seq)
+        self.read_seq = seq + 1
+
+    def stats(self):
+        return {"written": self.write_seq, "read": self.read_seq,
+                "pending": self.available(), "overruns": self.overruns, "invalid_transfers": self.invalid_transfers}
+
+    def _check(self, seq):
+        if not self.read_seq <= seq < self.write_seq:
+            raise IndexError(f"Profile {seq} is not in the ring (read {self.read_seq}, written {self.write_seq})")
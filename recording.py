@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import numpy as np
+
+MAGIC = b"SCRAPREC"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("profile_size", "<u4"), ("records", "<u8"),
+                         ("reserved", "u1", (40,))])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+
+def record_dtype(profile_size):
+    """One recorded profile: sensor, host arrival time, decoded timestamp, motor angle and the raw buffer."""
+    return np.dtype([("sensor", "u1"), ("counter", "<u4"), ("host_time", "<f8"), ("shutter_time", "<f8"),
+                     ("motor_position", "<f8"), ("raw", "u1", (profile_size,))])
+
+
+class ProfileRecorder:
+    """Append raw profiles to a memory-mapped binary file.
+
+    The file is a 64-byte header followed by fixed-size records. It grows in
+    chunks of `chunk_records`; the record count in the header is updated on
+    every growth and on close, so a reader sees every completed chunk even
+    if the recording was not closed cleanly.
+    """
+
+    def __init__(self, path, profile_size, chunk_records=4096):
+        self.path = path
+        self.profile_size = profile_size
+        self.dtype = record_dtype(profile_size)
+        self.chunk_records = chunk_records
+        self.records = 0
+        self.lock = threading.Lock()
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["profile_size"] = profile_size
+        with open(path, "wb") as f:
+            f.write(header.tobytes())
+        self._map = None
+        self._grow()
+
+    def append(self, sensor, raw, host_time, shutter_time, counter, motor_position):
+        with self.lock:
+            if self.records == len(self._map):
+                self._grow()
+            record = self._map[self.records]
+            record["sensor"] = sensor
+            record["counter"] = counter
+            record["host_time"] = host_time
+            record["shutter_time"] = shutter_time
+            record["motor_position"] = motor_position
+            record["raw"] = raw
+            self.records += 1
+
+    def close(self):
+        with self.lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map = None
+            self._write_count()
+            # Cut the unused part of the last chunk
+            with open(self.path, "r+b") as f:
+                f.truncate(HEADER_SIZE + self.records * self.dtype.itemsize)
+
+    def _grow(self):
+        capacity = (len(self._map) if self._map is not None else 0) + self.chunk_records
+        if self._map is not None:
+            self._map.flush()
+            self._write_count()
+        with open(self.path, "r+b") as f:
+            f.truncate(HEADER_SIZE + capacity * self.dtype.itemsize)
+        self._map = np.memmap(self.path, dtype=self.dtype, mode="r+", offset=HEADER_SIZE, shape=(capacity,))
+
+    def _write_count(self):
+        with open(self.path, "r+b") as f:
+            f.seek(HEADER_DTYPE.fields["records"][1])
+            f.write(np.uint64(self.records).tobytes())
+
+
+def open_recording(path):
+    """Memory-map a recording read-only; returns the record array."""
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError("Not a profile recording: " + str(path))
+    if header["version"][0] != VERSION:
+        raise ValueError("Unsupported recording version: " + str(header["version"][0]))
+    dtype = record_dtype(int(header["profile_size"][0]))
+    available = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    records = min(int(header["records"][0]), available)
+    if records == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(records,))
+
+
+class ReplaySource(threading.Thread):
+    """Feed a recording back through the profile callback, at the recorded rate or as fast as possible.
+
+    `deliver(record)` is called for every record in file order. With
+    `realtime` the original spacing of the host arrival times is kept
+    (scaled by `speed`); otherwise records are delivered back to back.
+    """
+
+    def __init__(self, path, deliver, realtime=True, speed=1.0):
+        super().__init__(name="replay", daemon=True)
+        self.records = open_recording(path)
+        self.deliver = deliver
+        self.realtime = realtime
+        self.speed = speed
+        self.delivered = 0
+        self.elapsed = 0.0
+        self.finished = threading.Event()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        start = time.perf_counter()
+        first = self.records["host_time"][0] if len(self.records) else 0.0
+        for record in self.records:
+            if self._stop_event.is_set():
+                break
+            if self.realtime:
+                delay = (record["host_time"] - first) / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            self.deliver(record)
+            self.delivered += 1
+        self.elapsed = time.perf_counter() - start
+        self.finished.set()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        rate = self.delivered / self.elapsed if self.elapsed else 0.0
+        return {"records": len(self.records), "delivered": self.delivered, "elapsed_s": self.elapsed, "profiles_per_s": rate}
@@ -0,0 +1,242 @@
+import os
+import time
+import zipfile
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+from scipy.spatial import cKDTree
+
+# Bump when the cached index layout changes, so old cache files are rebuilt
+INDEX_VERSION = 2
+
+
+def save_reference(path, sensors):
+    """Save the PointStore points of one good rotation, one array per sensor, as a golden reference scan."""
+    np.savez(path, **{f"sensor{i}": np.asarray(points) for i, points in enumerate(sensors)})
+
+
+def _region_counts(angle, bins):
+    return np.bincount((np.asarray(angle) % 360.0 * bins / 360.0).astype(np.intp) % bins, minlength=bins)
+
+
+class _SensorIndex:
+    """Nearest-point index of one sensor's reference points in the (x, z) plane.
+
+    A rotation repeats every surface point once per profile, so the points
+    are thinned to one per `cell / 4` square first; the cKDTree over them
+    is exact to within that square. The distance grid holds the distance
+    from every cell centre to the nearest reference point, saturated at
+    `max_distance`, so a rotation is compared with one lookup per point.
+    It is built with a Euclidean distance transform of the occupied cells
+    instead of one tree query per cell, which takes minutes on a fine grid,
+    and the cell grows if the grid would have more than `max_cells` cells.
+    """
+
+    def __init__(self, x, z, cell, max_distance, max_cells):
+        points = np.column_stack((x, z))
+        fine = np.floor(points / (cell / 4)).astype(np.int64)
+        _, keep = np.unique(fine[:, 0] * (1 << 32) + fine[:, 1], return_index=True)
+        points = points[keep]
+        self.points = points
+        self.tree = cKDTree(points)
+        self.max_distance = max_distance
+        self.origin = points.min(axis=0) - max_distance
+        cell = max(cell, np.sqrt(np.prod(points.max(axis=0) + max_distance - self.origin) / max_cells))
+        self.cell = cell
+        shape = tuple(np.ceil((points.max(axis=0) + max_distance - self.origin) / cell).astype(int) + 1)
+
+        # One reference point per occupied cell, then the nearest occupied cell of every cell
+        cells = np.floor((points - self.origin) / cell).astype(np.intp)
+        nearest_point = np.zeros(shape + (2,))
+        nearest_point[cells[:, 0], cells[:, 1]] = points
+        occupied = np.zeros(shape, dtype=bool)
+        occupied[cells[:, 0], cells[:, 1]] = True
+        indices = distance_transform_edt(~occupied, return_distances=False, return_indices=True)
+        nearest_point = nearest_point[indices[0], indices[1]]
+        centres = np.stack(np.meshgrid(self.origin[0] + (np.arange(shape[0]) + 0.5) * cell,
+                                       self.origin[1] + (np.arange(shape[1]) + 0.5) * cell, indexing="ij"), axis=-1)
+        distance = np.hypot(*np.moveaxis(centres - nearest_point, -1, 0))
+        self.grid = np.minimum(distance, max_distance).astype(np.float32)
+
+    @classmethod
+    def restore(cls, points, origin, cell, max_distance, grid):
+        """Index from the arrays of a cached one; the cKDTree is rebuilt, which takes a fraction of the grid's time."""
+        index = cls.__new__(cls)
+        index.points = points
+        index.tree = cKDTree(points)
+        index.origin = origin
+        index.cell = float(cell)
+        index.max_distance = float(max_distance)
+        index.grid = grid
+        return index
+
+    def lookup(self, x, z):
+        """Distance to the reference from the grid, to about a cell."""
+        # Points outside the grid take the border cells, which are max_distance from the reference
+        ix = ((x - self.origin[0]) / self.cell).astype(np.intp)
+        iz = ((z - self.origin[1]) / self.cell).astype(np.intp)
+        np.maximum(ix, 0, out=ix)
+        np.minimum(ix, self.grid.shape[0] - 1, out=ix)
+        np.maximum(iz, 0, out=iz)
+        np.minimum(iz, self.grid.shape[1] - 1, out=iz)
+        ix *= self.grid.shape[1]
+        ix += iz
+        return self.grid.ravel().take(ix)
+
+    def query(self, x, z):
+        """Distance to the nearest reference point from the cKDTree."""
+        distance, _ = self.tree.query(np.column_stack((x, z)), workers=-1)
+        return distance
+
+
+class ReferencePart:
+    """Golden scan of a good part with a nearest-point index per sensor.
+
+    The reference is a file written by save_reference(). Per sensor a
+    cKDTree and a distance grid over the reference points are built once and
+    saved next to the reference file ("<reference>.index.npz", plain arrays,
+    no pickle); the cKDTree is rebuilt from the points on load. The cache
+    is rebuilt when the reference file or the index parameters change.
+    """
+
+    def __init__(self, path, cell=0.05, max_distance=5.0, max_cells=1 << 22, cache_path=None):
+        self.path = path
+        self.cache_path = cache_path or path + ".index.npz"
+        stat = os.stat(path)
+        key = np.array([INDEX_VERSION, stat.st_size, stat.st_mtime_ns, max_cells], dtype=np.int64), np.array([cell, max_distance])
+        self.indexes = self._load_cache(key)
+        self.loaded_from_cache = self.indexes is not None
+        reference = np.load(path)
+        sensors = [reference[f"sensor{i}"] for i in range(len(reference.files))]
+        if self.indexes is None:
+            self.indexes = [_SensorIndex(points["x"], points["z"], cell, max_distance, max_cells) for points in sensors]
+            self._save_cache(key)
+        self.angles = [points["angle"] for points in sensors]
+
+    def _load_cache(self, key):
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as cached:
+                if not (np.array_equal(cached["key"], key[0]) and np.array_equal(cached["parameters"], key[1])):
+                    return None
+                return [_SensorIndex.restore(cached[f"points{i}"], cached[f"origin{i}"], cached[f"cell{i}"],
+                                             cached[f"max_distance{i}"], cached[f"grid{i}"])
+                        for i in range(int(cached["sensors"]))]
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+
+    def _save_cache(self, key):
+        arrays = {"key": key[0], "parameters": key[1], "sensors": len(self.indexes)}
+        for i, index in enumerate(self.indexes):
+            arrays.update({f"points{i}": index.points, f"origin{i}": index.origin, f"cell{i}": index.cell,
+                           f"max_distance{i}": index.max_distance, f"grid{i}": index.grid})
+        # Written under a temporary name first, so an interrupted run leaves no half-written cache
+        temporary = self.cache_path + ".tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, self.cache_path)
+
+    def deviation(self, sensor, x, z, exact=False):
+        """Distance (mm) from every point to the nearest reference point of `sensor`."""
+        index = self.indexes[sensor]
+        return index.query(x, z) if exact else index.lookup(x, z)
+
+
+class ReferenceComparison:
+    """Deviation of one rotation from a ReferencePart, accumulated profile by profile.
+
+    update() looks up the deviation of every point of a profile and adds it
+    to the totals of the profile's motor angle region, so at the end of
+    the rotation verdict() only sums up `region_bins` counters. A rotation
+    fails when more than `max_fraction` of all points or
+    `region_max_fraction` of the points of a region are further than
+    `tolerance` (mm) from the reference, or when a region holds less than
+    `min_region_coverage` of the share of the points it has in the
+    reference: missing material gives no points, so it cannot show up as
+    deviation.
+    """
+
+    def __init__(self, reference, tolerance=0.5, max_fraction=0.01, region_bins=36, region_max_fraction=0.05,
+                 min_region_coverage=0.5):
+        self.reference = reference
+        self.tolerance = tolerance
+        self.max_fraction = max_fraction
+        self.region_bins = region_bins
+        self.region_max_fraction = region_max_fraction
+        self.min_region_coverage = min_region_coverage
+        sensors = len(reference.indexes)
+        self.region_share = np.array([_region_counts(angle, region_bins) / max(len(angle), 1) for angle in reference.angles])
+        self.points = np.zeros((sensors, region_bins), dtype=np.int64)
+        self.beyond = np.zeros((sensors, region_bins), dtype=np.int64)
+        self.sum = np.zeros((sensors, region_bins))
+        self.max = np.zeros((sensors, region_bins))
+        self.seconds = 0.0
+
+    def reset(self):
+        self.points[:] = 0
+        self.beyond[:] = 0
+        self.sum[:] = 0.0
+        self.max[:] = 0.0
+        self.seconds = 0.0
+
+    def update(self, sensor, x, z, angle):
+        """Add the points of one profile recorded at motor angle `angle`; an array of angles per point works too."""
+        if not len(x):
+            return
+        start = time.perf_counter()
+        deviation = self.reference.deviation(sensor, x, z)
+        out = deviation > self.tolerance
+        if np.ndim(angle) == 0:
+            # All points of a profile share its motor angle, so the region totals are scalar updates
+            b = int(angle % 360.0 * self.region_bins / 360.0) % self.region_bins
+            self.points[sensor, b] += len(x)
+            self.beyond[sensor, b] += np.count_nonzero(out)
+            self.sum[sensor, b] += float(deviation.sum())
+            self.max[sensor, b] = max(self.max[sensor, b], float(deviation.max()))
+        else:
+            regions = (np.asarray(angle) % 360.0 * self.region_bins / 360.0).astype(np.intp) % self.region_bins
+            self.points[sensor] += np.bincount(regions, minlength=self.region_bins)
+            self.beyond[sensor] += np.bincount(regions[out], minlength=self.region_bins)
+            self.sum[sensor] += np.bincount(regions, weights=deviation, minlength=self.region_bins)
+            np.maximum.at(self.max[sensor], regions, deviation)
+        self.seconds += time.perf_counter() - start
+
+    def verdict(self):
+        """Pass/fail of the rotation with the overall deviation and the worst region."""
+        total = self.points.sum()
+        region_points = self.points.sum(axis=0)
+        region_beyond = self.beyond.sum(axis=0)
+        region_max = self.max.max(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            region_fraction = np.where(region_points > 0, region_beyond / region_points, 0.0)
+            region_mean = np.where(region_points > 0, self.sum.sum(axis=0) / region_points, np.nan)
+            coverage = self.points / self.points.sum(axis=1, keepdims=True) / self.region_share
+        missing = ((self.region_share > 0) & ~(coverage >= self.min_region_coverage)).any(axis=0)
+        fraction = region_beyond.sum() / total if total else 1.0
+
+        # The region with the most points out of tolerance, or the largest mean deviation if there are none
+        if region_fraction.any():
+            w = int(np.argmax(region_fraction))
+        else:
+            w = int(np.argmax(np.nan_to_num(region_mean, nan=-1.0)))
+        width = 360.0 / self.region_bins
+        passed = total > 0 and fraction <= self.max_fraction and region_fraction.max() <= self.region_max_fraction \
+            and not missing.any()
+        return {"passed": bool(passed),
+                "points": int(total),
+                "mean": float(self.sum.sum() / total) if total else np.nan,
+                "max": float(region_max.max()),
+                "fraction_out_of_tolerance": float(fraction),
+                "worst_region": {"angle": (w * width, (w + 1) * width),
+                                 "points": int(region_points[w]),
+                                 "mean": float(region_mean[w]),
+                                 "max": float(region_max[w]),
+                                 "fraction_out_of_tolerance": float(region_fraction[w])},
+                "missing_regions": [(float(i * width), float((i + 1) * width)) for i in np.flatnonzero(missing)],
+                "seconds": self.seconds}
+
+
+def compare_rotation(comparison, sensors):
+    """Verdict for the PointStore points of a whole rotation, one array per sensor in reference order."""
+    comparison.reset()
+    for sensor, points in enumerate(sensors):
+        comparison.update(sensor, points["x"], points["z"], points["angle"])
+    return comparison.verdict()
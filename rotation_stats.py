@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class RadiusStats:
+    """Streaming radius statistics of one sensor over one rotation.
+
+    Each profile is reduced to its count, mean and sum of squared deviations
+    and merged into the running totals (Welford/Chan), together with min/max
+    and the same moments per motor angle bin. All points of a profile share
+    the profile's motor angle, so the per-bin update is a scalar merge and
+    `finalize()` costs the same however many points the rotation had.
+    """
+
+    def __init__(self, angle_bins=360):
+        self.angle_bins = angle_bins
+        self.bin_count = np.zeros(angle_bins, dtype=np.int64)
+        self.bin_mean = np.zeros(angle_bins)
+        self.bin_m2 = np.zeros(angle_bins)
+        self.bin_min = np.full(angle_bins, np.inf)
+        self.bin_max = np.full(angle_bins, -np.inf)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.bin_count[:] = 0
+        self.bin_mean[:] = 0.0
+        self.bin_m2[:] = 0.0
+        self.bin_min[:] = np.inf
+        self.bin_max[:] = -np.inf
+
+    def update(self, x, z, angle):
+        """Merge the points of one profile recorded at motor angle `angle` (degrees)."""
+        count = len(x)
+        if not count:
+            return
+        radius = np.sqrt(x**2 + z**2)
+        mean = radius.mean()
+        deviation = radius - mean
+        m2 = np.dot(deviation, deviation)
+        low = radius.min()
+        high = radius.max()
+
+        self.count, self.mean, self.m2 = _merge(self.count, self.mean, self.m2, count, mean, m2)
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+        b = int(angle % 360.0 * self.angle_bins / 360.0) % self.angle_bins
+        self.bin_count[b], self.bin_mean[b], self.bin_m2[b] = _merge(self.bin_count[b], self.bin_mean[b], self.bin_m2[b],
+                                                                     count, mean, m2)
+        self.bin_min[b] = min(self.bin_min[b], low)
+        self.bin_max[b] = max(self.bin_max[b], high)
+
+    def finalize(self):
+        """Summary of the rotation; std is the population std like np.std."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bin_std = np.sqrt(self.bin_m2 / self.bin_count)
+        return {"count": self.count,
+                "mean": self.mean if self.count else np.nan,
+                "std": np.sqrt(self.m2 / self.count) if self.count else np.nan,
+                "min": self.min,
+                "max": self.max,
+                "bin_count": self.bin_count.copy(),
+                "bin_mean": np.where(self.bin_count > 0, self.bin_mean, np.nan),
+                "bin_std": bin_std,
+                "bin_min": self.bin_min.copy(),
+                "bin_max": self.bin_max.copy()}
+
+
+def _merge(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / count
+    return count, mean, m2
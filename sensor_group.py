@@ -0,0 +1,378 @@
+import argparse
+import ctypes as ct
+import json
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from device_setup import DeviceBringUp
+from profile_decoder import convert_block_with_library, decoder_for, TimestampReader
+from profile_pairing import ProfilePairer
+from profile_rate import ProfileGapDetector, encode_time_code
+from profile_ring import ProfileRing
+
+# Partial profile of every head: X and Z word of every point
+START_DATA = 4
+DATA_WIDTH = 4
+TIMESTAMP_CHECK_PROFILES = 200
+
+
+def parse_interface(interface):
+    """pyllt interface number of "192.168.0.4" style addresses; numbers are passed through."""
+    if isinstance(interface, str):
+        return struct.unpack(">I", socket.inet_aton(interface))[0]
+    return int(interface)
+
+
+def load_sensor_config(path):
+    """Group settings and one entry per head from a JSON file.
+
+    {"exposure_us": 120, "idle_us": 4500, "ring_slots": 256, "frame_tolerance": 100e-6, "max_age": 0.5,
+     "sensors": [{"name": "top", "interface": "192.168.0.4", "pose": {"angle_deg": 0, "x": 0, "z": 0}}, ...]}
+
+    Only "sensors" with a name and interface per head is required.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if not config.get("sensors"):
+        raise ValueError("Error in sensor config: no sensors in " + path)
+    for entry in config["sensors"]:
+        if "name" not in entry or "interface" not in entry:
+            raise ValueError("Error in sensor config: every sensor needs a name and an interface: " + str(entry))
+    return config
+
+
+class SensorPose:
+    """Where a head sits in the cell: rotation (degrees) and offset (mm) of its laser plane, optionally mirrored in x.
+
+    Maps the head's own x/z into the common frame of the cell, so the
+    profiles of heads around the part line up.
+    """
+
+    def __init__(self, angle_deg=0.0, x=0.0, z=0.0, mirror=False):
+        self.angle_deg = angle_deg
+        self.cos = np.cos(np.deg2rad(angle_deg))
+        self.sin = np.sin(np.deg2rad(angle_deg))
+        self.x = x
+        self.z = z
+        self.mirror = mirror
+
+    def apply(self, x, z, valid):
+        """(K, points) blocks of x and z in the cell frame; invalid points stay at 0."""
+        if self.mirror:
+            x = -x
+        x_cell = np.where(valid, self.cos * x - self.sin * z + self.x, 0.0)
+        z_cell = np.where(valid, self.sin * x + self.cos * z + self.z, 0.0)
+        return x_cell, z_cell
+
+
+class ConvertedRing:
+    """Converted profiles of one head waiting to be matched into frames, one writer and one reader thread."""
+
+    def __init__(self, points, slots=256):
+        self.slots = slots
+        self.x = np.zeros((slots, points))
+        self.z = np.zeros((slots, points))
+        self.valid = np.zeros((slots, points), dtype=bool)
+        self.shutter_time = np.zeros(slots)
+        self.counter = np.zeros(slots, dtype=np.int64)
+        self.write_seq = 0
+        self.read_seq = 0
+
+    def free(self):
+        return self.slots - (self.write_seq - self.read_seq)
+
+    def write(self, x, z, valid, shutter_time, counter):
+        slots = (self.write_seq + np.arange(len(x))) % self.slots
+        self.x[slots] = x
+        self.z[slots] = z
+        self.valid[slots] = valid
+        self.shutter_time[slots] = shutter_time
+        self.counter[slots] = counter
+        self.write_seq += len(x)  # Publish only after the copy is complete
+
+    def release(self, seq):
+        self.read_seq = seq + 1
+
+
+class Sensor:
+    """One head of a group: its device, ring, decoders, pose and counters."""
+
+    def __init__(self, index, name, interface, pose):
+        self.index = index
+        self.name = name
+        self.interface = interface
+        self.pose = pose
+        self.device = None
+        self.resolution = None
+        self.scanner_type = ct.c_int(0)
+        self.profile_struct = None
+        self.decoder = None
+        self.ring = None
+        self.converted = None
+        self.event = threading.Event()
+        self.gaps = ProfileGapDetector()
+        self.timestamps = None
+        self.convert_seconds = 0.0
+        self.convert_count = 0
+
+
+class SensorGroup:
+    """Acquisition of any number of heads, configured from a file, matched into frames.
+
+    Every head has its own ring, and its own thread that decodes the
+    timestamps and X/Z of new profiles in blocks and moves them into the
+    cell frame with the head's pose, so the per-head work runs side by
+    side (NumPy releases the GIL for the block operations) instead of in
+    one loop. frames() matches the converted profiles of all heads into
+    frames with the same ProfilePairer corecode.py pairs its two sensors
+    with, on shutter time and profile counter, and yields blocks of
+    complete frames. The heads are brought up concurrently; if one fails,
+    all are undone.
+
+    The group is acquisition only: frames carry the shutter time but no
+    motor angle, and corecode.py does not use it. Its point
+    stores, rotation statistics, height maps and reference comparison are
+    still built for the fixed top/bottom pair, so the group runs on its
+    own (`python sensor_group.py sensors.json`) and in
+    benchmarks/bench_sensor_group.py.
+    """
+
+    def __init__(self, config, llt, block=64):
+        self.config = config
+        self.llt = llt
+        self.block = block
+        self.sensors = [Sensor(i, entry["name"], parse_interface(entry["interface"]), SensorPose(**entry.get("pose", {})))
+                        for i, entry in enumerate(config["sensors"])]
+        self.ring_slots = config.get("ring_slots", 256)
+        self.transfer_type = llt.TTransferProfileType.NORMAL_TRANSFER
+        # A head can be a whole block of converted profiles ahead of the others, so up to a ring of them can wait
+        self.pairer = ProfilePairer(time_tolerance=config.get("frame_tolerance", 100e-6), max_age=config.get("max_age", 0.5),
+                                    max_pending=self.ring_slots, sensors=len(self.sensors))
+        for sensor in self.sensors:
+            # The bulk decoding is checked against pyllt on the first profiles of every head
+            sensor.timestamps = TimestampReader(llt, TIMESTAMP_CHECK_PROFILES, sensor.name)
+        # One callback for all heads; user_data is the head's index + 1
+        self._callback = llt.buffer_cb_func(self._profile_callback)
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self.bring_up = None
+
+    @classmethod
+    def from_file(cls, path, llt, block=64):
+        return cls(load_sensor_config(path), llt, block)
+
+    def _profile_callback(self, data, size, user_data):
+        sensor = self.sensors[user_data - 1]
+        sensor.ring.push(data, size)
+        sensor.event.set()
+
+    def _steps(self, sensor):
+        llt = self.llt
+        exposure = encode_time_code(self.config.get("exposure_us", 120))
+        idle = encode_time_code(self.config.get("idle_us", 4500))
+
+        def check(ret, what):
+            if ret < 1:
+                raise ValueError(f"Error {what} for {sensor.name}: {ret}")
+            return ret
+
+        def device(done):
+            sensor.device = llt.create_llt_device(llt.TInterfaceType.INTF_TYPE_ETHERNET)
+            return sensor.device
+
+        def connect(done):
+            check(llt.set_device_interface(sensor.device, sensor.interface, 0), "setting device interface")
+            ret = llt.connect(sensor.device)
+            if ret < 1:
+                raise ConnectionError(f"Error connect {sensor.name}: {ret}")
+
+        def resolution(done):
+            resolutions = (ct.c_uint * 4)()
+            check(llt.get_resolutions(sensor.device, resolutions, len(resolutions)), "getting resolutions")
+            sensor.resolution = resolutions[0]
+            check(llt.set_resolution(sensor.device, sensor.resolution), "setting resolution")
+            check(llt.get_llt_type(sensor.device, ct.byref(sensor.scanner_type)), "getting scanner type")
+
+        def configure(done):
+            check(llt.set_feature(sensor.device, llt.FEATURE_FUNCTION_EXPOSURE_TIME, exposure), "setting exposure time")
+            check(llt.set_feature(sensor.device, llt.FEATURE_FUNCTION_IDLE_TIME, idle), "setting idle time")
+            check(llt.set_profile_config(sensor.device, llt.TProfileConfig.PARTIAL_PROFILE), "setting profile config")
+            check(llt.set_feature(sensor.device, llt.FEATURE_FUNCTION_TRIGGER, llt.TRIG_INTERNAL), "setting trigger")
+            sensor.profile_struct = llt.TPartialProfile(0, START_DATA, sensor.resolution, DATA_WIDTH)
+            check(llt.set_partial_profile(sensor.device, ct.byref(sensor.profile_struct)), "setting partial profile")
+
+        def decoder(done):
+            sensor.decoder = decoder_for(llt, sensor.device, sensor.scanner_type, sensor.resolution)
+
+        def callback(done):
+            sensor.ring = ProfileRing(sensor.resolution * DATA_WIDTH, self.ring_slots)
+            sensor.converted = ConvertedRing(sensor.resolution, self.ring_slots)
+            check(llt.register_callback(sensor.device, llt.TCallbackType.C_DECL, self._callback, sensor.index + 1),
+                  "setting callback")
+
+        return [("device", device, lambda done: llt.del_device(sensor.device)),
+                ("connect", connect, lambda done: llt.disconnect(sensor.device)),
+                ("resolution", resolution),
+                ("configure", configure),
+                ("decoder", decoder),
+                ("callback", callback)]
+
+    def connect(self, timeout=10.0):
+        """Bring up all heads at once; raises RuntimeError after undoing everything if one fails."""
+        self.bring_up = DeviceBringUp(timeout=timeout)
+        for sensor in self.sensors:
+            self.bring_up.add(sensor.name, self._steps(sensor))
+        self.bring_up.run()
+
+    def start(self):
+        """Start the conversion threads and the transfer of every head."""
+        self._stop.clear()
+        for sensor in self.sensors:
+            thread = threading.Thread(target=self._convert_loop, args=(sensor,), name=f"convert {sensor.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        for sensor in self.sensors:
+            ret = self.llt.transfer_profiles(sensor.device, self.transfer_type, 1)
+            if ret < 1:
+                raise ValueError(f"Error starting transfer profiles for {sensor.name}: {ret}")
+
+    def _convert_loop(self, sensor):
+        ring, converted = sensor.ring, sensor.converted
+        while not self._stop.is_set():
+            sensor.event.wait(0.05)
+            sensor.event.clear()
+            while True:
+                start = ring.read_seq
+                end = min(ring.write_seq, start + self.block, start + converted.free())
+                if end <= start:
+                    break
+                begin = time.perf_counter()
+                raw = ring.data[np.arange(start, end) % ring.slots]
+                ring.release(end - 1)
+                shutter_times, counters = sensor.timestamps.read(raw[:, -16:])
+                for counter in counters.tolist():
+                    sensor.gaps.update(counter)
+                x, z = self._decode(sensor, raw)
+                valid = (x != 0.0) & (z != 0.0)
+                x, z = sensor.pose.apply(x, z, valid)
+                converted.write(x, z, valid, shutter_times, counters)
+                sensor.convert_seconds += time.perf_counter() - begin
+                sensor.convert_count += end - start
+                self._ready.set()
+
+    def _decode(self, sensor, raw):
+        if sensor.decoder is not None:
+            return sensor.decoder.decode(raw)
+        # Per-profile library conversion, used if the conversion tables could not be captured
+        x, z, _ = convert_block_with_library(self.llt, sensor.device, sensor.profile_struct, sensor.scanner_type, raw)
+        return x, z
+
+    def frames(self, timeout=0.1):
+        """Yield blocks of complete frames: (shutter times (K,), [(x, z, valid) of shape (K, points) per head]).
+
+        Yields None when no frame was completed within `timeout`, so the
+        caller can check for a stop request.
+        """
+        pairer = self.pairer
+        next_seq = [0] * len(self.sensors)
+        while not self._stop.is_set():
+            if not self._ready.wait(timeout):
+                yield None
+                continue
+            self._ready.clear()
+            # One profile of every head in turn, like corecode.py's pair_new_profiles
+            frames = []
+            end_seq = [sensor.converted.write_seq for sensor in self.sensors]
+            while any(seq < end for seq, end in zip(next_seq, end_seq)):
+                for sensor in self.sensors:
+                    seq = next_seq[sensor.index]
+                    if seq < end_seq[sensor.index]:
+                        slot = seq % sensor.converted.slots
+                        frame = pairer.add(sensor.index, seq, sensor.converted.shutter_time[slot], sensor.converted.counter[slot])
+                        if frame is not None:
+                            frames.append(frame)
+                        next_seq[sensor.index] = seq + 1
+            if frames:
+                seqs = np.array(frames)
+                blocks = []
+                for sensor in self.sensors:
+                    converted = sensor.converted
+                    slots = seqs[:, sensor.index] % converted.slots
+                    blocks.append((converted.x[slots], converted.z[slots], converted.valid[slots]))
+                shutter_times = self.sensors[0].converted.shutter_time[seqs[:, 0] % self.sensors[0].converted.slots]
+            # Matched and dropped profiles go back to the conversion threads
+            for sensor in self.sensors:
+                settled = pairer.settled(sensor.index)
+                if settled >= sensor.converted.read_seq:
+                    sensor.converted.release(settled)
+            if frames:
+                yield shutter_times, blocks
+
+    def stop(self):
+        """Stop the transfers and the conversion threads."""
+        for sensor in self.sensors:
+            if sensor.device is not None:
+                self.llt.transfer_profiles(sensor.device, self.transfer_type, 0)
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def close(self):
+        for sensor in self.sensors:
+            if sensor.device is not None:
+                self.llt.disconnect(sensor.device)
+                self.llt.del_device(sensor.device)
+                sensor.device = None
+
+    def stats(self):
+        """Per head: profiles received, lost (counter gaps), ring overruns, unmatched and conversion time."""
+        return {"frames": self.pairer.pairs,
+                "sensors": {sensor.name: {"received": sensor.gaps.received,
+                                          "lost": sensor.gaps.lost,
+                                          "overruns": sensor.ring.overruns if sensor.ring is not None else 0,
+                                          "unmatched": self.pairer.dropped[sensor.index],
+                                          "convert_us_per_profile": 1e6 * sensor.convert_seconds / max(sensor.convert_count, 1)}
+                            for sensor in self.sensors}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acquire frames from the heads of a sensor config file and report the rates.")
+    parser.add_argument("config", help="JSON file with the heads, e.g. sensors.json")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to acquire")
+    args = parser.parse_args()
+
+    import pyllt as llt
+    group = SensorGroup.from_file(args.config, llt)
+    try:
+        group.connect()
+    finally:
+        if group.bring_up is not None:
+            print(group.bring_up.report())
+    group.start()
+    start = time.perf_counter()
+    cpu = time.process_time()
+    frames = 0
+    try:
+        for block in group.frames():
+            if block is not None:
+                frames += len(block[0])
+            if time.perf_counter() - start >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        group.stop()
+        group.close()
+    print(f"{len(group.sensors)} heads: {frames / elapsed:.0f} frames/s, {100 * cpu / elapsed:.0f} % CPU")
+    for name, stats in group.stats()["sensors"].items():
+        print(f"  {name}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+"""Simulated stand-in for the scanCONTROL pyllt module.
+
+Implements the pyllt calls used by the scripts in this repository without
+any sensor attached. Put this directory first on the module path to use it:
+
+    PYTHONPATH=sim python Plot2Dlasers.py
+
+Each device with an active transfer fires its registered callback from a
+background thread with synthetic profiles of a rotating part, one profile
+per callback or, with NORMAL_CONTAINER_MODE, a container of
+set_profile_container_size() profiles back to back. Without a registered
+callback the transfers are buffered for get_actual_profile(). All devices
+share one shutter schedule, so profiles of different heads pair by
+timestamp like real, synchronised sensors. Simulation settings come from
+`configure_simulation()` or the environment:
+
+    PYLLT_SIM_FREQUENCY   profile frequency in Hz (default: from exposure + idle time)
+    PYLLT_SIM_JITTER      standard deviation of the callback delivery delay in s
+    PYLLT_SIM_DROP_RATE   probability that a profile is lost before the callback
+    PYLLT_SIM_RPM         rotation speed of the simulated part
+    PYLLT_SIM_SEED        random seed
+    PYLLT_SIM_CALL_LATENCY  seconds every connect/configuration call blocks, like a network round trip
+"""
+import ctypes as ct
+import os
+import struct
+import threading
+import time
+from collections import deque
+import numpy as np
+
+SIMULATED = True
+
+
+class TInterfaceType:
+    INTF_TYPE_UNKNOWN = 0
+    INTF_TYPE_SERIAL = 1
+    INTF_TYPE_FIREWIRE = 2
+    INTF_TYPE_ETHERNET = 3
+
+
+class TProfileConfig:
+    NONE = 0
+    PROFILE = 1
+    CONTAINER = 1
+    VIDEO_IMAGE = 1
+    PURE_PROFILE = 2
+    QUARTER_PROFILE = 3
+    CSV_PROFILE = 4
+    PARTIAL_PROFILE = 5
+
+
+class TCallbackType:
+    STD_CALL = 0
+    C_DECL = 1
+
+
+class TTransferProfileType:
+    NORMAL_TRANSFER = 0
+    SHOT_TRANSFER = 1
+    NORMAL_CONTAINER_MODE = 2
+    SHOT_CONTAINER_MODE = 3
+    NONE_TRANSFER = 4
+
+
+class TScannerType:
+    scanCONTROL30xx_50 = 7003
+
+
+class TPartialProfile(ct.Structure):
+    _fields_ = [("nStartPoint", ct.c_uint),
+                ("nStartPointData", ct.c_uint),
+                ("nPointCount", ct.c_uint),
+                ("nPointDataWidth", ct.c_uint)]
+
+
+buffer_cb_func = ct.CFUNCTYPE(None, ct.POINTER(ct.c_ubyte), ct.c_uint, ct.c_uint)
+
+FEATURE_FUNCTION_SERIAL = 0xf0000410
+FEATURE_FUNCTION_LASERPOWER = 0xf0f00824
+FEATURE_FUNCTION_EXPOSURE_TIME = 0xf0f0081c
+FEATURE_FUNCTION_IDLE_TIME = 0xf0f00800
+FEATURE_FUNCTION_TRIGGER = 0xf0f00830
+FEATURE_FUNCTION_PROFILE_REARRANGEMENT = 0xf0b0200c
+TRIG_INTERNAL = 0x00000000
+
+CONVERT_WIDTH = 0x0100
+CONVERT_MAXIMUM = 0x0200
+CONVERT_THRESHOLD = 0x0400
+CONVERT_X = 0x0800
+CONVERT_Z = 0x1000
+CONVERT_M0 = 0x2000
+CONVERT_M1 = 0x4000
+
+GENERAL_FUNCTION_OK = 1
+ERROR_GENERAL_DEVICE_BUSY = -9
+ERROR_GENERAL_NOT_CONNECTED = -10
+ERROR_GENERAL_POINTER_MISSING = -12
+ERROR_PROFTRANS_WRONG_DATA_SIZE = -102
+ERROR_PROFTRANS_NO_NEW_PROFILE = -104
+ERROR_TRANSFERPROFILES_WRONG_PROFILE_CONFIG = -151
+
+# Raw 16-bit X/Z words are scaled like a 30xx-50 head
+X_SCALE = 0.005
+Z_SCALE = 0.005
+Z_OFFSET = 160.0
+TIMESTAMP_WRAP = 128.0
+# Shutter times are fixed point like the sensors': 7 bits of seconds, 13 bits of 1/8000 s cycles, 12 bits of cycle offset
+TIMESTAMP_CYCLES = 8000
+TIMESTAMP_OFFSETS = 4096
+RESOLUTIONS = (2048, 1024, 512, 256)
+INTERFACES = (3232235524, 3232235527)
+ANGLE_STEPS = 720
+
+_settings = {
+    "frequency": float(os.environ["PYLLT_SIM_FREQUENCY"]) if "PYLLT_SIM_FREQUENCY" in os.environ else None,
+    "jitter": float(os.environ.get("PYLLT_SIM_JITTER", 20e-6)),
+    "drop_rate": float(os.environ.get("PYLLT_SIM_DROP_RATE", 0.0)),
+    "rpm": float(os.environ.get("PYLLT_SIM_RPM", 30.0)),
+    "seed": int(os.environ.get("PYLLT_SIM_SEED", 0)),
+    "call_latency": float(os.environ.get("PYLLT_SIM_CALL_LATENCY", 0.0)),
+}
+_epoch = time.perf_counter()
+_devices = {}
+_next_handle = [1]
+_lock = threading.Lock()
+
+
+def configure_simulation(**settings):
+    """Override simulation settings (frequency, jitter, drop_rate, rpm, seed, call_latency) for devices started afterwards."""
+    for key, value in settings.items():
+        if key not in _settings:
+            raise ValueError("Unknown simulation setting: " + key)
+        _settings[key] = value
+
+
+def simulated_motor_position(t=None):
+    """Angle in degrees of the simulated part at host time t (time.perf_counter)."""
+    if t is None:
+        t = time.perf_counter()
+    return ((t - _epoch) * _settings["rpm"] / 60.0 * 360.0) % 360.0
+
+
+def decode_time_code(code):
+    """Inverse of the exposure/idle time encoding used by the scripts: time in µs."""
+    return (code & 0xFFF) * 10 + ((code >> 12) & 0xF)
+
+
+class _Device:
+    def __init__(self):
+        self.interface = None
+        self.connected = False
+        self.resolution = RESOLUTIONS[0]
+        self.profile_config = TProfileConfig.PROFILE
+        self.partial = TPartialProfile(0, 0, RESOLUTIONS[0], 16)
+        self.features = {FEATURE_FUNCTION_EXPOSURE_TIME: 100, FEATURE_FUNCTION_IDLE_TIME: 900,
+                         FEATURE_FUNCTION_TRIGGER: TRIG_INTERNAL}
+        self.callback = None
+        self.user_data = 0
+        self.transfer_type = TTransferProfileType.NORMAL_TRANSFER
+        self.container_height = 1
+        self.thread = None
+        self.stop = threading.Event()
+        self.counter_offset = 0
+        self.sent = 0
+        self.dropped = 0
+        self.callbacks = 0
+        # Transfers kept for get_actual_profile() when no callback is registered
+        self.polled = deque()
+        self.poll_lock = threading.Lock()
+        self.buffer_count = 20
+        self.hold_buffers = False
+        self.poll_lost = 0
+
+    def frequency(self):
+        if _settings["frequency"]:
+            return _settings["frequency"]
+        period = decode_time_code(self.features[FEATURE_FUNCTION_EXPOSURE_TIME]) + \
+            decode_time_code(self.features[FEATURE_FUNCTION_IDLE_TIME])
+        return 1e6 / max(period, 1)
+
+    def profile_size(self):
+        return self.partial.nPointCount * self.partial.nPointDataWidth
+
+    def build_profiles(self, rng):
+        """Raw partial profiles of the part for every angle step, X and Z words big-endian."""
+        count = self.partial.nPointCount
+        x = np.linspace(-30.0, 30.0, count)
+        angles = np.deg2rad(np.arange(ANGLE_STEPS) * 360.0 / ANGLE_STEPS)[:, None]
+        # Eccentric cylinder with a notch that passes the sensor once per turn
+        z = 150.0 + 1.5 * np.sin(angles) + 0.002 * x**2 + rng.normal(0.0, 0.01, (ANGLE_STEPS, count))
+        notch = (np.abs(np.rad2deg(angles) - 200.0) < 5.0) & (np.abs(x - 5.0) < 3.0)
+        z = z + 2.0 * notch
+        raw_x = np.clip(np.round(x / X_SCALE + 32768), 1, 65535).astype(np.uint16)
+        raw_z = np.clip(np.round((z - Z_OFFSET) / Z_SCALE + 32768), 1, 65535).astype(np.uint16)
+        # Nothing to measure beside the part, plus random dropouts on it
+        raw_z[:, np.abs(x) > 24.0] = 0
+        raw_z[rng.random((ANGLE_STEPS, count)) < 0.01] = 0
+
+        words = np.zeros((ANGLE_STEPS, count, 8), dtype=">u2")
+        words[..., 2] = np.broadcast_to(raw_x, (ANGLE_STEPS, count))
+        words[..., 3] = raw_z
+        full = words.view(np.uint8).reshape(ANGLE_STEPS, count * 16)
+        point_bytes = full.reshape(ANGLE_STEPS, count, 16)
+        start = self.partial.nStartPointData
+        width = self.partial.nPointDataWidth
+        return np.ascontiguousarray(point_bytes[:, :, start:start + width]).reshape(ANGLE_STEPS, count * width)
+
+    def run(self):
+        rng = np.random.default_rng(_settings["seed"] + self.user_data)
+        profiles = self.build_profiles(rng)
+        size = self.profile_size()
+        # In container mode profiles are collected back to back and delivered with one callback per container
+        height = self.container_height if self.transfer_type == TTransferProfileType.NORMAL_CONTAINER_MODE else 1
+        container = np.zeros((height, size), dtype=np.uint8)
+        pointer = container.ctypes.data_as(ct.POINTER(ct.c_ubyte))
+        filled = 0
+        period = 1.0 / self.frequency()
+        n = int((time.perf_counter() - _epoch) / period) + 1
+        k = n
+
+        while not self.stop.is_set():
+            if 1.0 / self.frequency() != period:
+                # Exposure and idle time changes take effect from the next profile on, on the grid of
+                # shutter times all devices share, so top and bottom profiles still pair
+                elapsed = n * period
+                period = 1.0 / self.frequency()
+                n = int(elapsed / period) + 1
+            shutter = _epoch + n * period
+            delivery = shutter + period + abs(rng.normal(0.0, _settings["jitter"]))
+            delay = delivery - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1.0:
+                # Far behind, as a real sensor would, skip ahead and lose the profiles in between
+                skipped = int(-delay / period)
+                n += skipped
+                k += skipped
+                self.dropped += skipped
+                continue
+
+            angle_step = int(simulated_motor_position(shutter) / 360.0 * ANGLE_STEPS) % ANGLE_STEPS
+            buffer = container[filled]
+            buffer[:] = profiles[angle_step]
+            exposure = decode_time_code(self.features[FEATURE_FUNCTION_EXPOSURE_TIME]) * 1e-6
+            buffer[size - 16:] = np.frombuffer(_encode_timestamp((shutter - _epoch) % TIMESTAMP_WRAP, exposure,
+                                                                 k + self.counter_offset), dtype=np.uint8)
+            n += 1
+            k += 1
+            if rng.random() < _settings["drop_rate"]:
+                self.dropped += 1
+                continue
+            filled += 1
+            if filled < height:
+                continue
+            filled = 0
+            if self.callback is not None:
+                self.callback(pointer, size * height, self.user_data)
+                self.sent += height
+                self.callbacks += 1
+            else:
+                with self.poll_lock:
+                    if len(self.polled) >= self.buffer_count:
+                        # Nobody fetched in time, the oldest buffer is overwritten
+                        self.polled.popleft()
+                        self.poll_lost += height
+                        self.dropped += height
+                    self.polled.append(container.copy())
+                self.sent += height
+
+
+def _time_code(seconds):
+    cycles = int(round(seconds * TIMESTAMP_CYCLES * TIMESTAMP_OFFSETS))
+    offset = cycles % TIMESTAMP_OFFSETS
+    cycles //= TIMESTAMP_OFFSETS
+    return ((cycles // TIMESTAMP_CYCLES) % 128) << 25 | (cycles % TIMESTAMP_CYCLES) << 12 | offset
+
+
+def _decode_time_code(code):
+    return (code >> 25) + ((code >> 12) & 0x1FFF) / TIMESTAMP_CYCLES + (code & 0xFFF) / (TIMESTAMP_CYCLES * TIMESTAMP_OFFSETS)
+
+
+def _encode_timestamp(shutter_opened, exposure, count):
+    """Profile counter, shutter opened and shutter closed as big-endian 32-bit words, then a reserved word."""
+    return struct.pack(">IIII", count & 0xFFFFFFFF, _time_code(shutter_opened),
+                       _time_code((shutter_opened + exposure) % TIMESTAMP_WRAP), 0)
+
+
+def _device(handle):
+    return _devices.get(handle)
+
+
+def _round_trip():
+    if _settings["call_latency"]:
+        time.sleep(_settings["call_latency"])
+
+
+def _pointer(arg, ctype):
+    """Pointer to what a pyllt argument refers to; accepts pointers, arrays and ct.byref() objects."""
+    target = getattr(arg, "_obj", None)
+    if target is not None:
+        arg = ct.pointer(target)
+    return ct.cast(arg, ct.POINTER(ctype))
+
+
+def create_llt_device(interface_type):
+    with _lock:
+        handle = _next_handle[0]
+        _next_handle[0] += 1
+        device = _Device()
+        device.counter_offset = 1000 * handle
+        _devices[handle] = device
+    return handle
+
+
+def del_device(handle):
+    device = _devices.pop(handle, None)
+    if device is None:
+        return ERROR_GENERAL_POINTER_MISSING
+    device.stop.set()
+    return GENERAL_FUNCTION_OK
+
+
+def get_device_interfaces_fast(handle, interfaces, size):
+    for i, interface in enumerate(INTERFACES[:size]):
+        interfaces[i] = interface
+    return len(INTERFACES)
+
+
+def set_device_interface(handle, interface, additional):
+    _round_trip()
+    _device(handle).interface = interface
+    return GENERAL_FUNCTION_OK
+
+
+def connect(handle):
+    _round_trip()
+    device = _device(handle)
+    if device.interface is None:
+        return ERROR_GENERAL_NOT_CONNECTED
+    device.connected = True
+    return GENERAL_FUNCTION_OK
+
+
+def disconnect(handle):
+    device = _device(handle)
+    device.stop.set()
+    device.connected = False
+    return GENERAL_FUNCTION_OK
+
+
+def get_device_name(handle, device_name, device_name_size, vendor_name, vendor_name_size):
+    device_name.value = b"scanCONTROL 3000-50 (simulated)"
+    vendor_name.value = b"MICRO-EPSILON (simulated)"
+    return GENERAL_FUNCTION_OK
+
+
+def get_llt_type(handle, scanner_type):
+    _pointer(scanner_type, ct.c_int)[0] = TScannerType.scanCONTROL30xx_50
+    return GENERAL_FUNCTION_OK
+
+
+def get_resolutions(handle, resolutions, size):
+    _round_trip()
+    for i, resolution in enumerate(RESOLUTIONS[:size]):
+        resolutions[i] = resolution
+    return len(RESOLUTIONS)
+
+
+def set_resolution(handle, resolution):
+    _round_trip()
+    device = _device(handle)
+    device.resolution = resolution
+    device.partial = TPartialProfile(0, 0, resolution, 16)
+    return GENERAL_FUNCTION_OK
+
+
+def set_profile_config(handle, profile_config):
+    _round_trip()
+    _device(handle).profile_config = profile_config
+    return GENERAL_FUNCTION_OK
+
+
+def set_feature(handle, feature, value):
+    _round_trip()
+    device = _device(handle)
+    if not device.connected:
+        return ERROR_GENERAL_NOT_CONNECTED
+    device.features[feature] = value
+    return GENERAL_FUNCTION_OK
+
+
+def get_feature(handle, feature, value):
+    _pointer(value, ct.c_uint)[0] = _device(handle).features.get(feature, 0)
+    return GENERAL_FUNCTION_OK
+
+
+def set_partial_profile(handle, partial_profile):
+    _round_trip()
+    partial = _pointer(partial_profile, TPartialProfile).contents
+    _device(handle).partial = TPartialProfile(partial.nStartPoint, partial.nStartPointData,
+                                              partial.nPointCount, partial.nPointDataWidth)
+    return GENERAL_FUNCTION_OK
+
+
+def register_callback(handle, callback_type, callback, user_data):
+    _round_trip()
+    device = _device(handle)
+    device.callback = callback
+    device.user_data = user_data
+    return GENERAL_FUNCTION_OK
+
+
+def set_buffer_count(handle, buffer_count):
+    _round_trip()
+    _device(handle).buffer_count = max(int(buffer_count), 1)
+    return GENERAL_FUNCTION_OK
+
+
+def set_hold_buffers_for_polling(handle, hold):
+    _round_trip()
+    _device(handle).hold_buffers = bool(hold)
+    return GENERAL_FUNCTION_OK
+
+
+def get_actual_profile(handle, buffer, buffer_size, profile_config, lost_profiles):
+    """Copy the next buffered transfer (hold mode) or the newest one into buffer; returns its size in bytes."""
+    device = _device(handle)
+    if not device.connected:
+        return ERROR_GENERAL_NOT_CONNECTED
+    with device.poll_lock:
+        if not device.polled:
+            return ERROR_PROFTRANS_NO_NEW_PROFILE
+        if device.hold_buffers:
+            data = device.polled.popleft()
+        else:
+            data = device.polled.pop()
+            device.poll_lost += len(device.polled) * data.shape[0]
+            device.polled.clear()
+        lost, device.poll_lost = device.poll_lost, 0
+    if data.size > buffer_size:
+        return ERROR_PROFTRANS_WRONG_DATA_SIZE
+    ct.memmove(_pointer(buffer, ct.c_ubyte), data.ctypes.data, data.size)
+    if lost_profiles:
+        _pointer(lost_profiles, ct.c_uint)[0] = lost
+    return data.size
+
+
+def set_profile_container_size(handle, width, height):
+    _round_trip()
+    device = _device(handle)
+    if height < 1:
+        return ERROR_TRANSFERPROFILES_WRONG_PROFILE_CONFIG
+    device.container_height = height
+    return GENERAL_FUNCTION_OK
+
+
+def transfer_profiles(handle, transfer_type, enable):
+    device = _device(handle)
+    if not device.connected:
+        return ERROR_GENERAL_NOT_CONNECTED
+    if enable:
+        if device.thread is not None and device.thread.is_alive():
+            return ERROR_GENERAL_DEVICE_BUSY
+        device.transfer_type = transfer_type
+        device.stop.clear()
+        device.thread = threading.Thread(target=device.run, name=f"pyllt-sim-{handle}", daemon=True)
+        device.thread.start()
+    else:
+        device.stop.set()
+        if device.thread is not None:
+            device.thread.join()
+    return GENERAL_FUNCTION_OK
+
+
+def convert_part_profile_2_values(handle, profile, partial_profile, scanner_type, reflection, convert_to_mm,
+                                  width, maximum, threshold, x, z, m0, m1):
+    partial = _pointer(partial_profile, TPartialProfile).contents
+    count = partial.nPointCount
+    width = partial.nPointDataWidth
+    # X and Z are bytes 4-7 of a full 16-byte point
+    x_offset = 4 - partial.nStartPointData
+    if x_offset < 0 or x_offset + 4 > width:
+        return ERROR_TRANSFERPROFILES_WRONG_PROFILE_CONFIG
+    points = np.ctypeslib.as_array(_pointer(profile, ct.c_ubyte), (count * width,)).reshape(count, width)
+    raw_x = points[:, x_offset].astype(np.int64) << 8 | points[:, x_offset + 1]
+    raw_z = points[:, x_offset + 2].astype(np.int64) << 8 | points[:, x_offset + 3]
+    x_out = np.ctypeslib.as_array(x, (count,))
+    z_out = np.ctypeslib.as_array(z, (count,))
+    x_out[:] = (raw_x - 32768) * X_SCALE
+    z_out[:] = (raw_z - 32768) * Z_SCALE + Z_OFFSET
+    invalid = raw_z == 0
+    x_out[invalid] = 0.0
+    z_out[invalid] = 0.0
+    return CONVERT_X | CONVERT_Z
+
+
+def timestamp_2_time_and_count(timestamp, shutter_opened, shutter_closed, profile_count):
+    data = bytes(_pointer(timestamp, ct.c_ubyte * 16).contents)
+    count, opened, closed, _ = struct.unpack(">IIII", data)
+    _pointer(shutter_opened, ct.c_double)[0] = _decode_time_code(opened)
+    _pointer(shutter_closed, ct.c_double)[0] = _decode_time_code(closed)
+    _pointer(profile_count, ct.c_uint)[0] = count
+    return GENERAL_FUNCTION_OK
+
+
+def simulation_stats(handle):
+    """Profiles delivered to and lost before the callback of one simulated device."""
+    device = _device(handle)
+    return {"sent": device.sent, "dropped": device.dropped, "callbacks": device.callbacks, "frequency": device.frequency()}
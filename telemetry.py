@@ -0,0 +1,199 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    """HDR-style histogram of durations with about 3 % resolution from 1 ns to hours.
+
+    Values are counted in ns. Below 2**sub_bits every ns has its own bucket;
+    above, every power of two is split into 2**(sub_bits - 1) linear
+    buckets, so the relative bucket width stays the same at every
+    magnitude and the histogram has a fixed size (~1000 buckets). record()
+    is a few integer operations and a list increment, cheap enough for the
+    profile path; each histogram expects a single writer thread.
+    """
+
+    def __init__(self, sub_bits=5, max_bits=50):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.counts = [0] * ((max_bits - sub_bits + 2) * self.half)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ns = int(seconds * 1e9) if seconds > 0 else 0
+        if ns < self.sub_count:
+            index = ns
+        else:
+            shift = ns.bit_length() - self.sub_bits
+            index = min(shift * self.half + (ns >> shift), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def record_since(self, start):
+        """Record the time since perf_counter() value `start`; returns the current perf_counter() for the next stage."""
+        now = time.perf_counter()
+        self.record(now - start)
+        return now
+
+    def record_many(self, seconds):
+        """Record an array of durations at once."""
+        seconds = np.asarray(seconds, dtype=float)
+        if not len(seconds):
+            return
+        ns = np.maximum(seconds * 1e9, 0).astype(np.int64)
+        # frexp gives the bit length of the integers as exponent
+        shift = np.maximum(np.frexp(ns.astype(float))[1] - self.sub_bits, 0)
+        index = np.where(ns < self.sub_count, ns, shift * self.half + (ns >> shift))
+        index = np.minimum(index, len(self.counts) - 1)
+        for i, n in zip(*np.unique(index, return_counts=True)):
+            self.counts[i] += int(n)
+        self.count += len(seconds)
+        self.total += float(seconds.sum())
+        self.max = max(self.max, float(seconds.max()))
+
+    def bucket_bounds(self):
+        """Lower and upper bound (s) of every bucket."""
+        index = np.arange(len(self.counts))
+        shift = np.maximum(index // self.half - 1, 0)
+        lower = np.where(index < self.sub_count, index, (index - shift * self.half) << shift)
+        upper = np.where(index < self.sub_count, index + 1, (index - shift * self.half + 1) << shift)
+        return lower * 1e-9, upper * 1e-9
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Upper bucket bound (s) at every quantile; NaN while empty."""
+        counts = np.array(self.counts)
+        total = counts.sum()
+        if not total:
+            return {q: np.nan for q in quantiles}
+        cumulative = np.cumsum(counts)
+        _, upper = self.bucket_bounds()
+        result = {}
+        for q in quantiles:
+            result[q] = min(float(upper[np.searchsorted(cumulative, q * total)]), self.max)
+        return result
+
+    def summary(self):
+        return {"count": self.count,
+                "mean_s": self.total / self.count if self.count else np.nan,
+                "max_s": self.max,
+                "quantiles_s": {str(q): value for q, value in self.quantiles().items()}}
+
+
+class Telemetry:
+    """Latency histograms per pipeline stage, counters and gauges, with periodic snapshots.
+
+    `stage(name)` returns the stage's LatencyHistogram, `add(name, n)`
+    counts events such as received profiles, and `gauge(name, function)`
+    registers a value read at snapshot time (ring overruns, queue drops,
+    ...). `snapshot()` returns everything with the rate of every counter
+    since the previous snapshot; `prometheus()` renders the same as
+    Prometheus text and `serve()` publishes it over HTTP on localhost.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.perf_counter()
+        self._last_time = self.started
+        self._last_counters = {}
+        self._rates = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def stage(self, name):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def add(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def snapshot(self):
+        """Stage summaries, counters with their rate per second since the last snapshot, and gauges."""
+        with self._lock:
+            now = time.perf_counter()
+            counters = dict(self.counters)
+            elapsed = now - self._last_time
+            if elapsed > 0:
+                self._rates = {name: (value - self._last_counters.get(name, 0)) / elapsed for name, value in counters.items()}
+                self._last_time = now
+                self._last_counters = counters
+            return {"uptime_s": now - self.started,
+                    "stages": {name: histogram.summary() for name, histogram in list(self.stages.items())},
+                    "counters": counters,
+                    "rates_per_s": dict(self._rates),
+                    "gauges": {name: function() for name, function in self.gauges.items()}}
+
+    def prometheus(self, prefix="scrap_detection"):
+        """The current values in the Prometheus text format; stages as summaries."""
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for name, histogram in list(self.stages.items()):
+            for q, value in histogram.quantiles().items():
+                # Prometheus spells not-a-number NaN
+                value = "NaN" if np.isnan(value) else f"{value:.9g}"
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} {value}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram.total:.9g}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in list(self.counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        lines.append(f"# TYPE {prefix}_gauge gauge")
+        for name, function in list(self.gauges.items()):
+            lines.append(f'{prefix}_gauge{{name="{name}"}} {function()}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve prometheus() at http://host:port/metrics from a daemon thread."""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="telemetry-http", daemon=True).start()
+        return self._server.server_address
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def dump(self, path):
+        """Write a snapshot and the non-empty buckets of every stage to a JSON file."""
+        snapshot = self.snapshot()
+        for name, histogram in list(self.stages.items()):
+            lower, upper = histogram.bucket_bounds()
+            counts = np.array(histogram.counts)
+            filled = np.flatnonzero(counts)
+            snapshot["stages"][name]["buckets"] = [[float(lower[i]), float(upper[i]), int(counts[i])] for i in filled]
+        with open(path, "w") as f:
+            json.dump(snapshot, f, indent=2, default=float)
@@ -0,0 +1,62 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+import pytest
+from device_setup import DeviceBringUp
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_failing_step_undoes_every_device():
+    undone = []
+    bring_up = DeviceBringUp(timeout=2.0)
+
+    def fail(done):
+        time.sleep(0.05)
+        raise CancelledError()  # No message, like a cancelled OPC UA connect
+
+    bring_up.add("sensor", [("connect", lambda done: "device", lambda done: undone.append(("sensor", "connect"))),
+                            ("configure", lambda done: done["connect"] + " configured",
+                             lambda done: undone.append(("sensor", "configure")))])
+    bring_up.add("opc", [("client", lambda done: "client", lambda done: undone.append(("opc", "client"))),
+                         ("connect", fail, lambda done: undone.append(("opc", "failed step is not undone"))),
+                         ("subscribe", lambda done: undone.append(("opc", "never run")))])
+    with pytest.raises(RuntimeError, match=r"opc \(CancelledError\(\)\)"):
+        bring_up.run()
+    assert bring_up.results["sensor"]["configure"] == "device configured"
+    # Every completed step is undone, newest first
+    assert [step for device, step in undone if device == "sensor"] == ["configure", "connect"]
+    assert [step for device, step in undone if device == "opc"] == ["client"]
+    assert "subscribe" not in bring_up.timing["opc"]
+    assert "FAILED: CancelledError()" in bring_up.report()
+
+
+def test_hung_step_is_undone_once_it_returns():
+    release = threading.Event()
+    undone = []
+    bring_up = DeviceBringUp(timeout=0.2)
+    bring_up.add("sensor", [("connect", lambda done: None, lambda done: undone.append("sensor connect"))])
+    bring_up.add("opc", [("client", lambda done: None, lambda done: undone.append("opc client")),
+                         ("connect", lambda done: release.wait(), lambda done: undone.append("opc connect")),
+                         ("subscribe", lambda done: undone.append("never run"))])
+    with pytest.raises(RuntimeError, match=r"opc \(TimeoutError\('connect did not finish within 0.2 s'\)\)"):
+        bring_up.run()
+    # The devices that are not blocked are undone before run() returns
+    assert undone == ["sensor connect"]
+    release.set()
+    assert wait_until(lambda: len(undone) == 3)
+    assert undone[1:] == ["opc connect", "opc client"]
+    assert "subscribe" not in bring_up.timing["opc"]
+
+
+def test_all_steps_succeed():
+    bring_up = DeviceBringUp()
+    bring_up.add("a", [("one", lambda done: 1), ("two", lambda done: done["one"] + 1)])
+    bring_up.add("b", [("one", lambda done: "b")])
+    assert bring_up.run() == {"a": {"one": 1, "two": 2}, "b": {"one": "b"}}
+    assert not bring_up.errors
@@ -0,0 +1,164 @@
+import datetime
+import socket
+import threading
+import time
+import numpy as np
+import pytest
+from opcua import Client, Server, ua
+from motor_position import MotorPositionService, SensorClock, COUNTS_PER_REVOLUTION, POSITION_NODE
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def plc():
+    """Local opcua.Server with the PLC's motor position node, and a client connected to it."""
+    endpoint = f"opc.tcp://127.0.0.1:{free_port()}"
+    server = Server()
+    server.set_endpoint(endpoint)
+    namespace = 0
+    while namespace < 6:
+        namespace = server.register_namespace(f"urn:scrap-detection:test:{namespace}")
+    node_id = ua.NodeId.from_string(POSITION_NODE)
+    position = server.get_objects_node().add_variable(node_id, "Position", 0.0)
+    server.start()
+    client = Client(endpoint)
+    client.connect()
+    yield position, client
+    client.disconnect()
+    server.stop()
+
+
+def wait_for_samples(service, count, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while service.samples < count and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert service.samples >= count
+
+
+def angle_difference(a, b):
+    return (a - b + 180.0) % 360.0 - 180.0
+
+
+def test_positions_are_unwrapped_and_interpolated_across_turns(plc):
+    position, client = plc
+    counts = [110000.0, 118000.0, 2000.0, 10000.0]
+    position.set_value(counts[0])
+    service = MotorPositionService(client)
+    service.start()
+    try:
+        # The synchronous seed read, then the subscription's first notification of the same value
+        wait_for_samples(service, 2)
+        for i, value in enumerate(counts[1:], start=3):
+            time.sleep(0.05)
+            position.set_value(value)
+            wait_for_samples(service, i)
+    finally:
+        service.stop()
+
+    # Sample times are on the server clock
+    times = service.times[service.start_index:service.end_index] + service.clock.offset
+    positions = service.positions[service.start_index:service.end_index]
+    # The wrap from 118000 to 2000 counts is one more turn, not a step back
+    np.testing.assert_array_equal(positions, [110000.0, 110000.0, 118000.0, 122000.0, 130000.0])
+
+    for i in range(1, len(times)):
+        middle = (times[i - 1] + times[i]) / 2
+        expected = ((positions[i - 1] + positions[i]) / 2 % COUNTS_PER_REVOLUTION) / COUNTS_PER_REVOLUTION * 360
+        assert abs(angle_difference(service.position_at(middle), expected)) < 1e-6
+    # Halfway across the turn boundary is 0°, not the 180° a wrapped interpolation would give
+    assert abs(angle_difference(service.position_at((times[2] + times[3]) / 2), 0.0)) < 1e-6
+    assert service.position_at(times[0] - 1.0) == pytest.approx(110000.0 / COUNTS_PER_REVOLUTION * 360)
+
+
+def test_extrapolates_to_profile_times_from_the_sensor_clock(plc):
+    position, client = plc
+    revolutions_per_second = 0.5
+    stop = threading.Event()
+    start = time.perf_counter()
+
+    def rotate():
+        while not stop.is_set():
+            elapsed = time.perf_counter() - start
+            position.set_value((elapsed * revolutions_per_second * COUNTS_PER_REVOLUTION) % COUNTS_PER_REVOLUTION)
+            time.sleep(0.002)
+
+    service = MotorPositionService(client, max_extrapolation=0.02)
+    service.start()
+    thread = threading.Thread(target=rotate, daemon=True)
+    thread.start()
+    try:
+        time.sleep(0.5)
+    finally:
+        stop.set()
+        thread.join()
+        service.stop()
+    assert service.samples > 10
+
+    # A sensor whose clock started 127.95 s before the last sample and wraps every 128 s, so it wraps right here;
+    # profiles arrive 1 ms after the shutter
+    clock = SensorClock()
+    last_time = service.times[service.end_index - 1] + service.clock.offset
+    sensor_epoch = last_time - 127.95
+    for k in range(20):
+        shutter_host = last_time - 0.1 + k * 0.005
+        clock.update((shutter_host - sensor_epoch) % 128.0, shutter_host + 0.001)
+    assert clock.offset == pytest.approx(sensor_epoch + 0.001)
+
+    latest = service.latest()
+    # The profile's shutter is 10 ms after the last motor sample
+    host_time = clock.update((last_time + 0.01 - sensor_epoch) % 128.0, last_time + 0.011)
+    assert host_time == pytest.approx(last_time + 0.011)
+    degrees_per_second = revolutions_per_second * 360
+    ahead = angle_difference(service.position_at(host_time), latest)
+    assert ahead == pytest.approx(0.011 * degrees_per_second, rel=0.3)
+    # Beyond max_extrapolation the position is held at the limit
+    far = angle_difference(service.position_at(last_time + 1.0), latest)
+    assert far == pytest.approx(0.02 * degrees_per_second, rel=0.3)
+
+
+def test_cached_angle_is_as_accurate_as_polling(plc):
+    position, client = plc
+    revolutions_per_second = 0.5
+    stop = threading.Event()
+    start = time.perf_counter()
+    plc_epoch = datetime.datetime(2024, 1, 1)
+
+    def counts(host_time):
+        return ((host_time - start) * revolutions_per_second * COUNTS_PER_REVOLUTION) % COUNTS_PER_REVOLUTION
+
+    def rotate():
+        # Like the PLC, every value is stamped with the time it was sampled
+        while not stop.is_set():
+            now = time.perf_counter()
+            value = ua.DataValue(ua.Variant(counts(now), ua.VariantType.Double))
+            value.SourceTimestamp = plc_epoch + datetime.timedelta(seconds=now - start)
+            position.set_value(value)
+            time.sleep(0.002)
+
+    thread = threading.Thread(target=rotate, daemon=True)
+    thread.start()
+    service = MotorPositionService(client, period_ms=2)
+    service.start()
+    try:
+        time.sleep(0.3)
+        node = client.get_node(POSITION_NODE)
+        poll_times = np.empty(200)
+        polling_errors = np.empty(200)
+        for i in range(len(poll_times)):
+            poll_times[i] = time.perf_counter()
+            polled = node.get_value()
+            polling_errors[i] = abs(angle_difference(polled / COUNTS_PER_REVOLUTION * 360,
+                                                     counts(poll_times[i]) / COUNTS_PER_REVOLUTION * 360))
+        time.sleep(0.1)  # Every poll time is inside the history now
+        cached_errors = np.array([abs(angle_difference(service.position_at(t), counts(t) / COUNTS_PER_REVOLUTION * 360))
+                                  for t in poll_times])
+    finally:
+        stop.set()
+        thread.join()
+        service.stop()
+    assert cached_errors.mean() <= polling_errors.mean()
@@ -0,0 +1,145 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from profile_bus import BusReader, ProfileBus
+
+
+@pytest.fixture
+def name():
+    return f"test-bus-{os.getpid()}"
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_bus_refuses_a_segment_of_a_running_producer(name):
+    bus = ProfileBus(name, 2, 16, slots=8)
+    try:
+        with pytest.raises(FileExistsError):
+            ProfileBus(name, 2, 16, slots=8)
+        # The running producer's segment is still there
+        reader = BusReader(name, timeout=0.5)
+        reader.close()
+    finally:
+        bus.close()
+
+
+def test_bus_replaces_a_segment_of_a_dead_producer(name):
+    stale = ProfileBus(name, 2, 16, slots=8)
+    stale.header[7] = dead_pid()  # H_PRODUCER, as if the producer had been killed
+    bus = ProfileBus(name, 2, 32, slots=8)
+    try:
+        assert BusReader(name, timeout=0.5).points == 32
+    finally:
+        bus.close()
+        stale._segment.close()
+
+
+def test_reader_takes_over_slots_of_dead_readers(name):
+    bus = ProfileBus(name, 2, 16, slots=8, consumers=2)
+    try:
+        bus._arrays["pid"][:] = dead_pid(), os.getppid()
+        reader = BusReader(name, timeout=0.5)
+        assert reader.consumer == 0
+        # Slot 1 belongs to a running process, fixed or not
+        with pytest.raises(ValueError):
+            BusReader(name, consumer=1, timeout=0.5)
+        reader.close()
+        bus._arrays["pid"][0] = dead_pid()
+        with pytest.raises(ValueError):
+            BusReader(name, consumer=1, timeout=0.5)
+        assert BusReader(name, timeout=0.5).consumer == 0
+    finally:
+        bus.close()
+
+
+
+def frames(first, count, sensors=2, points=4):
+    """Blocks for publish() whose x is the frame number everywhere."""
+    x = np.repeat(np.arange(first, first + count, dtype=float)[np.newaxis, :, np.newaxis], sensors, axis=0)
+    x = np.broadcast_to(x, (sensors, count, points)).copy()
+    valid = np.ones(x.shape, dtype=bool)
+    return x, -x, valid, np.arange(first, first + count) * 0.5
+
+
+def test_read_returns_frames_in_order_and_stops_at_the_end_of_the_ring(name):
+    bus = ProfileBus(name, 2, 4, slots=8)
+    try:
+        reader = BusReader(name, timeout=0.5)
+        bus.publish(*frames(0, 6))
+        seqs, angles, x, z, valid = reader.read()
+        np.testing.assert_array_equal(seqs, np.arange(6))
+        np.testing.assert_array_equal(angles, np.arange(6) * 0.5)
+        assert x.shape == (6, 2, 4) and (x[:, 1, 2] == np.arange(6)).all() and (z == -x).all() and valid.all()
+        assert reader.read() is None
+
+        # Frames 6 to 9 wrap around the end of the ring, so they come in two blocks
+        bus.publish(*frames(6, 4))
+        np.testing.assert_array_equal(reader.read()[0], [6, 7])
+        np.testing.assert_array_equal(reader.read()[0], [8, 9])
+        assert reader.lag() == 0 and reader.dropped == 0
+        reader.close()
+    finally:
+        bus.close()
+
+
+def test_max_frames_limits_a_block(name):
+    bus = ProfileBus(name, 2, 4, slots=8)
+    try:
+        reader = BusReader(name, timeout=0.5)
+        bus.publish(*frames(0, 5))
+        np.testing.assert_array_equal(reader.read(max_frames=2)[0], [0, 1])
+        np.testing.assert_array_equal(reader.read(max_frames=2)[0], [2, 3])
+        np.testing.assert_array_equal(reader.read(max_frames=2)[0], [4])
+        reader.close()
+    finally:
+        bus.close()
+
+
+def test_reader_more_than_a_ring_behind_drops_frames(name):
+    bus = ProfileBus(name, 2, 4, slots=8)
+    try:
+        reader = BusReader(name, timeout=0.5)
+        bus.publish(*frames(0, 5))
+        bus.publish(*frames(5, 7))
+        # 12 frames published into 8 slots: frames 0 to 3 are gone
+        seqs = np.concatenate([reader.read()[0], reader.read()[0]])
+        np.testing.assert_array_equal(seqs, np.arange(4, 12))
+        assert reader.dropped == 4
+        assert bus.consumers()[0]["dropped"] == 4
+        reader.close()
+    finally:
+        bus.close()
+
+
+def test_lapped_counts_frames_overwritten_while_in_use(name):
+    bus = ProfileBus(name, 2, 4, slots=8)
+    try:
+        reader = BusReader(name, timeout=0.5)
+        bus.publish(*frames(0, 6))
+        seqs, _, x, _, _ = reader.read()
+        assert reader.lapped(seqs) == 0
+        bus.publish(*frames(6, 5))  # Frames 8 to 10 reuse the slots of frames 0 to 2
+        assert reader.lapped(seqs) == 3
+        assert x[0, 0, 0] == 8.0  # The views show the new frames
+        reader.close()
+    finally:
+        bus.close()
+
+
+def test_new_reader_starts_at_the_newest_frame(name):
+    bus = ProfileBus(name, 2, 4, slots=8)
+    try:
+        bus.publish(*frames(0, 3))
+        reader = BusReader(name, timeout=0.5)
+        assert reader.read() is None
+        bus.publish(*frames(3, 1))
+        np.testing.assert_array_equal(reader.read()[0], [3])
+        reader.close()
+    finally:
+        bus.close()
@@ -0,0 +1,113 @@
+import ctypes as ct
+import threading
+import time
+import numpy as np
+import pyllt as llt
+import profile_decoder
+from profile_decoder import ProfileDecoder, convert_with_library, decoder_for, START_DATA, DATA_WIDTH
+from recording import ProfileRecorder, open_recording
+
+
+def open_device(resolution=256):
+    device = llt.create_llt_device(llt.TInterfaceType.INTF_TYPE_ETHERNET)
+    assert llt.set_device_interface(device, llt.INTERFACES[0], 0) >= 1
+    assert llt.connect(device) >= 1
+    assert llt.set_resolution(device, resolution) >= 1
+    scanner_type = ct.c_int(0)
+    llt.get_llt_type(device, ct.byref(scanner_type))
+    llt.set_profile_config(device, llt.TProfileConfig.PARTIAL_PROFILE)
+    llt.set_partial_profile(device, ct.byref(llt.TPartialProfile(0, START_DATA, resolution, DATA_WIDTH)))
+    return device, scanner_type
+
+
+def record_profiles(device, path, resolution, count):
+    """Poll `count` profiles from the running device into a recording."""
+    recorder = ProfileRecorder(path, resolution * DATA_WIDTH)
+    buffer = np.zeros(resolution * DATA_WIDTH, dtype=np.uint8)
+    lost = ct.c_uint(0)
+    llt.set_buffer_count(device, count)
+    llt.set_hold_buffers_for_polling(device, 1)
+    llt.transfer_profiles(device, llt.TTransferProfileType.NORMAL_TRANSFER, 1)
+    deadline = time.perf_counter() + 10.0
+    try:
+        while recorder.records < count and time.perf_counter() < deadline:
+            ret = llt.get_actual_profile(device, buffer.ctypes.data_as(ct.POINTER(ct.c_ubyte)), len(buffer),
+                                         llt.TProfileConfig.PARTIAL_PROFILE, ct.byref(lost))
+            if ret == llt.ERROR_PROFTRANS_NO_NEW_PROFILE:
+                time.sleep(0.001)
+                continue
+            assert ret == len(buffer)
+            recorder.append(0, buffer, time.perf_counter(), 0.0, 0, 0.0)
+    finally:
+        llt.transfer_profiles(device, llt.TTransferProfileType.NORMAL_TRANSFER, 0)
+        recorder.close()
+    return open_recording(path)["raw"]
+
+
+def test_decoder_matches_library_on_recorded_profiles(tmp_path, monkeypatch):
+    monkeypatch.setitem(llt._settings, "frequency", 2000.0)
+    resolution = 256
+    device, scanner_type = open_device(resolution)
+    try:
+        decoder = ProfileDecoder.from_library(llt, device, scanner_type, resolution)
+        raw = record_profiles(device, str(tmp_path / "profiles.rec"), resolution, 64)
+        assert len(raw) == 64
+
+        x_block, z_block = decoder.decode(raw)
+        profile_struct = llt.TPartialProfile(0, START_DATA, resolution, DATA_WIDTH)
+        x = np.empty(resolution)
+        z = np.empty(resolution)
+        for k in range(len(raw)):
+            convert_with_library(llt, device, profile_struct, scanner_type, np.ascontiguousarray(raw[k]), x, z)
+            # Bit for bit, including the points the library reports as invalid (0)
+            np.testing.assert_array_equal(x_block[k].view(np.uint64), x.view(np.uint64))
+            np.testing.assert_array_equal(z_block[k].view(np.uint64), z.view(np.uint64))
+        assert (z_block == 0.0).any()
+        assert decoder.verify(llt, device, scanner_type, raw) == 0
+    finally:
+        llt.disconnect(device)
+        llt.del_device(device)
+
+
+def test_decoder_for_falls_back_when_the_probe_fails(monkeypatch, capsys):
+    monkeypatch.setattr(profile_decoder, "_decoder_cache", {})
+    monkeypatch.setattr(llt, "convert_part_profile_2_values", lambda *args: 0)
+    device, scanner_type = open_device()
+    try:
+        assert decoder_for(llt, device, scanner_type, 256) is None
+    finally:
+        llt.disconnect(device)
+        llt.del_device(device)
+    assert "library conversion" in capsys.readouterr().out
+
+
+def test_decoder_for_captures_the_tables_once_for_parallel_heads(monkeypatch):
+    monkeypatch.setattr(profile_decoder, "_decoder_cache", {})
+    calls = []
+    from_library = ProfileDecoder.from_library
+
+    def slow_from_library(*args):
+        calls.append(args)
+        time.sleep(0.05)  # Long enough for every thread to get to the cache check
+        return from_library(*args)
+
+    monkeypatch.setattr(ProfileDecoder, "from_library", slow_from_library)
+    devices = [open_device() for _ in range(4)]
+    results = [None] * len(devices)
+
+    def bring_up(i):
+        device, scanner_type = devices[i]
+        results[i] = decoder_for(llt, device, scanner_type, 256)
+
+    threads = [threading.Thread(target=bring_up, args=(i,)) for i in range(len(devices))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for device, _ in devices:
+            llt.disconnect(device)
+            llt.del_device(device)
+    assert len(calls) == 1
+    assert results[0] is not None and all(result is results[0] for result in results)
@@ -0,0 +1,95 @@
+import profile_pairing
+from profile_pairing import ProfilePairer
+
+
+class SlowClock:
+    """perf_counter() that advances a second per call, like a replay stalled between every profile."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+def feed(pairer, order):
+    """Add profiles at 500 Hz in the given order of (sensor, index); return the pairs."""
+    pairs = []
+    for sensor, k in order:
+        pair = pairer.add(sensor, k, 10.0 + k * 0.002 + sensor * 1e-6, 1000 * (sensor + 1) + k)
+        if pair is not None:
+            pairs.append(pair)
+    return pairs
+
+
+def test_shutter_age_pairs_the_same_however_slow_the_host(monkeypatch):
+    monkeypatch.setattr(profile_pairing.time, "perf_counter", SlowClock())
+    # The bottom head runs 5 profiles behind the top one
+    order = [(0, k) for k in range(5)] + [item for k in range(5, 100) for item in ((0, k), (1, k - 5))]
+    order += [(1, k) for k in range(95, 100)]
+
+    pairs = feed(ProfilePairer(shutter_age=True), order)
+    assert pairs == [(k, k) for k in range(100)]
+
+    # On host time every profile is older than max_age by the time its partner arrives
+    assert feed(ProfilePairer(), order) == []
+
+
+def test_shutter_age_expires_on_the_shutter_clock():
+    pairer = ProfilePairer(max_age=0.05, shutter_age=True)
+    # 30 top profiles (58 ms) without a bottom one: the oldest fall out of the 50 ms window
+    feed(pairer, [(0, k) for k in range(30)])
+    assert pairer.dropped[0] == 4
+    assert feed(pairer, [(1, 29)]) == [(29, 29)]
+
+
+class StepClock:
+    """perf_counter() that only moves when the test advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def feed_heads(pairer, order, start=10.0, period=0.002):
+    """Add profiles of several heads in the given order of (head, index); return the frames."""
+    frames = []
+    for head, k in order:
+        shutter_time = (start + k * period + head * 1e-6) % 128.0
+        frame = pairer.add(head, k, shutter_time, 1000 * (head + 1) + k)
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+
+def test_heads_missing_a_profile_drop_the_others_of_that_cycle():
+    pairer = ProfilePairer(sensors=3)
+    # Head 1 loses profile 5
+    order = [(head, k) for k in range(10) for head in range(3) if (head, k) != (1, 5)]
+    frames = feed_heads(pairer, order)
+    assert frames == [(k, k, k) for k in range(10) if k != 5]
+    assert pairer.dropped == [1, 0, 1]
+    assert pairer.stats()["dropped"] == [1, 0, 1]
+    assert [pairer.settled(head) for head in range(3)] == [9, 9, 9]
+
+
+def test_heads_match_across_the_shutter_clock_wrap():
+    pairer = ProfilePairer(sensors=3)
+    # The shutter clock wraps at 128 s after the 5th cycle
+    order = [(head, k) for k in range(10) for head in (2, 0, 1)]
+    assert feed_heads(pairer, order, start=127.991) == [(k, k, k) for k in range(10)]
+    assert pairer.dropped == [0, 0, 0]
+
+
+def test_heads_waiting_longer_than_max_age_are_dropped(monkeypatch):
+    clock = StepClock()
+    monkeypatch.setattr(profile_pairing.time, "perf_counter", clock)
+    pairer = ProfilePairer(sensors=3, max_age=0.5)
+    feed_heads(pairer, [(0, 0), (1, 0)])
+    clock.now = 0.6
+    # Profile 0 of heads 0 and 1 expires while head 2 is stalled, so its late profile 0 finds no partners
+    assert feed_heads(pairer, [(0, 1), (1, 1), (2, 0), (2, 1)]) == [(1, 1, 1)]
+    assert pairer.dropped == [1, 1, 1]
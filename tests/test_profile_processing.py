@@ -0,0 +1,47 @@
+import numpy as np
+from profile_processing import FilterTransformKernel, TrigTable, filter_laser_data, transform_coordinates_from_center
+
+
+def test_kernel_matches_the_reference_functions():
+    rng = np.random.default_rng(1)
+    count, points, radius = 21, 64, 25.0
+    blocks = [rng.normal(size=(count, points)) for _ in range(4)]
+    for block in blocks:
+        block[rng.random(block.shape) < 0.2] = 0.0
+    blocks[1][:, :3] = 0.0
+    blocks[3][5] = 0.0  # A profile without valid points
+    trig_table = TrigTable(3600)
+    angles = rng.integers(0, 3600, count) / 10.0
+
+    kernel = FilterTransformKernel(points, radius, trig_table, chunk=8)
+    x_out, z_out, valid = kernel.process(*blocks, angles)
+
+    for sensor in (0, 1):
+        x_block, z_block = blocks[2 * sensor], blocks[2 * sensor + 1]
+        for k in range(count):
+            x, z = filter_laser_data(x_block[k], z_block[k])
+            assert np.array_equal(valid[sensor, k], (x_block[k] != 0.0) & (z_block[k] != 0.0))
+            if not len(x):
+                continue
+            cos, sin = trig_table.lookup(angles[k])
+            # The reference with the table's cos/sin, in the same order of operations
+            x_shifted, z_shifted = x - x[0], z - z[0]
+            x_expected = x_shifted * cos - z_shifted * sin + radius * cos
+            z_expected = x_shifted * sin + z_shifted * cos + radius * sin
+            np.testing.assert_array_equal(x_out[sensor, k][valid[sensor, k]], x_expected)
+            np.testing.assert_array_equal(z_out[sensor, k][valid[sensor, k]], z_expected)
+            x_reference, z_reference = transform_coordinates_from_center(x, z, angles[k], radius)
+            np.testing.assert_allclose(x_out[sensor, k][valid[sensor, k]], x_reference, atol=1e-9)
+            np.testing.assert_allclose(z_out[sensor, k][valid[sensor, k]], z_reference, atol=1e-9)
+
+
+def test_trig_table_index_matches_lookup():
+    trig_table = TrigTable(120000)
+    angles = np.array([-725.3, -0.001, 0.0, 0.0015, 179.9999, 359.9999, 720.5])
+    index = trig_table.index(angles, np.empty(len(angles), dtype=np.intp), np.empty(len(angles)))
+    cos, sin = trig_table.lookup(angles)
+    assert np.array_equal(trig_table.cos[index], cos)
+    assert np.array_equal(trig_table.sin[index], sin)
+    radius_cos, radius_sin = trig_table.scaled(25.0)
+    assert trig_table.scaled(25.0)[0] is radius_cos
+    assert np.array_equal(radius_sin[index], 25.0 * sin)
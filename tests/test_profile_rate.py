@@ -0,0 +1,119 @@
+import pytest
+from profile_rate import FrequencyTuner, ProfileGapDetector, decode_time_code, encode_time_code
+
+
+def test_time_codes_round_trip():
+    assert encode_time_code(120) == 12
+    assert encode_time_code(4505) == 0x5000 + 450
+    for microseconds in range(40960):
+        assert decode_time_code(encode_time_code(microseconds)) == microseconds
+
+
+def test_gap_detection_across_the_counter_wrap():
+    detector = ProfileGapDetector()
+    assert [detector.update(counter) for counter in (2 ** 32 - 2, 2 ** 32 - 1, 0, 1)] == [0, 0, 0, 0]
+    assert detector.lost == 0
+    # 2**32 - 1 and 0 to 2 are missing
+    detector = ProfileGapDetector()
+    detector.update(2 ** 32 - 2)
+    assert detector.update(3) == 4
+    assert detector.update(10) == 6
+    assert detector.stats() == {"received": 3, "lost": 10, "gaps": 2, "largest_gap": 6, "resets": 0}
+
+
+def test_counter_going_back_is_a_reset_not_loss():
+    detector = ProfileGapDetector()
+    for counter in (1000, 1001, 5, 6):
+        assert detector.update(counter) == 0
+    assert detector.stats() == {"received": 4, "lost": 0, "gaps": 0, "largest_gap": 0, "resets": 1}
+
+
+class SlowHost:
+    """Loses one profile every tick while the profile period is shorter than `min_period_us`."""
+
+    def __init__(self, exposure_us, min_period_us):
+        self.exposure_us = exposure_us
+        self.min_period_us = min_period_us
+        self.idle_us = None
+        self.lost = 0
+
+    def apply(self, idle_us):
+        self.idle_us = idle_us
+
+    def tick(self):
+        if self.exposure_us + self.idle_us < self.min_period_us:
+            self.lost += 1
+        return self.lost
+
+
+def run_tuner(tuner, host, seconds, tick=0.1, start=0.0):
+    now = start
+    while now < start + seconds:
+        tuner.update(host.tick(), now)
+        now += tick
+    return now
+
+
+def make_tuner(host, idle_us=4500, **kwargs):
+    host.idle_us = idle_us
+    return FrequencyTuner(host.apply, host.exposure_us, idle_us, log=lambda message: None, **kwargs)
+
+
+def test_tuner_steps_bisects_and_locks_above_the_threshold():
+    host = SlowHost(120, 700)
+    tuner = make_tuner(host)
+    run_tuner(tuner, host, 120.0)
+    assert tuner.locked
+    assert 700 <= tuner.good_period <= 700 + tuner.resolution_us
+    assert tuner.bad_period < 700
+    assert host.idle_us == tuner.idle_us == round(tuner.good_period * 1.05) - 120
+    reasons = [decision["reason"] for decision in tuner.decisions]
+    assert reasons[0] == "no loss, shorter period"
+    assert any("bisecting" in reason for reason in reasons)
+    assert "locked" in reasons[-1]
+    # Locked, nothing changes any more
+    decisions = len(tuner.decisions)
+    run_tuner(tuner, host, 30.0, start=120.0)
+    assert len(tuner.decisions) == decisions
+
+
+def test_loss_while_locked_searches_again():
+    host = SlowHost(120, 700)
+    tuner = make_tuner(host)
+    now = run_tuner(tuner, host, 120.0)
+    assert tuner.locked
+    host.min_period_us = 1500  # The host got slower
+    run_tuner(tuner, host, 120.0, start=now)
+    assert tuner.locked
+    assert 1500 <= tuner.good_period <= 1500 + tuner.resolution_us
+    assert host.exposure_us + host.idle_us >= 1500
+
+
+def test_loss_at_settle_time_is_ignored():
+    host = SlowHost(120, 0)
+    tuner = make_tuner(host, settle=0.5, window=2.0)
+    tuner.update(100, 0.0)  # Everything lost before the window starts is the baseline
+    tuner.update(150, 0.4)
+    tuner.update(150, 0.6)
+    assert not tuner.decisions
+    tuner.update(150, 2.6)
+    assert tuner.decisions[-1]["reason"] == "no loss, shorter period"
+
+
+def test_tuner_locks_at_the_minimum_idle_time_without_loss():
+    host = SlowHost(120, 0)
+    tuner = make_tuner(host, min_idle_us=100)
+    run_tuner(tuner, host, 120.0)
+    assert tuner.locked
+    assert tuner.good_period == 220
+    assert tuner.decisions[-1]["reason"].startswith("no loss at the minimum idle time")
+
+
+def test_loss_at_the_maximum_idle_time_is_logged_once():
+    host = SlowHost(120, 10 ** 6)
+    tuner = make_tuner(host, idle_us=40000, max_idle_us=40950)
+    run_tuner(tuner, host, 60.0)
+    assert not tuner.locked and host.idle_us == 40950
+    reasons = [decision["reason"] for decision in tuner.decisions]
+    assert reasons.count("loss even at the maximum idle time, kept") == 1
+    assert tuner.frequency() == pytest.approx(1e6 / (120 + 40950))
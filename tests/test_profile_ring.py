@@ -0,0 +1,36 @@
+import numpy as np
+from profile_ring import ProfileRing
+
+
+def container(first, count, slot_size):
+    """`count` profiles back to back, profile k filled with the byte first + k."""
+    return np.repeat(np.arange(first, first + count, dtype=np.uint8), slot_size)
+
+
+def test_container_is_split_into_slots_across_the_end_of_the_ring():
+    ring = ProfileRing(8, slots=6)
+    data = container(1, 4, 8)
+    assert ring.push(data.ctypes.data, data.nbytes)
+    ring.release(3)
+    data = container(5, 4, 8)
+    assert ring.push(data.ctypes.data, data.nbytes)
+    assert ring.write_seq == 8
+    assert [int(ring.view(seq)[0]) for seq in range(4, 8)] == [5, 6, 7, 8]
+    assert (ring.sizes == 8).all()
+
+
+def test_container_with_a_partial_profile_is_rejected_and_counted():
+    ring = ProfileRing(8, slots=6)
+    data = container(1, 3, 8)
+    assert not ring.push(data.ctypes.data, data.nbytes - 3)
+    assert ring.write_seq == 0
+    assert ring.stats()["invalid_transfers"] == 1
+    assert ring.overruns == 0
+
+
+def test_container_that_does_not_fit_is_an_overrun():
+    ring = ProfileRing(8, slots=4)
+    data = container(1, 3, 8)
+    assert ring.push(data.ctypes.data, data.nbytes)
+    assert not ring.push(data.ctypes.data, data.nbytes)
+    assert ring.overruns == 3 and ring.write_seq == 3
@@ -0,0 +1,40 @@
+import numpy as np
+from point_store import PointStore
+from reference_compare import ReferencePart, save_reference
+
+
+def rotation(rng, sensor, profiles=60, points=256, radius=25.0):
+    store = PointStore()
+    section = np.linspace(0.0, 2 * np.pi, points, endpoint=False)
+    for k in range(profiles):
+        angle = k * 360.0 / profiles
+        r = radius + rng.normal(0.0, 0.02, points)
+        theta = section + np.radians(angle)
+        store.append(r * np.cos(theta), r * np.sin(theta), angle, k, sensor)
+    return store.points().copy()
+
+
+def test_cached_index_matches_the_built_one(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "reference.npz")
+    save_reference(path, [rotation(rng, 0), rotation(rng, 1)])
+    built = ReferencePart(path, cell=0.1)
+    cached = ReferencePart(path, cell=0.1)
+    assert not built.loaded_from_cache and cached.loaded_from_cache
+
+    # Plain arrays only, nothing to unpickle
+    with np.load(built.cache_path, allow_pickle=False) as arrays:
+        assert int(arrays["sensors"]) == 2
+
+    x, z = rng.uniform(-30.0, 30.0, (2, 1000))
+    for sensor in (0, 1):
+        np.testing.assert_array_equal(cached.deviation(sensor, x, z), built.deviation(sensor, x, z))
+        np.testing.assert_array_equal(cached.deviation(sensor, x, z, exact=True), built.deviation(sensor, x, z, exact=True))
+
+
+def test_cache_is_rebuilt_when_the_parameters_change(tmp_path):
+    path = str(tmp_path / "reference.npz")
+    save_reference(path, [rotation(np.random.default_rng(1), 0)])
+    ReferencePart(path, cell=0.1)
+    assert not ReferencePart(path, cell=0.2).loaded_from_cache
+    assert ReferencePart(path, cell=0.2).loaded_from_cache
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from rotation_stats import RadiusStats
+
+
+def test_streaming_stats_match_the_batch_results():
+    rng = np.random.default_rng(0)
+    stats = RadiusStats(angle_bins=36)
+    radii, angles = [], []
+    for k in range(500):
+        points = rng.integers(0, 300)  # Some profiles have no valid points
+        angle = k * 360.0 / 500
+        radius = 25.0 + rng.normal(0.0, 0.1, points)
+        theta = rng.uniform(0.0, 2 * np.pi, points)
+        x, z = radius * np.cos(theta), radius * np.sin(theta)
+        stats.update(x, z, angle)
+        radii.append(np.sqrt(x**2 + z**2))
+        angles.append(np.full(points, angle))
+    radii, angles = np.concatenate(radii), np.concatenate(angles)
+    result = stats.finalize()
+
+    assert result["count"] == len(radii)
+    assert result["mean"] == pytest.approx(np.mean(radii), rel=1e-14)
+    assert result["std"] == pytest.approx(np.std(radii), rel=1e-12)
+    assert result["min"] == radii.min() and result["max"] == radii.max()
+    bins = (angles * 36 / 360.0).astype(np.intp) % 36
+    for b in range(36):
+        in_bin = radii[bins == b]
+        assert result["bin_count"][b] == len(in_bin)
+        assert result["bin_mean"][b] == pytest.approx(np.mean(in_bin), rel=1e-14)
+        assert result["bin_std"][b] == pytest.approx(np.std(in_bin), rel=1e-12)
+        assert result["bin_min"][b] == in_bin.min() and result["bin_max"][b] == in_bin.max()
+
+
+def test_empty_rotation():
+    stats = RadiusStats(angle_bins=4)
+    stats.update(np.zeros(0), np.zeros(0), 10.0)
+    result = stats.finalize()
+    assert result["count"] == 0 and np.isnan(result["mean"]) and np.isnan(result["std"])
+    assert np.isnan(result["bin_mean"]).all()
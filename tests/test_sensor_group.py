@@ -0,0 +1,31 @@
+import numpy as np
+import pyllt as llt
+import sensor_group
+from sensor_group import SensorGroup
+
+
+def first_frames(group, count=32):
+    group.connect()
+    group.start()
+    try:
+        frames = 0
+        for block in group.frames():
+            if block is not None:
+                frames += len(block[0])
+                if frames >= count:
+                    return block
+    finally:
+        group.stop()
+        group.close()
+
+
+def test_group_converts_with_the_library_without_decoder(monkeypatch):
+    monkeypatch.setattr(sensor_group, "decoder_for", lambda *args: None)
+    config = {"sensors": [{"name": "top", "interface": "192.168.0.4"},
+                          {"name": "bottom", "interface": "192.168.0.5", "pose": {"angle_deg": 180}}]}
+    group = SensorGroup(config, llt)
+    shutter_times, heads = first_frames(group)
+    assert all(sensor.decoder is None for sensor in group.sensors)
+    for x, z, valid in heads:
+        assert x.shape == (len(shutter_times), group.sensors[0].resolution)
+        assert valid.any() and np.all(z[valid] != 0.0)